@@ -0,0 +1,256 @@
+"""
+Admission control for the agent's POST routes
+A request is admitted when the global, per-route and per-user concurrency
+caps all have room; otherwise it waits in a bounded FIFO queue for at most
+ADMISSION_QUEUE_TIMEOUT. When the queue (or the user's share of it) is
+full, or the deadline passes, it gets a 429 with Retry-After right away
+instead of piling more Groq and tool calls onto an overloaded process.
+"""
+
+import asyncio
+import json
+import math
+import os
+import time
+from collections import Counter, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from fastapi.responses import JSONResponse
+
+from metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_WAIT, ADMISSION_REJECTED
+from shared_state import WORKERS
+from structured_logging import get_logger
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Global and per-route caps are totals, split evenly across WORKERS processes
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+# e.g. "/agent/workflow=16,/agent/generate-code=4"; routes not listed are only bound by the global cap
+ADMISSION_ROUTE_LIMITS = os.getenv("ADMISSION_ROUTE_LIMITS", "/agent/workflow=16,/agent/workflow/stream=16,/agent/generate-code=8")
+ADMISSION_USER_CONCURRENCY = int(os.getenv("ADMISSION_USER_CONCURRENCY", "4"))  # per worker process
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+ADMISSION_USER_QUEUE_SIZE = int(os.getenv("ADMISSION_USER_QUEUE_SIZE", "8"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "15"))  # seconds a request may wait
+
+MAX_RETRY_AFTER = 60
+MAX_BODY_BYTES = 1024 * 1024  # larger bodies are not parsed for a user key
+
+log = get_logger("admission")
+
+
+def parse_route_limits(spec: str) -> Dict[str, int]:
+    limits = {}
+    for item in spec.split(","):
+        if "=" in item:
+            route, limit = item.split("=", 1)
+            limits[route.strip()] = int(limit)
+    return limits
+
+
+def per_worker(limit: int) -> int:
+    return max(1, math.ceil(limit / max(1, WORKERS)))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class Waiter:
+    route: str
+    user: str
+    future: asyncio.Future = field(repr=False)
+
+
+class AdmissionController:
+    """Global, per-route and per-user concurrency caps in front of a bounded FIFO queue"""
+
+    def __init__(
+        self,
+        max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+        route_limits: Optional[Dict[str, int]] = None,
+        user_concurrency: int = ADMISSION_USER_CONCURRENCY,
+        queue_size: int = ADMISSION_QUEUE_SIZE,
+        user_queue_size: int = ADMISSION_USER_QUEUE_SIZE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT
+    ):
+        self.max_concurrency = max_concurrency
+        self.route_limits = route_limits if route_limits is not None else {}
+        self.user_concurrency = user_concurrency
+        self.queue_size = queue_size
+        self.user_queue_size = user_queue_size
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.active_routes: Counter = Counter()
+        self.active_users: Counter = Counter()
+        self.queued_users: Counter = Counter()
+        self.waiters: deque = deque()
+        self.hold_seconds = 1.0  # moving average of how long a slot is held, for Retry-After
+
+    def _fits(self, route: str, user: str) -> bool:
+        return (
+            self.active < self.max_concurrency
+            and self.active_routes[route] < self.route_limits.get(route, self.max_concurrency)
+            and self.active_users[user] < self.user_concurrency
+        )
+
+    def _take(self, route: str, user: str):
+        self.active += 1
+        self.active_routes[route] += 1
+        self.active_users[user] += 1
+
+    def _dequeue(self, waiter: Waiter):
+        self.waiters.remove(waiter)
+        self.queued_users[waiter.user] -= 1
+        if not self.queued_users[waiter.user]:
+            del self.queued_users[waiter.user]
+        ADMISSION_QUEUE_DEPTH.labels(route=waiter.route).dec()
+
+    def _dispatch(self):
+        """Admit queued requests in order, skipping ones whose route or user is still at its cap"""
+        for waiter in list(self.waiters):
+            if self.active >= self.max_concurrency:
+                break
+            if self._fits(waiter.route, waiter.user):
+                self._dequeue(waiter)
+                self._take(waiter.route, waiter.user)
+                waiter.future.set_result(None)
+
+    def retry_after(self) -> int:
+        """Rough seconds until the queue drains, from the average slot hold time"""
+        estimate = self.hold_seconds * (len(self.waiters) + 1) / self.max_concurrency
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(estimate)))
+
+    async def acquire(self, route: str, user: str):
+        """Wait for a slot; raises AdmissionRejected when the queue is full or the wait times out"""
+        start = time.monotonic()
+        # Nothing queued can use a free slot (_dispatch runs on every release), so no queue-jumping here
+        if self._fits(route, user):
+            self._take(route, user)
+            ADMISSION_WAIT.labels(route=route).observe(0)
+            return
+        if len(self.waiters) >= self.queue_size:
+            raise AdmissionRejected("queue_full", self.retry_after())
+        if self.queued_users[user] >= self.user_queue_size:
+            raise AdmissionRejected("user_queue_full", self.retry_after())
+
+        waiter = Waiter(route, user, asyncio.get_running_loop().create_future())
+        self.waiters.append(waiter)
+        self.queued_users[user] += 1
+        ADMISSION_QUEUE_DEPTH.labels(route=route).inc()
+        try:
+            await asyncio.wait({waiter.future}, timeout=self.queue_timeout)
+        except BaseException:
+            # Cancelled while queued; give the slot back if it was granted in the meantime
+            if waiter.future.done():
+                self.release(route, user)
+            else:
+                self._dequeue(waiter)
+                waiter.future.cancel()
+            raise
+        if not waiter.future.done():
+            self._dequeue(waiter)
+            waiter.future.cancel()
+            raise AdmissionRejected("timeout", self.retry_after())
+        ADMISSION_WAIT.labels(route=route).observe(time.monotonic() - start)
+
+    def release(self, route: str, user: str, held: Optional[float] = None):
+        self.active -= 1
+        self.active_routes[route] -= 1
+        self.active_users[user] -= 1
+        if not self.active_users[user]:
+            del self.active_users[user]
+        if held is not None:
+            self.hold_seconds = 0.9 * self.hold_seconds + 0.1 * held
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, route: str, user: str):
+        await self.acquire(route, user)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(route, user, time.monotonic() - start)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {"active": self.active, "queued": len(self.waiters), "users": len(self.active_users)}
+
+
+admission = AdmissionController(
+    max_concurrency=per_worker(ADMISSION_MAX_CONCURRENCY),
+    route_limits={route: per_worker(limit) for route, limit in parse_route_limits(ADMISSION_ROUTE_LIMITS).items()}
+)
+
+
+def user_key(body: bytes, scope) -> str:
+    """Lower-cased user_wallet_address from a JSON body, else the client address
+
+    A body `user_id` is ignored: it is unauthenticated, so rotating it would
+    dodge the per-user cap.
+    """
+    if body and len(body) <= MAX_BODY_BYTES:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = None
+        if isinstance(payload, dict):
+            if isinstance(payload.get("user_wallet_address"), str) and payload["user_wallet_address"]:
+                return payload["user_wallet_address"].lower()
+    client = scope.get("client")
+    return f"client:{client[0]}" if client else "anonymous"
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying `admission` to POST routes; the slot is held until the response (or stream) ends"""
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+        self.post_paths = None
+
+    async def __call__(self, scope, receive, send):
+        if not ADMISSION_ENABLED or scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        if self.post_paths is None:
+            self.post_paths = {route.path for route in scope["app"].routes if "POST" in getattr(route, "methods", ())}
+        route = scope["path"]
+        if route not in self.post_paths:
+            return await self.app(scope, receive, send)
+
+        # Read the body up front for the user key, then replay it to the app
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        user = user_key(body, scope)
+        try:
+            async with self.controller.slot(route, user):
+                await self.app(scope, replay, send)
+        except AdmissionRejected as e:
+            ADMISSION_REJECTED.labels(route=route, reason=e.reason).inc()
+            log.warning("admission.rejected", reason=e.reason, user=user, retry_after=e.retry_after, **self.controller.snapshot())
+            response = JSONResponse(
+                {"detail": f"Too many requests ({e.reason.replace('_', ' ')}), retry later"},
+                status_code=429,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
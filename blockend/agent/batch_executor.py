@@ -0,0 +1,220 @@
+"""
+Chunked, resumable execution of list-valued tool calls
+Splits a large list parameter (e.g. airdrop `recipients`) into chunks sent
+with bounded concurrency, records each confirmed chunk on disk and, when the
+same call is repeated after a failure, only sends the chunks still missing.
+Progress older than BATCH_RESUME_TTL is discarded, so repeating the same
+call on purpose later starts a fresh run.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+
+from shared_state import MULTI_WORKER
+from single_flight import SingleFlight
+from structured_logging import get_logger
+
+BATCH_STATE_DIR = os.getenv("BATCH_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".batch_runs"))
+BATCH_RESUME_TTL = float(os.getenv("BATCH_RESUME_TTL", "3600"))  # seconds a failed run can be resumed
+
+log = get_logger("batch")
+
+
+def run_id_for(tool_name: str, parameters: Dict[str, Any]) -> str:
+    """Stable id of a batched call; identical calls resume the same run"""
+    digest = hashlib.sha256(f"{tool_name}:{json.dumps(parameters, sort_keys=True, default=str)}".encode())
+    return digest.hexdigest()[:24]
+
+
+class BatchExecutor:
+    """Runs chunked tool calls and persists per-chunk progress"""
+
+    def __init__(self, state_dir: str = BATCH_STATE_DIR, resume_ttl: float = BATCH_RESUME_TTL, multi_process: bool = MULTI_WORKER):
+        self.state_dir = state_dir
+        self.resume_ttl = resume_ttl
+        # Only other worker processes need the file lock; in one process the single-flight map is enough
+        self.multi_process = multi_process
+        self._running = SingleFlight()
+        self._lock_fd: Optional[int] = None
+
+    def _state_path(self, run_id: str) -> str:
+        return os.path.join(self.state_dir, f"{run_id}.json")
+
+    def _load(self, run_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._state_path(run_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save(self, run_id: str, state: Dict[str, Any]):
+        os.makedirs(self.state_dir, exist_ok=True)
+        path = self._state_path(run_id)
+        state["updated_at"] = time.time()
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def _lock_file(self) -> int:
+        if self._lock_fd is None:
+            os.makedirs(self.state_dir, exist_ok=True)
+            self._lock_fd = os.open(os.path.join(self.state_dir, "runs.lock"), os.O_RDWR | os.O_CREAT)
+        return self._lock_fd
+
+    @staticmethod
+    def _lock_offset(run_id: str) -> int:
+        # One byte of a shared lock file per run, so no per-run files need cleaning up
+        return int(run_id[:8], 16)
+
+    def _claim(self, run_id: str) -> bool:
+        """Lock the run across worker processes; False if another process holds it"""
+        if not self.multi_process:
+            return True
+        # POSIX only, so imported here: single-worker mode also runs on Windows
+        import fcntl
+        try:
+            fcntl.lockf(self._lock_file(), fcntl.LOCK_EX | fcntl.LOCK_NB, 1, self._lock_offset(run_id))
+        except OSError:
+            return False
+        return True
+
+    def _release(self, run_id: str):
+        if not self.multi_process:
+            return
+        import fcntl
+        fcntl.lockf(self._lock_file(), fcntl.LOCK_UN, 1, self._lock_offset(run_id))
+
+    def _clear(self, run_id: str):
+        try:
+            os.remove(self._state_path(run_id))
+        except FileNotFoundError:
+            pass
+
+    async def run(
+        self,
+        tool_name: str,
+        parameters: Dict[str, Any],
+        batch: Dict[str, Any],
+        call: Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Execute `call` once per chunk of `parameters[batch["field"]]`
+
+        Identical concurrent calls share one run, so a list is never sent twice.
+        A run already in progress in another worker process is not joined;
+        the call fails and can be repeated once that run has finished.
+        """
+        run_id = run_id_for(tool_name, parameters)
+        if run_id not in self._running and not self._claim(run_id):
+            return {
+                "success": False,
+                "tool": tool_name,
+                "error": f"batch run {run_id} is in progress in another worker; repeat the call once it has finished"
+            }
+
+        result = await self._running.do(run_id, lambda: self._execute_claimed(run_id, tool_name, parameters, batch, call))
+        return dict(result)
+
+    async def _execute_claimed(
+        self,
+        run_id: str,
+        tool_name: str,
+        parameters: Dict[str, Any],
+        batch: Dict[str, Any],
+        call: Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        try:
+            return await self._execute(run_id, tool_name, parameters, batch, call)
+        finally:
+            self._release(run_id)
+
+    async def _execute(
+        self,
+        run_id: str,
+        tool_name: str,
+        parameters: Dict[str, Any],
+        batch: Dict[str, Any],
+        call: Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        field = batch["field"]
+        items: List[Any] = parameters[field]
+
+        state = await asyncio.to_thread(self._load, run_id)
+        if state is not None and time.time() - state.get("updated_at", 0) > self.resume_ttl:
+            log.info("batch.expired", tool=tool_name, run_id=run_id, confirmed_chunks=len(state["completed"]))
+            state = None
+        if state is None or state.get("total_items") != len(items):
+            state = {"tool": tool_name, "chunk_size": batch["chunk_size"], "total_items": len(items), "completed": {}}
+        # Keep the original chunk boundaries when resuming
+        chunk_size = state["chunk_size"]
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        pending = [index for index in range(len(chunks)) if str(index) not in state["completed"]]
+        resumed = len(chunks) - len(pending)
+        if resumed:
+            log.info("batch.resume", tool=tool_name, run_id=run_id, confirmed_chunks=resumed, chunks=len(chunks))
+
+        semaphore = asyncio.Semaphore(batch.get("concurrency", 4))
+        state_lock = asyncio.Lock()
+        failures: Dict[int, str] = {}
+        sent = 0
+        start = time.perf_counter()
+
+        async def run_chunk(index: int):
+            nonlocal sent
+            async with semaphore:
+                chunk_parameters = dict(parameters, **{field: chunks[index]})
+                result = await call(tool_name, chunk_parameters)
+            if not result.get("success"):
+                failures[index] = result.get("error", "unknown error")
+                log.warning("batch.chunk_failed", tool=tool_name, run_id=run_id, chunk=index, error=failures[index])
+                return
+            sent += len(chunks[index])
+            async with state_lock:
+                state["completed"][str(index)] = result.get("result")
+                await asyncio.to_thread(self._save, run_id, state)
+            log.debug("batch.chunk_confirmed", tool=tool_name, run_id=run_id, chunk=index, items=len(chunks[index]))
+
+        await asyncio.gather(*[run_chunk(index) for index in pending])
+        elapsed = time.perf_counter() - start
+        throughput = round(sent / elapsed, 2) if elapsed > 0 else 0.0
+
+        summary = {
+            "batched": True,
+            "run_id": run_id,
+            "items": len(items),
+            "chunks": len(chunks),
+            "chunk_size": chunk_size,
+            "resumed_chunks": resumed,
+            "sent_chunks": len(pending) - len(failures),
+            "failed_chunks": sorted(failures),
+            f"{field}_per_second": throughput,
+            "chunk_results": [state["completed"].get(str(index)) for index in range(len(chunks))]
+        }
+        log.info(
+            "batch.finished",
+            tool=tool_name,
+            run_id=run_id,
+            items=len(items),
+            chunks=len(chunks),
+            failed=len(failures),
+            items_per_second=throughput
+        )
+
+        if failures:
+            return {
+                "success": False,
+                "tool": tool_name,
+                "error": (
+                    f"{len(failures)} of {len(chunks)} chunks failed; repeat the call within "
+                    f"{int(self.resume_ttl)}s to resume from the confirmed chunks"
+                ),
+                "result": summary
+            }
+        await asyncio.to_thread(self._clear, run_id)
+        return {"success": True, "tool": tool_name, "result": summary}
+
+
+batch_executor = BatchExecutor()
@@ -0,0 +1,207 @@
+"""
+Micro-benchmark suite for the agent's in-process hot paths
+Times prompt/tool compilation, message parsing, summaries, dependency
+extraction and request validation, and compares them against a saved
+baseline so regressions show up in review. Timings are stored relative to a
+fixed pure-Python calibration workload timed in the same run, so the
+baseline carries no machine-specific absolute numbers and can be compared
+on any machine.
+
+Usage:
+    python benchmark_hot_paths.py                  # run and compare with the baseline
+    python benchmark_hot_paths.py --save           # run and overwrite the baseline
+    python benchmark_hot_paths.py -k prompt        # only benchmarks whose name contains "prompt"
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import timeit
+from typing import Dict, Callable, Tuple
+
+import main
+from benchmark_intent_router import MESSAGES, routed
+from intent_router import intent_router
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+BENCHMARKS: Dict[str, Callable[[], object]] = {}
+
+
+def benchmark(name: str):
+    """Register a zero-argument callable as a named benchmark"""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+# Fixtures
+WORKFLOW = [
+    main.ToolConnection(tool="get_balance", node_id=f"bal_{i}", next_tool="airdrop", parameters={"address": f"0x{i:040x}"})
+    for i in range(20)
+] + [
+    main.ToolConnection(tool="airdrop", next_tool="wallet_analytics", condition="success"),
+    main.ToolConnection(tool="fetch_price", next_tool="swap"),
+    main.ToolConnection(tool="swap", next_tool="transfer"),
+    main.ToolConnection(tool="transfer"),
+]
+WORKFLOW_KEY = main.WorkflowDAG(WORKFLOW).canonical_key()
+ALL_TOOLS = list(main.TOOL_DEFINITIONS)
+
+TRANSFER_MESSAGE = MESSAGES["long transfer"]
+
+LARGE_TOOL_CALLS = [{"tool": ALL_TOOLS[i % len(ALL_TOOLS)], "parameters": {"i": i}} for i in range(1000)]
+LARGE_RESULTS = [{"success": i % 7 != 0, "result": {"i": i}} for i in range(1000)]
+
+LARGE_CODE = "\n".join(
+    f"import module_{i}\nfrom package_{i}.sub import thing\n\ndef handler_{i}(x):\n    return x * {i}\n"
+    for i in range(500)
+)
+
+LARGE_AGENT_REQUEST = json.dumps({
+    "tools": [
+        {"tool": "get_balance", "node_id": f"bal_{i}", "next_tool": "airdrop", "parameters": {"address": f"0x{i:040x}"}}
+        for i in range(300)
+    ] + [{"tool": "airdrop", "parameters": {"recipients": [f"0x{i:040x}" for i in range(1000)], "amount": "1"}}],
+    "user_message": TRANSFER_MESSAGE,
+    "context": {"network": "somnia", "notes": ["x" * 100] * 50},
+    "execution_plan": {"execution_steps": [
+        {"step": i, "operation": "transfer", "description": f"Transfer X ETH to undefined #{i}", "smart_account": f"0x{i:040x}"}
+        for i in range(200)
+    ]},
+    "smart_accounts": {f"node_{i}": f"0x{i:040x}" for i in range(500)},
+    "user_wallet_address": "0x9E239687ED8Fd4d79C781cA408E12bd209BC7762",
+})
+
+
+def calibration():
+    """Fixed interpreter-bound workload every benchmark is expressed relative to"""
+    sorted(str(i * 7919 % 1000) for i in range(200))
+
+
+# Benchmarks
+@benchmark("build_system_prompt (memoized)")
+def bench_build_system_prompt():
+    main.build_system_prompt(WORKFLOW)
+
+
+@benchmark("compile_system_prompt (uncached render)")
+def bench_compile_system_prompt():
+    main.compile_system_prompt.__wrapped__(WORKFLOW_KEY)
+
+
+@benchmark("get_groq_tools (memoized)")
+def bench_get_groq_tools():
+    main.get_groq_tools(ALL_TOOLS)
+
+
+@benchmark("compile_groq_tools (uncached)")
+def bench_compile_groq_tools():
+    main.compile_groq_tools.__wrapped__(tuple(sorted(ALL_TOOLS)))
+
+
+@benchmark("extract_transfer_params (long message)")
+def bench_extract_transfer_params():
+    main.extract_transfer_params(TRANSFER_MESSAGE)
+
+
+@benchmark("intent_router.parse (long message)")
+def bench_intent_parse():
+    intent_router.parse(MESSAGES["long general"])
+
+
+@benchmark("chat routing + entities (long transfer)")
+def bench_chat_routing():
+    routed(TRANSFER_MESSAGE)
+
+
+@benchmark("generate_workflow_summary (1000 calls)")
+def bench_workflow_summary():
+    main.generate_workflow_summary(LARGE_TOOL_CALLS, LARGE_RESULTS)
+
+
+@benchmark("extract_dependencies (500 modules)")
+def bench_extract_dependencies():
+    main.extract_dependencies(LARGE_CODE, "python")
+
+
+@benchmark("AgentRequest parse (large payload)")
+def bench_agent_request_parse():
+    main.AgentRequest.model_validate_json(LARGE_AGENT_REQUEST)
+
+
+def measure(func: Callable[[], object], repeat: int = 5) -> Dict[str, float]:
+    """Time a callable; results are microseconds per call"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    runs = [total / number * 1e6 for total in timer.repeat(repeat=repeat, number=number)]
+    return {"median_us": round(statistics.median(runs), 3), "min_us": round(min(runs), 3), "loops": number}
+
+
+def relative(func: Callable[[], object]) -> Tuple[float, float]:
+    """Best time of `func` in µs and as a multiple of the calibration workload timed right around it"""
+    # Machine speed drifts on shared hosts, so the reference is taken next to each benchmark
+    reference_us = measure(calibration)["min_us"]
+    best_us = measure(func)["min_us"]
+    reference_us = min(reference_us, measure(calibration)["min_us"])
+    return best_us, round(best_us / reference_us, 3)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the agent's in-process hot paths")
+    parser.add_argument("--save", action="store_true", help="Save results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown before flagging (0.25 = 25%%)")
+    parser.add_argument("-k", dest="keyword", default="", help="Only run benchmarks whose name contains this")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("benchmarks", {})
+
+    results = {}
+    regressions = []
+    print("=" * 78)
+    print("HOT PATH BENCHMARKS")
+    print("=" * 78)
+    print("'relative' is the time as a multiple of a fixed calibration workload")
+    print(f"{'benchmark':<45}{'best':>10}{'relative':>10}{'baseline':>10}{'change':>9}")
+    for name, func in BENCHMARKS.items():
+        if args.keyword and args.keyword not in name:
+            continue
+        # Best-of-runs is far less noisy than the median on shared machines
+        best_us, current = relative(func)
+        previous = baseline.get(name, {}).get("relative")
+        if previous and not args.save and current / previous - 1 > args.threshold:
+            # Only a slowdown that shows up again is reported
+            retry_us, retry = relative(func)
+            if retry < current:
+                best_us, current = retry_us, retry
+        results[name] = {"relative": current}
+        change = ""
+        if previous:
+            ratio = current / previous - 1
+            change = f"{ratio:+.0%}"
+            if ratio > args.threshold:
+                regressions.append(name)
+                change += " !"
+        baseline_text = f"{previous:.3f}" if previous else "-"
+        print(f"{name:<45}{best_us:>8.1f}µs{current:>10.3f}{baseline_text:>10}{change:>9}")
+
+    if args.save:
+        # Only unitless ratios are saved; absolute timings depend on the machine
+        with open(args.baseline, "w") as f:
+            json.dump({"benchmarks": results}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+    elif regressions:
+        print(f"\nRegressions over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_cli()
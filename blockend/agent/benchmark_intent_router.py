@@ -0,0 +1,99 @@
+"""
+Micro-benchmark for chat intent routing
+Compares the previous chain of lower()/re.search/re.findall checks in
+/agent/chat with the IntentRouter on short and long pasted messages,
+extracting the same entities each handler branch needs.
+
+Usage: python benchmark_intent_router.py [--iterations 2000]
+"""
+
+import argparse
+import re
+import time
+
+from intent_router import intent_router, PRICE_TOKENS
+
+PASTED_EXPORT = " ".join(
+    f"Row {i}: wallet 0x{i:040x} holds {i * 1.5:.2f} tokens, last activity noted as routine."
+    for i in range(200)
+)
+
+MESSAGES = {
+    "short transfer": "Transfer 0.1 ETH to 0x9E239687ED8Fd4d79C781cA408E12bd209BC7762",
+    "long transfer": PASTED_EXPORT + " Please send 2.5 usdc to 0x9E239687ED8Fd4d79C781cA408E12bd209BC7762",
+    "long swap": PASTED_EXPORT + " Swap 10 from 0x9E239687ED8Fd4d79C781cA408E12bd209BC7762 to 0x1111111111111111111111111111111111111111",
+    "long price": PASTED_EXPORT + " Finally, what is the price of ethereum right now?",
+    "long general": PASTED_EXPORT + " Can you explain what an NFT is?",
+}
+
+
+def legacy_route(message: str):
+    """The routing checks /agent/chat ran before the IntentRouter"""
+    if any(word in message.lower() for word in ["balance", "check balance", "how much"]):
+        address_match = re.search(r'0x[a-fA-F0-9]{40}', message)
+        return "balance", address_match.group(0) if address_match else None
+    if any(word in message.lower() for word in ["transfer", "send"]):
+        address_matches = re.findall(r'0x[a-fA-F0-9]{35,42}', message)
+        amount_match = re.search(r'(\d+(?:\.\d+)?)\s*(eth|usdc|usdt|dai)?', message.lower())
+        to_match = re.search(r'to\s+(0x[a-fA-F0-9]{35,42})', message, re.IGNORECASE)
+        return "transfer", (
+            address_matches,
+            amount_match.groups() if amount_match else None,
+            to_match.group(1) if to_match else None
+        )
+    if any(word in message.lower() for word in ["swap", "exchange"]):
+        addresses = re.findall(r'0x[a-fA-F0-9]{40}', message)
+        amount_match = re.search(r'(\d+(?:\.\d+)?)', message)
+        return "swap", (addresses, amount_match.group(1) if amount_match else None)
+    if any(word in message.lower() for word in ["price", "cost", "value"]):
+        for token in PRICE_TOKENS:
+            if token in message.lower():
+                return "price", token
+        return "price", None
+    user_msg_lower = message.lower()
+    return "general", "defi" in user_msg_lower or "nft" in user_msg_lower
+
+
+def routed(message: str):
+    """The same decisions made through the IntentRouter"""
+    parsed = intent_router.parse(message)
+    if parsed.intent == "balance":
+        return "balance", parsed.full_addresses[0] if parsed.full_addresses else None
+    if parsed.intent == "transfer":
+        amount = (parsed.amount, parsed.amount_unit) if parsed.amount else None
+        return "transfer", (parsed.addresses, amount, parsed.recipient)
+    if parsed.intent == "swap":
+        return "swap", (parsed.full_addresses, parsed.amount)
+    if parsed.intent == "price":
+        return "price", parsed.first_keyword(PRICE_TOKENS)
+    return "general", parsed.has("defi") or parsed.has("nft")
+
+
+def time_per_call(func, message: str, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(message)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat intent routing")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("INTENT ROUTER BENCHMARK")
+    print("=" * 60)
+    for label, message in MESSAGES.items():
+        if legacy_route(message) != routed(message):
+            print(f"WARNING: {label} routed differently")
+        iterations = args.iterations if len(message) < 1000 else max(1, args.iterations // 10)
+        legacy = time_per_call(legacy_route, message, iterations)
+        router = time_per_call(routed, message, iterations)
+        print(f"{label} ({len(message)} chars)")
+        print(f"    legacy checks: {legacy:10.1f} µs/msg")
+        print(f"    IntentRouter:  {router:10.1f} µs/msg  ({legacy / router:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark for the async LLM client path
+Compares requests/sec of the old blocking Groq call inside an async handler
+with the shared async LLMClient, against a local fake LLM server.
+
+Usage: python benchmark_llm.py [--requests 200] [--concurrency 50] [--latency 0.2]
+"""
+
+import argparse
+import asyncio
+import time
+
+from groq import Groq
+
+from fake_services import BackgroundServer, create_fake_llm_app
+from llm_client import LLMClient
+
+MESSAGES = [
+    {"role": "system", "content": "You are a Web3 AI assistant."},
+    {"role": "user", "content": "What is DeFi?"}
+]
+MODEL = "llama-3.1-70b-versatile"
+
+
+async def run_load(handler, total: int, concurrency: int) -> float:
+    """Run `total` handler calls with `concurrency` workers and return requests/sec"""
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            await handler()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return total / (time.perf_counter() - start)
+
+
+async def benchmark(base_url: str, total: int, concurrency: int):
+    sync_client = Groq(api_key="fake-key", base_url=base_url)
+
+    async def blocking_handler():
+        # Old path: synchronous client called from an async endpoint
+        sync_client.chat.completions.create(model=MODEL, messages=MESSAGES, max_tokens=1000)
+
+    llm_client = LLMClient(api_key="fake-key", base_url=base_url, max_concurrency=concurrency)
+
+    async def async_handler():
+        await llm_client.complete(model=MODEL, messages=MESSAGES, max_tokens=1000)
+
+    before = await run_load(blocking_handler, total, concurrency)
+    after = await run_load(async_handler, total, concurrency)
+    await llm_client.aclose()
+    sync_client.close()
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async Groq calls")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM latency in seconds")
+    args = parser.parse_args()
+
+    with BackgroundServer(create_fake_llm_app(latency=args.latency)) as server:
+        before, after = asyncio.run(benchmark(server.url, args.requests, args.concurrency))
+
+    print("=" * 60)
+    print("LLM CLIENT BENCHMARK")
+    print("=" * 60)
+    print(f"Requests: {args.requests}  Concurrency: {args.concurrency}  Fake latency: {args.latency}s")
+    print(f"Before (blocking Groq client): {before:8.1f} req/s")
+    print(f"After  (async LLMClient):      {after:8.1f} req/s")
+    print(f"Speedup: {after / before:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
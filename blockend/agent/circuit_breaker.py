@@ -0,0 +1,150 @@
+"""
+Per-endpoint circuit breakers and adaptive timeouts for the tool APIs
+Each tool endpoint tracks its recent outcomes and latencies. When too many
+recent calls failed, or several in a row, the breaker opens and calls fail immediately; after
+BREAKER_OPEN_SECONDS one probe is let through (half-open) and its outcome
+closes or re-opens the breaker. The request timeout follows the observed
+latency (a multiple of p99), capped by the tool's configured timeout.
+"""
+
+import os
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))  # recent calls considered
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_CONSECUTIVE_FAILURES = int(os.getenv("BREAKER_CONSECUTIVE_FAILURES", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+ADAPTIVE_TIMEOUT_MULTIPLIER = float(os.getenv("ADAPTIVE_TIMEOUT_MULTIPLIER", "3"))
+ADAPTIVE_TIMEOUT_MIN = float(os.getenv("ADAPTIVE_TIMEOUT_MIN", "2"))
+ADAPTIVE_TIMEOUT_SAMPLES = int(os.getenv("ADAPTIVE_TIMEOUT_SAMPLES", "20"))  # successes needed before adapting
+
+LATENCY_WINDOW = 200
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class EndpointBreaker:
+    """Outcome window, breaker state and latency distribution of one endpoint"""
+
+    def __init__(self, name: str, max_timeout: float):
+        self.name = name
+        self.max_timeout = max_timeout
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.consecutive_failures = 0
+        self._outcomes: deque = deque(maxlen=BREAKER_WINDOW)  # True = success
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)  # seconds, successful calls only
+        self._timeout: Optional[float] = None
+        self._samples_since_update = 0
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now (claims the probe slot when half-open)"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < BREAKER_OPEN_SECONDS:
+                return False
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+        return True
+
+    def retry_in(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, BREAKER_OPEN_SECONDS - (time.monotonic() - self.opened_at))
+
+    def record_success(self, latency: float):
+        self._outcomes.append(True)
+        self.consecutive_failures = 0
+        self._latencies.append(latency)
+        self._samples_since_update += 1
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self.probe_in_flight = False
+            self._outcomes.clear()
+
+    def record_failure(self):
+        self._outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN or self.consecutive_failures >= BREAKER_CONSECUTIVE_FAILURES:
+            self._open()
+            return
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= BREAKER_MIN_CALLS and failures / len(self._outcomes) >= BREAKER_FAILURE_RATIO:
+            self._open()
+
+    def release_probe(self):
+        """Free the half-open probe slot when a call ended without an outcome (e.g. cancelled)"""
+        self.probe_in_flight = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+
+    def timeout(self) -> float:
+        """Request timeout: ADAPTIVE_TIMEOUT_MULTIPLIER x p99 latency within [ADAPTIVE_TIMEOUT_MIN, max_timeout]"""
+        if len(self._latencies) < ADAPTIVE_TIMEOUT_SAMPLES:
+            return self.max_timeout
+        # Recomputing on every call would sort the window each time
+        if self._timeout is None or self._samples_since_update >= 10:
+            adaptive = percentile(self._latencies, 99) * ADAPTIVE_TIMEOUT_MULTIPLIER
+            self._timeout = min(self.max_timeout, max(ADAPTIVE_TIMEOUT_MIN, adaptive))
+            self._samples_since_update = 0
+        return self._timeout
+
+    def latency_quantile(self, pct: float) -> Optional[float]:
+        return percentile(self._latencies, pct) if self._latencies else None
+
+    def hedge_delay(self) -> Optional[float]:
+        """p95 latency once enough calls were seen to trust it (used to hedge idempotent calls)"""
+        if len(self._latencies) < ADAPTIVE_TIMEOUT_SAMPLES:
+            return None
+        return self.latency_quantile(95)
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50 = self.latency_quantile(50)
+        p95 = self.latency_quantile(95)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "recent_failures": self._outcomes.count(False),
+            "recent_calls": len(self._outcomes),
+            "timeout_seconds": round(self.timeout(), 3),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "retry_in_seconds": round(self.retry_in(), 1)
+        }
+
+
+class BreakerRegistry:
+    def __init__(self):
+        self._breakers: Dict[str, EndpointBreaker] = {}
+
+    def get(self, name: str, max_timeout: float) -> EndpointBreaker:
+        breaker = self._breakers.get(name)
+        if breaker is None:
+            breaker = self._breakers[name] = EndpointBreaker(name, max_timeout)
+        return breaker
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: breaker.snapshot() for name, breaker in sorted(self._breakers.items())}
+
+    def any_open(self) -> bool:
+        return any(breaker.state == OPEN for breaker in self._breakers.values())
+
+
+tool_breakers = BreakerRegistry()
@@ -0,0 +1,166 @@
+"""
+Two-tier cache for /agent/generate-code results
+An in-memory LRU in front of a SQLite file that survives restarts. Keys are
+the normalized (workflow_description, tools_used, programming_language) plus
+the model, and the disk tier is evicted least-recently-used by total size.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+
+from shared_state import LazyDatabase
+from single_flight import SingleFlight
+
+CODE_CACHE_MAX_ENTRIES = int(os.getenv("CODE_CACHE_MAX_ENTRIES", "128"))
+# Empty disables the on-disk tier
+CODE_CACHE_PATH = os.getenv("CODE_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".code_cache.sqlite3"))
+CODE_CACHE_MAX_BYTES = int(os.getenv("CODE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+def make_key(workflow_description: str, tools_used: List[str], language: str, model: str) -> str:
+    """Stable key that ignores whitespace, case of language/tool names and tool order"""
+    normalized = {
+        "description": " ".join(workflow_description.split()),
+        "tools": sorted({tool.strip().lower() for tool in tools_used}),
+        "language": language.strip().lower(),
+        "model": model
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+class DiskTier:
+    """SQLite table of generated results with size-bounded LRU eviction (blocking; run in a thread)"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._database = LazyDatabase(
+            path,
+            "CREATE TABLE IF NOT EXISTS generated_code ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS generated_code_accessed ON generated_code (accessed)"
+        )
+
+    @property
+    def _db(self):
+        return self._database.connection
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM generated_code WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE generated_code SET accessed = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Dict[str, Any]):
+        encoded = json.dumps(value)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO generated_code (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, encoded, len(encoded), time.time())
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM generated_code").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM generated_code ORDER BY accessed").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM generated_code WHERE key = ?", evicted)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generated_code").fetchone()
+        return {"entries": entries, "bytes": size}
+
+    def close(self):
+        with self._lock:
+            self._database.close()
+
+
+class CodeGenerationCache:
+    """Memory LRU + optional disk tier with single-flight generation"""
+
+    def __init__(self, max_entries: int = CODE_CACHE_MAX_ENTRIES, path: str = CODE_CACHE_PATH, max_bytes: int = CODE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._inflight = SingleFlight()
+        self.disk = DiskTier(path, max_bytes) if path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: str, value: Dict[str, Any]):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            return value
+        if self.disk is None:
+            return None
+        value = await asyncio.to_thread(self.disk.get, key)
+        if value is not None:
+            self.disk_hits += 1
+            self._remember(key, value)
+        return value
+
+    async def get_or_generate(
+        self,
+        key: str,
+        generate: Callable[[], Awaitable[Dict[str, Any]]],
+        refresh: bool = False
+    ) -> Dict[str, Any]:
+        """Return a cached result (with "cached": True) or generate and store it
+
+        `refresh` skips the lookup and overwrites the stored result. Concurrent
+        callers for the same key share one generation; exceptions are not cached.
+        """
+        if not refresh:
+            cached = await self._lookup(key)
+            if cached is not None:
+                return dict(cached, cached=True)
+
+        if key not in self._inflight:
+            self.misses += 1
+        result = await self._inflight.do(key, lambda: self._generate_and_store(key, generate))
+        return dict(result, cached=False)
+
+    async def _generate_and_store(self, key: str, generate: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        result = await generate()
+        self._remember(key, result)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.put, key, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        disk = self.disk.stats() if self.disk is not None else {"entries": 0, "bytes": 0}
+        return {
+            "memory_entries": len(self._entries),
+            "disk_entries": disk["entries"],
+            "disk_bytes": disk["bytes"],
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses
+        }
+
+
+code_cache = CodeGenerationCache()
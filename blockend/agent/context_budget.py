@@ -0,0 +1,182 @@
+"""
+Token-budgeted conversation context for the agent loop
+Keeps the most recent tool-calling turns verbatim and compacts older tool
+results into short projections (and, when still over budget, into a one-line
+digest) so the prompt resent to Groq each iteration stays bounded. The latest
+turn and every turn's next-step hint are always kept.
+"""
+
+import json
+import os
+from typing import List, Dict, Any, Optional, Tuple
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "2"))
+TOOL_SUMMARY_CHARS = int(os.getenv("TOOL_SUMMARY_CHARS", "400"))
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+VERBATIM, COMPACT, DIGEST = 0, 1, 2
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Rough token count (~4 characters per token for English/JSON)"""
+    return len(text) // 4 + 1 if text else 0
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content"))
+    for call in message.get("tool_calls") or []:
+        tokens += estimate_tokens(call["function"]["name"]) + estimate_tokens(call["function"]["arguments"])
+    return tokens
+
+
+def _project_value(value: Any, max_chars: int) -> Any:
+    if isinstance(value, str):
+        return value if len(value) <= max_chars else value[:max_chars] + "..."
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    if isinstance(value, list):
+        return f"<{len(value)} items>"
+    if isinstance(value, dict):
+        return f"<object with {len(value)} fields>"
+    return str(value)[:max_chars]
+
+
+def summarize_tool_result(result: Dict[str, Any], max_chars: int = TOOL_SUMMARY_CHARS) -> str:
+    """Compact JSON projection of an execute_tool result
+
+    Keeps success/error and the top-level scalar fields of the payload;
+    lists and nested objects are reduced to their size.
+    """
+    if not result.get("success"):
+        summary = {"success": False, "error": _project_value(str(result.get("error", "")), max_chars)}
+    else:
+        payload = result.get("result")
+        if isinstance(payload, dict):
+            payload = {key: _project_value(value, 80) for key, value in payload.items()}
+        else:
+            payload = _project_value(payload, max_chars)
+        summary = {"success": True, "result": payload}
+    text = json.dumps(summary, default=str)
+    if len(text) > max_chars:
+        text = text[:max_chars] + "...(truncated)"
+    return text
+
+
+class ToolTurn:
+    """One assistant message with tool calls, its tool results and the follow-up hint"""
+
+    def __init__(
+        self,
+        assistant_message: Dict[str, Any],
+        tool_results: List[Tuple[str, str, Dict[str, Any]]],
+        hint: Optional[str] = None
+    ):
+        self.assistant_message = assistant_message
+        self.tool_results = tool_results  # (tool_call_id, tool name, result)
+        self.hint = hint
+        self._rendered: Dict[int, List[Dict[str, Any]]] = {}
+        self._tokens: Dict[int, int] = {}
+
+    def render(self, level: int) -> List[Dict[str, Any]]:
+        if level not in self._rendered:
+            if level == DIGEST:
+                self._rendered[level] = []
+            else:
+                messages = [self.assistant_message]
+                for tool_call_id, _, result in self.tool_results:
+                    content = json.dumps(result) if level == VERBATIM else summarize_tool_result(result)
+                    messages.append({"role": "tool", "tool_call_id": tool_call_id, "content": content})
+                if self.hint:
+                    messages.append({"role": "system", "content": self.hint})
+                self._rendered[level] = messages
+        return self._rendered[level]
+
+    def digest_lines(self) -> List[str]:
+        lines = [
+            f"- {name}: {summarize_tool_result(result, 120)}"
+            for _, name, result in self.tool_results
+        ]
+        if self.hint:
+            lines.append(f"  {self.hint}")
+        return lines
+
+    def tokens(self, level: int) -> int:
+        if level not in self._tokens:
+            if level == DIGEST:
+                self._tokens[level] = sum(estimate_tokens(line) + 1 for line in self.digest_lines())
+            else:
+                self._tokens[level] = sum(message_tokens(m) for m in self.render(level))
+        return self._tokens[level]
+
+
+class ConversationContext:
+    """Message history of one agent request, rendered within a token budget"""
+
+    def __init__(
+        self,
+        system_prompt: str,
+        user_message: str,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        recent_turns: int = CONTEXT_RECENT_TURNS
+    ):
+        self.head = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.turns: List[ToolTurn] = []
+        self.last_prompt_tokens = 0
+
+    def add_turn(self, turn: ToolTurn):
+        self.turns.append(turn)
+
+    def messages(self) -> List[Dict[str, Any]]:
+        """Messages to send: recent turns verbatim, older ones compacted to fit the budget
+
+        Over budget, recent turns are compacted too; one-line digests are the
+        last resort. The latest turn is never reduced, so the prompt can stay
+        over budget when that turn alone does not fit.
+        """
+        recent_start = max(0, len(self.turns) - self.recent_turns)
+        levels = [COMPACT if i < recent_start else VERBATIM for i in range(len(self.turns))]
+        head_tokens = sum(message_tokens(m) for m in self.head)
+        tokens = head_tokens + sum(turn.tokens(level) for turn, level in zip(self.turns, levels))
+
+        # Compact recent turns (oldest first) before anything is digested; only
+        # when that is not enough fold the oldest turns into the digest. The
+        # latest turn holds the results the model just asked for and its
+        # next-step hint, so it always stays verbatim
+        for target in (COMPACT, DIGEST):
+            for i in range(len(self.turns) - 1):
+                if tokens <= self.token_budget:
+                    break
+                if levels[i] < target:
+                    tokens += self.turns[i].tokens(target) - self.turns[i].tokens(levels[i])
+                    levels[i] = target
+
+        messages = list(self.head)
+        digest = [line for turn, level in zip(self.turns, levels) if level == DIGEST for line in turn.digest_lines()]
+        if digest:
+            messages.append({
+                "role": "system",
+                "content": "Results of earlier workflow steps (compacted):\n" + "\n".join(digest)
+            })
+            tokens += MESSAGE_OVERHEAD_TOKENS + estimate_tokens(messages[-1]["content"]) - sum(
+                turn.tokens(DIGEST) for turn, level in zip(self.turns, levels) if level == DIGEST
+            )
+        for turn, level in zip(self.turns, levels):
+            messages.extend(turn.render(level))
+
+        self.last_prompt_tokens = tokens
+        return messages
+
+    def history(self) -> List[Dict[str, Any]]:
+        """Full uncompacted history, for the response's conversation_history"""
+        messages = list(self.head)
+        for turn in self.turns:
+            messages.extend(turn.render(VERBATIM))
+        return messages
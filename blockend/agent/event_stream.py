@@ -0,0 +1,66 @@
+"""
+Server-Sent Events helpers
+Runs a handler in the background and streams the events it emits as they
+happen, finishing with a `done` (or `error`) event carrying the final result.
+"""
+
+import asyncio
+import json
+from typing import Dict, Any, Callable, Awaitable, AsyncIterator, Optional
+
+from fastapi.responses import StreamingResponse
+
+EventEmitter = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def progress_only(emit: EventEmitter) -> EventEmitter:
+    """Mark an emitter that only wants progress events: LLM calls for it are not streamed"""
+    emit.wants_tokens = False
+    return emit
+
+
+def wants_tokens(emit: Optional[EventEmitter]) -> bool:
+    return emit is not None and getattr(emit, "wants_tokens", True)
+
+
+def format_sse(event: str, data: Any) -> str:
+    """Encode one SSE frame"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_events(run: Callable[[EventEmitter], Awaitable[Any]]) -> AsyncIterator[str]:
+    """Yield SSE frames for everything `run` emits, then its return value"""
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def emit(event: str, data: Dict[str, Any]):
+        await queue.put((event, data))
+
+    async def runner():
+        try:
+            result = await run(emit)
+            await queue.put(("done", result))
+        except Exception as e:
+            await queue.put(("error", {"detail": str(e)}))
+        finally:
+            await queue.put(None)
+
+    task = asyncio.create_task(runner())
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            yield format_sse(*item)
+    finally:
+        # Client went away: stop the work instead of finishing it unobserved
+        if not task.done():
+            task.cancel()
+
+
+def sse_response(run: Callable[[EventEmitter], Awaitable[Any]]) -> StreamingResponse:
+    """StreamingResponse for a handler that reports progress through `emit`"""
+    return StreamingResponse(
+        stream_events(run),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
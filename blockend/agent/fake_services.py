@@ -0,0 +1,200 @@
+"""
+Local stand-ins for external services used by benchmarks and load tests
+Serves a Groq/OpenAI-compatible chat-completions API (plain and streamed,
+optionally answering with scripted tool_calls) and a fake Next.js tool API,
+both with configurable latency.
+"""
+
+import asyncio
+import json
+import socket
+import threading
+import time
+from typing import Dict, Any, List, Optional, Callable
+from urllib.parse import urlsplit
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+FAKE_ADDRESS = "0x1234567890123456789012345678901234567890"
+FAKE_TX_HASH = "0x" + "ab" * 32
+
+# Returns the tool calls ({"name", "arguments"}) to answer with, or None for a text reply
+ToolCallScript = Callable[[Dict[str, Any]], Optional[List[Dict[str, Any]]]]
+
+
+def sample_arguments(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Plausible arguments for a tool's JSON schema (required fields only)"""
+    properties = schema.get("properties", {})
+    names = schema.get("required") or list(properties)
+    arguments = {}
+    for name in names:
+        prop_type = properties.get(name, {}).get("type", "string")
+        if prop_type in ("number", "integer"):
+            arguments[name] = 1
+        elif prop_type == "array":
+            arguments[name] = [FAKE_ADDRESS]
+        elif "address" in name.lower():
+            arguments[name] = FAKE_ADDRESS
+        elif "amount" in name.lower():
+            arguments[name] = "0.01"
+        else:
+            arguments[name] = "test"
+    return arguments
+
+
+def call_each_tool_once(body: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """Default script: call every offered tool not called yet, then answer in text"""
+    called = set()
+    for message in body.get("messages", []):
+        for call in message.get("tool_calls") or []:
+            called.add(call["function"]["name"])
+    calls = [
+        {"name": tool["function"]["name"], "arguments": sample_arguments(tool["function"].get("parameters", {}))}
+        for tool in body.get("tools") or []
+        if tool["function"]["name"] not in called
+    ]
+    return calls or None
+
+
+def create_fake_llm_app(latency: float = 0.2, script: Optional[ToolCallScript] = None) -> FastAPI:
+    """Chat-completions server that answers every request after `latency` seconds
+
+    With a `script` (e.g. `call_each_tool_once`) requests that offer tools can
+    be answered with tool_calls instead of text.
+    """
+    fake_app = FastAPI(title="Fake Groq API")
+
+    @fake_app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        content = "This is a simulated response from the fake LLM server."
+        scripted = script(body) if script else None
+        tool_calls = [
+            {
+                "id": f"call_{time.time_ns()}_{i}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}
+            }
+            for i, call in enumerate(scripted or [])
+        ]
+        if body.get("stream"):
+            return StreamingResponse(stream_chunks(body, content, tool_calls), media_type="text/event-stream")
+        await asyncio.sleep(latency)
+        message = {"role": "assistant", "content": None, "tool_calls": tool_calls} if tool_calls else {"role": "assistant", "content": content}
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) // 4
+        return {
+            "id": f"chatcmpl-fake-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-model"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_tokens + len(content) // 4
+            }
+        }
+
+    def chunk(body: Dict[str, Any], chunk_id: str, delta: Dict[str, Any], finish_reason: Optional[str]) -> str:
+        return "data: " + json.dumps({
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-model"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }) + "\n\n"
+
+    async def stream_chunks(body: Dict[str, Any], content: str, tool_calls: List[Dict[str, Any]]):
+        # First token arrives after the configured latency, the rest follow quickly
+        await asyncio.sleep(latency)
+        chunk_id = f"chatcmpl-fake-{time.time_ns()}"
+        if tool_calls:
+            for i, call in enumerate(tool_calls):
+                delta = {"role": "assistant", "tool_calls": [dict(call, index=i)]}
+                yield chunk(body, chunk_id, delta, "tool_calls" if i == len(tool_calls) - 1 else None)
+            yield "data: [DONE]\n\n"
+            return
+        words = content.split(" ")
+        for i, word in enumerate(words):
+            delta = {"role": "assistant", "content": word if i == 0 else " " + word}
+            yield chunk(body, chunk_id, delta, None if i < len(words) - 1 else "stop")
+            await asyncio.sleep(0.001)
+        yield "data: [DONE]\n\n"
+
+    return fake_app
+
+
+def create_fake_tool_app(tool_definitions: Dict[str, Dict[str, Any]], latency: float = 0.05) -> FastAPI:
+    """Fake Next.js API with a route for every tool endpoint in `tool_definitions`"""
+    fake_app = FastAPI(title="Fake Tool API")
+    fake_app.state.calls = {name: 0 for name in tool_definitions}
+
+    def make_handler(tool_name: str):
+        async def handler(request: Request):
+            if request.method == "POST":
+                received = await request.json()
+            else:
+                received = dict(request.query_params)
+            received.update(request.path_params)
+            fake_app.state.calls[tool_name] += 1
+            await asyncio.sleep(latency)
+            return {
+                "success": True,
+                "tool": tool_name,
+                "balance": "1.5",
+                "price": 3000.0,
+                "txHash": FAKE_TX_HASH,
+                "address": received.get("address", FAKE_ADDRESS),
+                "received": received
+            }
+        return handler
+
+    for tool_name, tool_def in tool_definitions.items():
+        path = urlsplit(tool_def["endpoint"]).path
+        fake_app.add_api_route(path, make_handler(tool_name), methods=[tool_def["method"]])
+
+    return fake_app
+
+
+def find_free_port(host: str = "127.0.0.1") -> int:
+    """Ask the OS for a currently unused TCP port"""
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class BackgroundServer:
+    """Run an ASGI app with uvicorn on a background thread"""
+
+    def __init__(self, asgi_app: Any, host: str = "127.0.0.1", port: int = 0):
+        config = uvicorn.Config(asgi_app, host=host, port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.host = host
+
+    @property
+    def url(self) -> str:
+        sock = self.server.servers[0].sockets[0]
+        return f"http://{self.host}:{sock.getsockname()[1]}"
+
+    def start(self) -> "BackgroundServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+    def __enter__(self) -> "BackgroundServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,143 @@
+"""
+Precompiled intent router for /agent/chat
+Lowercases a message once, classifies its intent (balance / transfer / swap /
+price / general) from a pluggable rule table and extracts addresses and
+amounts with precompiled patterns. Each scan runs at most once per message
+and only when a handler asks for it, so long pasted messages are not
+re-lowercased and re-scanned by every branch.
+"""
+
+import re
+from typing import List, Dict, Optional, Iterable
+
+
+class IntentRule:
+    """An intent triggered when any of its keywords occurs in the message"""
+
+    def __init__(self, name: str, keywords: Iterable[str]):
+        self.name = name
+        self.keywords = [keyword.lower() for keyword in keywords]
+
+
+# Checked in order; the first rule with a matching keyword wins
+INTENT_RULES = [
+    IntentRule("balance", ["balance", "check balance", "how much"]),
+    IntentRule("transfer", ["transfer", "send"]),
+    IntentRule("swap", ["swap", "exchange"]),
+    IntentRule("price", ["price", "cost", "value"]),
+]
+
+# Token names recognised in price questions, in priority order
+PRICE_TOKENS = ["bitcoin", "ethereum", "btc", "eth", "usdt", "usdc"]
+
+ADDRESS_PATTERN = re.compile(r'0x[a-fA-F0-9]{35,42}')  # Allows partial addresses
+FULL_ADDRESS_PATTERN = re.compile(r'0x[a-fA-F0-9]{40}')
+RECIPIENT_PATTERN = re.compile(r'to\s+(0x[a-f0-9]{35,42})')  # Run on the lowercased message
+AMOUNT_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(eth|usdc|usdt|dai)?')  # Run on the lowercased message
+
+
+class ParsedMessage:
+    """Intent plus lazily extracted, memoized entities of one chat message"""
+
+    def __init__(self, message: str, intent: str, lowered: str, keyword_hits: Dict[str, bool]):
+        self.message = message
+        self.intent = intent
+        self.lowered = lowered
+        self._keyword_hits = keyword_hits
+        self._addresses: Optional[List[str]] = None
+        self._full_addresses: Optional[List[str]] = None
+        self._recipient_scanned = False
+        self._recipient: Optional[str] = None
+        self._amount_scanned = False
+        self._amount_match = None
+
+    def has(self, *keywords: str) -> bool:
+        """True if any keyword occurs in the message (case-insensitive substring)"""
+        for keyword in keywords:
+            hit = self._keyword_hits.get(keyword)
+            if hit is None:
+                hit = self._keyword_hits[keyword] = keyword in self.lowered
+            if hit:
+                return True
+        return False
+
+    def first_keyword(self, candidates: Iterable[str]) -> Optional[str]:
+        """First candidate (in the candidates' order) that occurs in the message"""
+        for candidate in candidates:
+            if self.has(candidate):
+                return candidate
+        return None
+
+    @property
+    def addresses(self) -> List[str]:
+        """Addresses of 0x + 35-42 hex chars, as written"""
+        if self._addresses is None:
+            self._addresses = ADDRESS_PATTERN.findall(self.message)
+        return self._addresses
+
+    @property
+    def full_addresses(self) -> List[str]:
+        """Complete 0x + 40 hex char addresses"""
+        if self._full_addresses is None:
+            self._full_addresses = FULL_ADDRESS_PATTERN.findall(self.message)
+        return self._full_addresses
+
+    @property
+    def recipient(self) -> Optional[str]:
+        """First address written as "to 0x...", in its original case"""
+        if not self._recipient_scanned:
+            self._recipient_scanned = True
+            if len(self.lowered) == len(self.message):
+                match = RECIPIENT_PATTERN.search(self.lowered)
+                if match:
+                    self._recipient = self.message[match.start(1):match.end(1)]
+            else:
+                # Lowercasing changed offsets (non-ASCII text); search the original
+                match = re.search(r'to\s+(0x[a-fA-F0-9]{35,42})', self.message, re.IGNORECASE)
+                if match:
+                    self._recipient = match.group(1)
+        return self._recipient
+
+    def _first_amount(self):
+        if not self._amount_scanned:
+            self._amount_scanned = True
+            self._amount_match = AMOUNT_PATTERN.search(self.lowered)
+        return self._amount_match
+
+    @property
+    def amount(self) -> Optional[str]:
+        match = self._first_amount()
+        return match.group(1) if match else None
+
+    @property
+    def amount_unit(self) -> Optional[str]:
+        match = self._first_amount()
+        return match.group(2) if match else None
+
+
+class IntentRouter:
+    """Classifies messages with an ordered, pluggable rule table"""
+
+    def __init__(self, rules: List[IntentRule] = INTENT_RULES):
+        self.rules = rules
+
+    def parse(self, message: str) -> ParsedMessage:
+        lowered = message.lower()
+        keyword_hits: Dict[str, bool] = {}
+        intent = "general"
+        for rule in self.rules:
+            matched = False
+            for keyword in rule.keywords:
+                hit = keyword_hits.get(keyword)
+                if hit is None:
+                    hit = keyword_hits[keyword] = keyword in lowered
+                if hit:
+                    matched = True
+                    break
+            if matched:
+                intent = rule.name
+                break
+        return ParsedMessage(message, intent, lowered, keyword_hits)
+
+
+intent_router = IntentRouter()
@@ -0,0 +1,348 @@
+"""
+Durable background jobs for long-running workflows
+Submitted jobs are stored in SQLite and picked up by a small pool of workers
+in every process, so the HTTP request returns a job id right away and
+queued jobs survive a restart. Workers record each tool call and result as
+it happens; clients poll or stream the job for progress and the final
+response. A worker holds a lease on the jobs it runs and renews it; jobs
+of a worker that stopped are taken over once the lease expires.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Any, List, Callable, Awaitable, Optional
+
+from shared_state import LazyDatabase
+from structured_logging import get_logger, redact
+
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  # concurrent jobs per process
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "30"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "86400"))  # finished jobs kept this long
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+EventEmitter = Callable[[str, Dict[str, Any]], Awaitable[None]]
+JobRunner = Callable[[Dict[str, Any], EventEmitter], Awaitable[Dict[str, Any]]]
+
+log = get_logger("jobs")
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def empty_progress() -> Dict[str, List[Dict[str, Any]]]:
+    return {"tool_calls": [], "results": []}
+
+
+class JobStore:
+    """Jobs table with lease-based claiming (blocking; run in a thread)"""
+
+    COLUMNS = (
+        "id", "kind", "status", "payload", "progress", "result", "error", "has_secrets",
+        "owner", "lease_until", "attempts", "created", "started", "finished"
+    )
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._database = LazyDatabase(
+            path,
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, payload TEXT NOT NULL, "
+            "progress TEXT NOT NULL, result TEXT, error TEXT, has_secrets INTEGER NOT NULL, "
+            "owner TEXT, lease_until REAL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created REAL NOT NULL, started REAL, finished REAL)",
+            "CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created)"
+        )
+
+    @property
+    def _db(self):
+        return self._database.connection
+
+    def _row(self, row) -> Dict[str, Any]:
+        job = dict(zip(self.COLUMNS, row))
+        job["payload"] = json.loads(job["payload"])
+        job["progress"] = json.loads(job["progress"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        job["has_secrets"] = bool(job["has_secrets"])
+        return job
+
+    def insert(self, job_id: str, kind: str, payload: Dict[str, Any], owner: Optional[str], max_queued: int) -> bool:
+        """Add a queued job; `owner` reserves it for the worker holding its secrets. False when the queue is full"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                queued = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+                if queued >= max_queued:
+                    self._db.execute("ROLLBACK")
+                    return False
+                self._db.execute(
+                    "INSERT INTO jobs (id, kind, status, payload, progress, has_secrets, owner, lease_until, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, QUEUED, json.dumps(payload, default=str), json.dumps(empty_progress()),
+                     owner is not None, owner, now + JOB_LEASE_SECONDS if owner else None, now)
+                )
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return True
+
+    def claim(self, owner: str) -> Optional[Dict[str, Any]]:
+        """Take the oldest runnable job: unreserved or ours, or one whose owner's lease expired
+
+        The returned job carries the status and owner it had before the claim.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    f"SELECT {', '.join(self.COLUMNS)} FROM jobs "
+                    "WHERE (status = ? AND (owner IS NULL OR owner = ?)) "
+                    "OR (status IN (?, ?) AND owner IS NOT NULL AND owner != ? AND lease_until < ?) "
+                    "ORDER BY created LIMIT 1",
+                    (QUEUED, owner, QUEUED, RUNNING, owner, now)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, owner = ?, lease_until = ?, attempts = attempts + 1, "
+                        "started = COALESCE(started, ?) WHERE id = ?",
+                        (RUNNING, owner, now + JOB_LEASE_SECONDS, now, row[0])
+                    )
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return self._row(row) if row is not None else None
+
+    def renew(self, owner: str):
+        """Extend the lease on every unfinished job this worker owns"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time() + JOB_LEASE_SECONDS, owner, QUEUED, RUNNING)
+            )
+
+    def save_progress(self, job_id: str, progress: Dict[str, Any]):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress, default=str), job_id))
+
+    def requeue(self, job_id: str):
+        """Hand a job back to the queue (e.g. on shutdown) for any worker to restart"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, owner = NULL, lease_until = NULL, attempts = attempts - 1, progress = ? WHERE id = ?",
+                (QUEUED, json.dumps(empty_progress()), job_id)
+            )
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished = ?, lease_until = NULL WHERE id = ?",
+                (status, json.dumps(result, default=str) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row) if row is not None else None
+
+    def purge(self, finished_before: float):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?", (*FINISHED, finished_before)
+            )
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
+        counts.update(dict(rows))
+        return counts
+
+
+class JobQueue:
+    """Submits jobs to the store and runs them with JOB_WORKERS tasks per process"""
+
+    def __init__(self, path: str = JOB_STORE_PATH, workers: int = JOB_WORKERS):
+        self.store = JobStore(path)
+        self.workers = workers
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._runners: Dict[str, JobRunner] = {}
+        self._replay_safe: Callable[[Dict[str, Any]], bool] = lambda progress: not progress["tool_calls"]
+        # Secrets (e.g. a private key) are never written to disk; only this process can run their jobs
+        self._secrets: Dict[str, Dict[str, Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, runners: Dict[str, JobRunner], replay_safe: Optional[Callable[[Dict[str, Any]], bool]] = None):
+        """Start the worker pool; `replay_safe(progress)` says whether an interrupted job may start over"""
+        self._runners = runners
+        if replay_safe is not None:
+            self._replay_safe = replay_safe
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, payload: Dict[str, Any], secrets: Optional[Dict[str, Any]] = None) -> str:
+        """Queue a job and return its id; raises JobQueueFull past JOB_MAX_QUEUED"""
+        job_id = uuid.uuid4().hex
+        secrets = {key: value for key, value in (secrets or {}).items() if value is not None}
+        if secrets:
+            self._secrets[job_id] = secrets
+        owner = self.owner if secrets else None
+        if not await asyncio.to_thread(self.store.insert, job_id, kind, payload, owner, JOB_MAX_QUEUED):
+            self._secrets.pop(job_id, None)
+            raise JobQueueFull(f"More than {JOB_MAX_QUEUED} jobs are queued")
+        log.info("job.submitted", job_id=job_id, kind=kind)
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _worker(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await asyncio.to_thread(self.store.claim, self.owner)
+            except Exception as e:
+                log.exception("job.claim_failed", error=str(e))
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # Another job may be waiting; let an idle worker look
+            self._wakeup.set()
+            await self._execute(job)
+
+    async def _maintain(self):
+        """Renew leases and drop old finished jobs"""
+        last_purge = 0.0
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                await asyncio.to_thread(self.store.renew, self.owner)
+                if time.time() - last_purge > 60:
+                    await asyncio.to_thread(self.store.purge, time.time() - JOB_RETENTION_SECONDS)
+                    last_purge = time.time()
+            except Exception as e:
+                log.exception("job.maintenance_failed", error=str(e))
+
+    def _refusal(self, job: Dict[str, Any]) -> Optional[str]:
+        """Why a claimed job must not run (it was taken over or retried too often), if so"""
+        if job["has_secrets"] and job["id"] not in self._secrets:
+            return "Interrupted: the private key was held in memory by a worker that stopped. Please resubmit."
+        if job["status"] == RUNNING and not self._replay_safe(job["progress"]):
+            return "Interrupted after state-changing tool calls; not restarted automatically so they are not repeated."
+        if job["attempts"] + 1 > JOB_MAX_ATTEMPTS:
+            return f"Gave up after {JOB_MAX_ATTEMPTS} attempts"
+        if job["kind"] not in self._runners:
+            return f"Unknown job kind: {job['kind']}"
+        return None
+
+    async def _execute(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        if job["status"] == RUNNING:
+            log.warning("job.taken_over", job_id=job_id, previous_owner=job["owner"])
+        refusal = self._refusal(job)
+        if refusal:
+            log.warning("job.refused", job_id=job_id, reason=refusal)
+            self._secrets.pop(job_id, None)
+            await asyncio.to_thread(self.store.finish, job_id, FAILED, None, refusal)
+            return
+
+        progress = empty_progress()
+        if job["status"] == RUNNING:
+            await asyncio.to_thread(self.store.save_progress, job_id, progress)
+
+        # results[i] belongs to tool_calls[i] (None while running), whatever order calls finish in
+        call_index: Dict[Any, int] = {}
+
+        async def emit(event: str, data: Dict[str, Any]):
+            if event == "tool_call_start":
+                call_index[data.get("call_id")] = len(progress["tool_calls"])
+                progress["tool_calls"].append(redact({"tool": data["tool"], "parameters": data["parameters"]}))
+                progress["results"].append(None)
+            elif event == "tool_result":
+                index = call_index.pop(data.get("call_id"), None)
+                if index is None:
+                    return
+                progress["results"][index] = redact(data["result"])
+            else:
+                return
+            await asyncio.to_thread(self.store.save_progress, job_id, progress)
+
+        payload = dict(job["payload"], **self._secrets.get(job_id, {}))
+        start = time.perf_counter()
+        log.info("job.started", job_id=job_id, kind=job["kind"], attempt=job["attempts"] + 1)
+        try:
+            result = await self._runners[job["kind"]](payload, emit)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back if starting over is harmless, otherwise leave it to the lease
+            if not self._secrets.get(job_id) and self._replay_safe(progress):
+                await asyncio.shield(asyncio.to_thread(self.store.requeue, job_id))
+            raise
+        except Exception as e:
+            log.exception("job.failed", job_id=job_id, error=str(e))
+            await asyncio.to_thread(self.store.finish, job_id, FAILED, None, str(e))
+        else:
+            log.info("job.succeeded", job_id=job_id, duration_ms=round((time.perf_counter() - start) * 1000, 1))
+            await asyncio.to_thread(self.store.finish, job_id, SUCCEEDED, redact(result))
+        self._secrets.pop(job_id, None)
+
+    async def watch(self, job_id: str, emit: EventEmitter, interval: float = 0.5) -> Optional[Dict[str, Any]]:
+        """Emit status changes and new tool calls/results of a job until it finishes; returns the final job
+
+        Events carry `index`, the position of the call in the job's tool_calls.
+        """
+        status = None
+        sent_calls = 0
+        sent_results: set = set()
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                return None
+            if job["status"] != status:
+                status = job["status"]
+                await emit("status", {"status": status, "attempts": job["attempts"]})
+            progress = job["progress"]
+            if len(progress["tool_calls"]) < sent_calls:
+                # The job was restarted from scratch
+                sent_calls = 0
+                sent_results = set()
+            for index in range(sent_calls, len(progress["tool_calls"])):
+                await emit("tool_call_start", dict(progress["tool_calls"][index], index=index))
+            sent_calls = len(progress["tool_calls"])
+            for index, result in enumerate(progress["results"]):
+                if result is not None and index not in sent_results:
+                    await emit("tool_result", {"index": index, "tool": progress["tool_calls"][index]["tool"], "result": result})
+                    sent_results.add(index)
+            if status in FINISHED:
+                return job
+            await asyncio.sleep(interval)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,139 @@
+"""
+Async LLM client shared by the agent loop, code generation and chat
+Wraps AsyncGroq so many chat completions can be in flight per process.
+"""
+
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+
+from groq import AsyncGroq
+
+from metrics import LLM_LATENCY, LLM_IN_FLIGHT, record_usage
+
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "64"))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+
+
+class LLMClient:
+    """Async chat-completions client with a bound on in-flight requests"""
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: Optional[str] = None,
+        max_concurrency: int = GROQ_MAX_CONCURRENCY,
+        timeout: float = GROQ_TIMEOUT
+    ):
+        self._client = AsyncGroq(api_key=api_key, base_url=base_url, timeout=timeout)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def complete(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 4096
+    ):
+        """Run one chat completion and return the raw Groq response"""
+        kwargs = {}
+        if tools:
+            kwargs["tools"] = tools
+            kwargs["tool_choice"] = tool_choice or "auto"
+
+        async with self._semaphore:
+            start = time.perf_counter()
+            status = "error"
+            LLM_IN_FLIGHT.labels(model=model).inc()
+            try:
+                response = await self._client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **kwargs
+                )
+                status = "success"
+            finally:
+                LLM_IN_FLIGHT.labels(model=model).dec()
+                LLM_LATENCY.labels(model=model, status=status).observe(time.perf_counter() - start)
+        record_usage(model, response.usage)
+        return response
+
+    async def stream_message(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        on_token: Callable[[str], Awaitable[None]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 4096
+    ) -> SimpleNamespace:
+        """Stream a chat completion, passing each content delta to `on_token`
+
+        Returns the assembled assistant message with the same `content` /
+        `tool_calls` shape as a non-streamed response.
+        """
+        kwargs = {}
+        if tools:
+            kwargs["tools"] = tools
+            kwargs["tool_choice"] = tool_choice or "auto"
+
+        content_parts = []
+        tool_calls: Dict[int, Dict[str, str]] = {}
+        usage = None
+        async with self._semaphore:
+            start = time.perf_counter()
+            status = "error"
+            LLM_IN_FLIGHT.labels(model=model).inc()
+            try:
+                stream = await self._client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True,
+                    **kwargs
+                )
+                async for chunk in stream:
+                    # Groq reports usage on the final chunk under x_groq
+                    usage = chunk.usage or getattr(chunk.x_groq, "usage", None) or usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        content_parts.append(delta.content)
+                        await on_token(delta.content)
+                    for call in delta.tool_calls or []:
+                        entry = tool_calls.setdefault(call.index, {"id": "", "name": "", "arguments": ""})
+                        if call.id:
+                            entry["id"] = call.id
+                        if call.function:
+                            entry["name"] += call.function.name or ""
+                            entry["arguments"] += call.function.arguments or ""
+                status = "success"
+            finally:
+                LLM_IN_FLIGHT.labels(model=model).dec()
+                LLM_LATENCY.labels(model=model, status=status).observe(time.perf_counter() - start)
+        record_usage(model, usage)
+
+        return SimpleNamespace(
+            content="".join(content_parts) or None,
+            tool_calls=[
+                SimpleNamespace(
+                    id=entry["id"],
+                    type="function",
+                    function=SimpleNamespace(name=entry["name"], arguments=entry["arguments"] or "{}")
+                )
+                for _, entry in sorted(tool_calls.items())
+            ] or None
+        )
+
+    async def aclose(self):
+        """Close the underlying HTTP client"""
+        await self._client.close()
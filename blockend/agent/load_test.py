@@ -0,0 +1,183 @@
+"""
+Offline end-to-end load test for /agent/chat and /agent/workflow
+Starts a fake Groq server (answering with scripted tool_calls) and a fake
+tool API for every TOOL_DEFINITIONS endpoint, runs the agent against them
+and reports throughput, latency percentiles and error rates at increasing
+concurrency. No Groq key or Next.js API needed.
+
+Usage: python load_test.py [--levels 1,10,50] [--requests 100] [--llm-latency 0.2] [--tool-latency 0.05] [--workers 4]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, Any, List, Tuple
+
+import httpx
+
+from fake_services import (
+    BackgroundServer, FAKE_ADDRESS, call_each_tool_once, create_fake_llm_app, create_fake_tool_app, find_free_port
+)
+from main import TOOL_DEFINITIONS
+
+CHAT_MESSAGES = [
+    f"Check balance for {FAKE_ADDRESS}",
+    "What is the price of ethereum?",
+    "What is DeFi and how does yield farming work?",
+]
+
+WORKFLOW_REQUEST = {
+    "tools": [
+        {"tool": "get_balance", "next_tool": "fetch_price"},
+        {"tool": "fetch_price", "next_tool": "transfer"},
+        {"tool": "transfer"},
+    ],
+    "user_message": f"Check my balance and the ETH price, then send 0.01 ETH to {FAKE_ADDRESS}",
+}
+
+
+# Requests are spread over this many wallets so per-user admission caps don't dominate
+# (admission keys users on user_wallet_address, never on user_id)
+LOAD_TEST_USERS = 100
+
+
+def load_test_wallet(i: int) -> str:
+    return f"0x{i % LOAD_TEST_USERS:040x}"
+
+
+def chat_payload(i: int) -> Dict[str, Any]:
+    return {"tools": [], "user_message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)], "user_wallet_address": load_test_wallet(i)}
+
+
+def workflow_payload(i: int) -> Dict[str, Any]:
+    return dict(WORKFLOW_REQUEST, user_wallet_address=load_test_wallet(i))
+
+
+SCENARIOS = {
+    "/agent/chat": chat_payload,
+    "/agent/workflow": workflow_payload,
+}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_level(client: httpx.AsyncClient, path: str, total: int, concurrency: int) -> Dict[str, Any]:
+    """Send `total` requests to `path` with `concurrency` workers"""
+    make_payload = SCENARIOS[path]
+    latencies: List[float] = []
+    errors = 0
+    tool_results = 0
+    tool_failures = 0
+    next_index = iter(range(total))
+
+    async def worker():
+        nonlocal errors, tool_results, tool_failures
+        for i in next_index:
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=make_payload(i))
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+                    continue
+                for result in response.json().get("results", []):
+                    tool_results += 1
+                    if not result.get("success"):
+                        tool_failures += 1
+            except httpx.HTTPError:
+                latencies.append(time.perf_counter() - start)
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "throughput": total / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "error_rate": errors / total,
+        "tool_failure_rate": tool_failures / tool_results if tool_results else 0.0
+    }
+
+
+def start_agent(llm_url: str, tool_url: str, workers: int = 1) -> Tuple[subprocess.Popen, str]:
+    """Launch the agent (via serve.py) in a subprocess wired to the fake services"""
+    port = find_free_port()
+    env = dict(os.environ, GROQ_API_KEY="fake-key", GROQ_BASE_URL=llm_url, TOOL_API_BASE_URL=tool_url)
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL
+    )
+    agent_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Agent server exited during startup")
+        try:
+            if httpx.get(f"{agent_url}/health").status_code == 200:
+                return process, agent_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Agent server did not become healthy within 30 seconds")
+
+
+async def run_load_test(agent_url: str, levels: List[int], total: int):
+    print(f"{'endpoint':<18}{'conc':>6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>9}{'tool fail':>11}")
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=agent_url, timeout=120, limits=limits) as client:
+        for path in SCENARIOS:
+            for concurrency in levels:
+                stats = await run_level(client, path, max(total, concurrency), concurrency)
+                print(
+                    f"{path:<18}{concurrency:>6}{stats['throughput']:>9.1f}"
+                    f"{stats['p50'] * 1000:>9.0f}{stats['p95'] * 1000:>9.0f}{stats['p99'] * 1000:>9.0f}"
+                    f"{stats['error_rate']:>9.1%}{stats['tool_failure_rate']:>11.1%}"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the agent endpoints")
+    parser.add_argument("--levels", default="1,5,10,25,50", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per endpoint and level")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Fake LLM latency in seconds")
+    parser.add_argument("--tool-latency", type=float, default=0.05, help="Fake tool API latency in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="Agent worker processes")
+    args = parser.parse_args()
+    levels = [int(level) for level in args.levels.split(",")]
+
+    llm_app = create_fake_llm_app(latency=args.llm_latency, script=call_each_tool_once)
+    tool_app = create_fake_tool_app(TOOL_DEFINITIONS, latency=args.tool_latency)
+    with BackgroundServer(llm_app) as llm_server, BackgroundServer(tool_app) as tool_server:
+        process, agent_url = start_agent(llm_server.url, tool_server.url, args.workers)
+        try:
+            print("=" * 80)
+            print(
+                f"LOAD TEST  workers={args.workers}  llm latency={args.llm_latency}s  "
+                f"tool latency={args.tool_latency}s  requests/level={args.requests}"
+            )
+            print("=" * 80)
+            asyncio.run(run_load_test(agent_url, levels, args.requests))
+            calls = ", ".join(f"{name}={count}" for name, count in tool_app.state.calls.items() if count)
+            print(f"\nFake tool API calls: {calls or 'none'}")
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,62 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import os
 from dotenv import load_dotenv
 import json
-import requests
+import hashlib
+import asyncio
+import httpx
 import uvicorn
-from groq import Groq
 import re
+import time
+import itertools
+from functools import lru_cache
+from contextlib import asynccontextmanager
+from tool_transport import tool_transport
+from circuit_breaker import tool_breakers, HALF_OPEN
+from retry_policy import retry_policy
+from llm_client import LLMClient
+from model_router import ModelRouter
+from tool_dispatch import dispatch_tool_calls
+from workflow_dag import WorkflowDAG, WorkflowError, describe_edge
+from tool_cache import tool_cache, TOOL_CACHE_DEFAULT_TTL
+from event_stream import sse_response, EventEmitter, progress_only, wants_tokens
+from intent_router import intent_router, PRICE_TOKENS, FULL_ADDRESS_PATTERN
+from context_budget import ConversationContext, ToolTurn
+from tool_projection import project_result
+from batch_executor import batch_executor
+from job_queue import job_queue, JobQueueFull
+from plan_cache import plan_cache, message_template, substitute
+from code_cache import code_cache, make_key as code_cache_key
+from session_store import session_store, SESSION_FIELDS
+from admission import AdmissionMiddleware, admission
+from metrics import InFlightMiddleware, render_metrics, mark_worker_exited, TOOL_LATENCY, AGENT_ITERATIONS, WORKFLOW_TOOL_CALLS, PLAN_CACHE_LOOKUPS
+from structured_logging import get_logger, register_secret_fields, LogContextMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST
 
 load_dotenv()
 
-app = FastAPI(title="NCP AI Agent Builder with Groq")
+log = get_logger("main")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start this process's background job workers; on shutdown stop them, then close pooled tool API and LLM connections"""
+    job_queue.start({"workflow": run_workflow_job}, replay_safe=job_replay_safe)
+    try:
+        yield
+    finally:
+        await job_queue.stop()
+        await tool_transport.aclose()
+        if llm_client:
+            await llm_client.aclose()
+        mark_worker_exited()
+
+app = FastAPI(title="NCP AI Agent Builder with Groq", lifespan=lifespan)
+
+# Concurrency caps and queueing for POST routes (inside CORS so 429s carry CORS headers)
+app.add_middleware(AdmissionMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -22,21 +66,29 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(InFlightMiddleware)
+app.add_middleware(LogContextMiddleware)
 
 # Initialize Groq client with environment variable fallback
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
-
-print(f"Using Groq API Key: {GROQ_API_KEY[:20]}...")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None  # Point at a compatible server for local testing
 
 try:
-    groq_client = Groq(api_key=GROQ_API_KEY)
-    print("Groq client initialized successfully")
+    llm_client = LLMClient(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL)
+    log.info("groq.client_initialized", api_key_configured=bool(GROQ_API_KEY), base_url=GROQ_BASE_URL)
 except Exception as e:
-    print(f"Warning: Failed to initialize Groq client: {e}")
-    groq_client = None
+    log.warning("groq.client_init_failed", error=str(e))
+    llm_client = None
+
+# Picks, hedges and fails over between the models configured per task (see model_router.py)
+model_router = ModelRouter(llm_client) if llm_client else None
 
-# Store user data for context (in production, use a proper database)
-user_data = {}
+# Base URL of the Next.js tool API (override to point at another deployment or a fake server)
+TOOL_API_BASE_URL = os.getenv("TOOL_API_BASE_URL", "http://localhost:3000").rstrip("/")
+
+# Bulk balance lookups (/agent/balances)
+BULK_BALANCE_MAX_ADDRESSES = int(os.getenv("BULK_BALANCE_MAX_ADDRESSES", "1000"))
+BULK_BALANCE_CONCURRENCY = int(os.getenv("BULK_BALANCE_CONCURRENCY", "16"))
 
 # Tool Definitions for Web3 Operations using External APIs
 TOOL_DEFINITIONS = {
@@ -57,8 +109,12 @@ TOOL_DEFINITIONS = {
             },
             "required": ["fromAddress", "toAddress", "amount", "userAddress", "nodeId"]
         },
-        "endpoint": "http://localhost:3000/api/transfer",
-        "method": "POST"
+        "endpoint": f"{TOOL_API_BASE_URL}/api/transfer",
+        "method": "POST",
+        "invalidates": ["fromAddress", "toAddress"],  # Cached balances made stale by this tool
+        # Payload fields passed on to the LLM and client (the rest only with full_tool_results)
+        # Mirrors the prepared-UserOperation payload of frontend/app/api/transfer/route.ts
+        "output_fields": ["type", "from", "to", "recipient", "amount", "amountWei", "nodeId", "data", "tokenAddress", "tokenDecimals", "message"]
     },
     "swap": {
         "name": "swap",
@@ -74,8 +130,11 @@ TOOL_DEFINITIONS = {
             },
             "required": ["privateKey", "tokenIn", "tokenOut", "amountIn", "slippageTolerance"]
         },
-        "endpoint": "http://localhost:3000/api/swap",
-        "method": "POST"
+        "endpoint": f"{TOOL_API_BASE_URL}/api/swap",
+        "method": "POST",
+        "secret_fields": ["privateKey"],
+        "invalidates": "all",  # Signer address is only known via privateKey
+        "output_fields": ["transactionHash", "txHash", "status", "tokenIn", "tokenOut", "amountIn", "amountOut"]
     },
     "get_balance": {
         "name": "get_balance",
@@ -87,8 +146,11 @@ TOOL_DEFINITIONS = {
             },
             "required": ["address"]
         },
-        "endpoint": "http://localhost:3000/api/balance/{address}",
-        "method": "GET"
+        "endpoint": f"{TOOL_API_BASE_URL}/api/balance/{{address}}",
+        "method": "GET",
+        "read_only": True,
+        "cache_ttl": 10,
+        "output_fields": ["address", "balance", "decimals", "symbol"]
     },
     "deploy_erc20": {
         "name": "deploy_erc20",
@@ -103,8 +165,9 @@ TOOL_DEFINITIONS = {
             },
             "required": ["privateKey", "name", "symbol", "initialSupply"]
         },
-        "endpoint": "http://localhost:3000/api/deploy-token",
-        "method": "POST"
+        "endpoint": f"{TOOL_API_BASE_URL}/api/deploy-token",
+        "method": "POST",
+        "secret_fields": ["privateKey"]
     },
     "deploy_erc721": {
         "name": "deploy_erc721",
@@ -118,8 +181,9 @@ TOOL_DEFINITIONS = {
             },
             "required": ["privateKey", "name", "symbol"]
         },
-        "endpoint": "http://localhost:3000/api/create-nft-collection",
-        "method": "POST"
+        "endpoint": f"{TOOL_API_BASE_URL}/api/create-nft-collection",
+        "method": "POST",
+        "secret_fields": ["privateKey"]
     },
     "create_dao": {
         "name": "create_dao",
@@ -134,8 +198,9 @@ TOOL_DEFINITIONS = {
             },
             "required": ["privateKey", "name", "votingPeriod", "quorumPercentage"]
         },
-        "endpoint": "http://localhost:3000/api/create-dao",
-        "method": "POST"
+        "endpoint": f"{TOOL_API_BASE_URL}/api/create-dao",
+        "method": "POST",
+        "secret_fields": ["privateKey"]
     },
     "airdrop": {
         "name": "airdrop",
@@ -149,8 +214,16 @@ TOOL_DEFINITIONS = {
             },
             "required": ["privateKey", "recipients", "amount"]
         },
-        "endpoint": "http://localhost:3000/api/airdrop",
-        "method": "POST"
+        "endpoint": f"{TOOL_API_BASE_URL}/api/airdrop",
+        "method": "POST",
+        "secret_fields": ["privateKey"],
+        "invalidates": "all",
+        # Large recipient lists are sent in resumable chunks (batch_executor.py)
+        "batch": {
+            "field": "recipients",
+            "chunk_size": int(os.getenv("AIRDROP_CHUNK_SIZE", "200")),
+            "concurrency": int(os.getenv("AIRDROP_CONCURRENCY", "4"))
+        }
     },
     "fetch_price": {
         "name": "fetch_price",
@@ -162,8 +235,11 @@ TOOL_DEFINITIONS = {
             },
             "required": ["query"]
         },
-        "endpoint": "http://localhost:3000/api/token-price",
-        "method": "POST"
+        "endpoint": f"{TOOL_API_BASE_URL}/api/token-price",
+        "method": "POST",
+        "read_only": True,
+        "cache_ttl": 15,
+        "output_fields": ["response", "price", "prices", "symbol"]
     },
     "deposit_yield": {
         "name": "deposit_yield",
@@ -178,8 +254,10 @@ TOOL_DEFINITIONS = {
             },
             "required": ["privateKey", "tokenAddress", "depositAmount", "apyPercent"]
         },
-        "endpoint": "http://localhost:3000/api/yield",
-        "method": "POST"
+        "endpoint": f"{TOOL_API_BASE_URL}/api/yield",
+        "method": "POST",
+        "secret_fields": ["privateKey"],
+        "invalidates": "all"
     },
     "wallet_analytics": {
         "name": "wallet_analytics",
@@ -191,16 +269,29 @@ TOOL_DEFINITIONS = {
             },
             "required": ["address"]
         },
-        "endpoint": "http://localhost:3000/api/address/{address}/balance/erc20",
-        "method": "GET"
+        "endpoint": f"{TOOL_API_BASE_URL}/api/address/{{address}}/balance/erc20",
+        "method": "GET",
+        "read_only": True,
+        "cache_ttl": 30,
+        "output_fields": [
+            "address", "walletAddress", "network",
+            "tokens[].tokenAddress", "tokens[].address", "tokens[].symbol", "tokens[].balance", "tokens[].decimals"
+        ]
     }
 }
 
+# Never log values of fields the tools declare as secret
+register_secret_fields(
+    field for tool_def in TOOL_DEFINITIONS.values() for field in tool_def.get("secret_fields", [])
+)
+
 # Pydantic Models
 class ToolConnection(BaseModel):
     tool: str
-    next_tool: Optional[str] = None
+    next_tool: Optional[str] = None  # Tool name, or node_id of the successor node
     condition: Optional[str] = None  # For conditional execution
+    node_id: Optional[str] = None  # Distinguishes several nodes using the same tool
+    parameters: Optional[Dict[str, Any]] = None  # Inputs for direct DAG execution, may use {{node.path}}
 
 class AgentRequest(BaseModel):
     tools: List[ToolConnection]
@@ -212,6 +303,9 @@ class AgentRequest(BaseModel):
     original_message: Optional[str] = None
     user_wallet_address: Optional[str] = None  # Connected wallet (EOA)
     smart_accounts: Optional[Dict[str, str]] = None  # Map of nodeId -> smartAccountAddress
+    parallel_tool_calls: bool = True  # Run independent tool calls of one turn concurrently
+    full_tool_results: bool = False  # Return raw tool API payloads instead of their output_fields projection
+    use_plan_cache: bool = True  # Replay a learned tool plan for this workflow shape instead of calling the LLM
 
 class ChatRequest(BaseModel):
     message: str
@@ -221,36 +315,71 @@ class ChatRequest(BaseModel):
     user_wallet_address: Optional[str] = None  # Connected wallet (EOA)
     smart_accounts: Optional[Dict[str, str]] = None  # Map of nodeId -> smartAccountAddress
 
+class SessionClearRequest(BaseModel):
+    user_wallet_address: str  # The connected wallet whose sessions are forgotten
+
 class AgentResponse(BaseModel):
     agent_response: str
     tool_calls: List[Dict[str, Any]]
     results: List[Dict[str, Any]]
     workflow_summary: str
 
+class BalancesRequest(BaseModel):
+    addresses: List[str] = []
+    smart_accounts: Optional[Dict[str, str]] = None  # Map of nodeId -> smartAccountAddress
+    include_analytics: bool = False  # Also fetch ERC-20 holdings via wallet_analytics
+    full_tool_results: bool = False
+
+class BalancesResponse(BaseModel):
+    balances: List[Dict[str, Any]]
+    succeeded: int
+    failed: int
+
 class CodeGenerationRequest(BaseModel):
     workflow_description: str
     tools_used: List[str]
     programming_language: str = "python"
+    regenerate: bool = False  # Skip the cache and overwrite the stored result
 
 class CodeGenerationResponse(BaseModel):
     generated_code: str
     explanation: str
     dependencies: List[str]
+    cached: bool = False
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str  # queued, running, succeeded or failed
+    attempts: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    tool_calls: List[Dict[str, Any]]  # recorded as they happen; the final response has the complete list
+    results: List[Optional[Dict[str, Any]]]  # results[i] belongs to tool_calls[i]; None while it runs
+    response: Optional[AgentResponse] = None
+    error: Optional[str] = None
 
 # Helper Functions
 def build_system_prompt(tool_connections: List[ToolConnection]) -> str:
     """Build a dynamic system prompt based on connected tools for Web3 operations"""
+    return compile_system_prompt(WorkflowDAG(tool_connections, acyclic=False).canonical_key())
+
+@lru_cache(maxsize=256)
+def compile_system_prompt(graph_key: tuple) -> str:
+    """Render the system prompt for a canonical tool graph
     
-    unique_tools = set()
-    tool_flow = {}
-    
-    for conn in tool_connections:
-        unique_tools.add(conn.tool)
-        if conn.next_tool:
-            unique_tools.add(conn.next_tool)
-            tool_flow[conn.tool] = conn.next_tool
-    
-    has_sequential = any(conn.next_tool for conn in tool_connections)
+    Memoized and byte-stable for a given graph shape, so repeated workflows
+    reuse one string and provider-side prompt-prefix caching can apply.
+    """
+    nodes, edges = graph_key
+    node_tools = dict(nodes)
+    unique_tools = sorted(set(node_tools.values()))
+    has_sequential = bool(edges)
     
     system_prompt = """You are an AI agent specialized in Web3 and blockchain operations. You help users build and execute Web3 workflows using smart contracts, DeFi protocols, and blockchain interactions.
 
@@ -264,9 +393,9 @@ AVAILABLE WEB3 TOOLS:
     
     if has_sequential:
         system_prompt += "\n\nWORKFLOW EXECUTION:\n"
-        system_prompt += "Tools are connected in a workflow sequence. Execute them in the specified order:\n"
-        for tool, next_tool in tool_flow.items():
-            system_prompt += f"- {tool} → {next_tool}\n"
+        system_prompt += "Tools are connected in a workflow graph. Execute each tool after the tools that point to it:\n"
+        for source, target, condition in edges:
+            system_prompt += f"- {describe_edge(source, target, condition, node_tools)}\n"
         
         system_prompt += """
 WORKFLOW EXECUTION RULES:
@@ -298,7 +427,51 @@ RESPONSE FORMAT:
     
     return system_prompt
 
-def execute_tool(tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+async def execute_tool(tool_name: str, parameters: Dict[str, Any], full_result: bool = False) -> Dict[str, Any]:
+    """Execute a Web3 tool, serving read-only tools from the result cache
+    
+    The result is reduced to the tool's `output_fields` unless `full_result` is set.
+    """
+    
+    start = time.perf_counter()
+    tool_def = TOOL_DEFINITIONS.get(tool_name)
+    if tool_def and tool_def.get("read_only"):
+        # Read-only calls are idempotent: safe to retry and to hedge past the endpoint's p95
+        hedge_after = tool_breakers.get(tool_name, tool_transport.get_timeout(tool_def)).hedge_delay()
+        result = await tool_cache.get_or_fetch(
+            tool_name,
+            parameters,
+            tool_def.get("cache_ttl", TOOL_CACHE_DEFAULT_TTL),
+            lambda: retry_policy.call(tool_name, lambda: call_tool_api(tool_name, parameters), hedge_after)
+        )
+    else:
+        batch = tool_def.get("batch") if tool_def else None
+        if batch and len(parameters.get(batch["field"]) or []) > batch["chunk_size"]:
+            result = await batch_executor.run(tool_name, parameters, batch, call_tool_api)
+        else:
+            result = await call_tool_api(tool_name, parameters)
+        
+        # Invalidate even on failure: a timed out write may still have landed
+        invalidates = tool_def.get("invalidates") if tool_def else None
+        # A signer given only as privateKey (chat fallback) has no address to invalidate by
+        signer_unknown = bool(invalidates) and parameters.get("privateKey") and not parameters.get("fromAddress")
+        if invalidates == "all" or signer_unknown:
+            await tool_cache.invalidate_all_addresses()
+        elif invalidates:
+            addresses = []
+            for field in invalidates:
+                value = parameters.get(field)
+                addresses.extend(value if isinstance(value, list) else [value])
+            await tool_cache.invalidate_addresses(addresses)
+    
+    TOOL_LATENCY.labels(
+        tool=tool_name if tool_def else "unknown",
+        status="success" if result.get("success") else "error"
+    ).observe(time.perf_counter() - start)
+    
+    return result if full_result else project_result(result, tool_def)
+
+async def call_tool_api(tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
     """Execute a Web3 tool by calling its real API endpoint"""
     
     try:
@@ -312,7 +485,7 @@ def execute_tool(tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
         endpoint = tool_def["endpoint"]
         method = tool_def["method"]
         
-        print(f"Executing tool: {tool_name} with parameters: {parameters}")
+        log.debug("tool.execute", tool=tool_name, parameters=parameters)
         
         # Handle URL parameters for GET requests
         if "{address}" in endpoint:
@@ -322,69 +495,81 @@ def execute_tool(tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
                 if method == "GET":
                     parameters = {k: v for k, v in parameters.items() if k != "address"}
         
-        headers = {"Content-Type": "application/json"}
+        if method not in ("POST", "GET"):
+            return {
+                "success": False,
+                "tool": tool_name,
+                "error": f"Unsupported HTTP method: {method}"
+            }
+        
+        # Fail fast while the endpoint's breaker is open
+        breaker = tool_breakers.get(tool_name, tool_transport.get_timeout(tool_def))
+        if not breaker.allow():
+            return {
+                "success": False,
+                "tool": tool_name,
+                "error": f"{tool_name} API is unavailable after repeated failures (circuit open, retry in {breaker.retry_in():.0f}s)",
+                "circuit_open": True
+            }
+        probe = breaker.state == HALF_OPEN
+        # Writes keep the full timeout unless they opt in: cutting one short may hide a landed transaction
+        adaptive = tool_def.get("adaptive_timeout", tool_def.get("read_only", False))
+        timeout = breaker.timeout() if adaptive else breaker.max_timeout
         
+        start = time.perf_counter()
+        recorded = False
         try:
             if method == "POST":
-                print(f"Making POST request to: {endpoint}")
-                response = requests.post(endpoint, json=parameters, headers=headers, timeout=30)
-                print(f"Response status: {response.status_code}")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return {
-                        "success": True,
-                        "tool": tool_name,
-                        "result": result,
-                        "endpoint": endpoint
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "tool": tool_name,
-                        "error": f"API returned status {response.status_code}: {response.text}",
-                        "endpoint": endpoint
-                    }
-                    
-            elif method == "GET":
-                print(f"Making GET request to: {endpoint}")
-                response = requests.get(endpoint, params=parameters, headers=headers, timeout=30)
-                print(f"Response status: {response.status_code}")
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    return {
-                        "success": True,
-                        "tool": tool_name,
-                        "result": result,
-                        "endpoint": endpoint
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "tool": tool_name,
-                        "error": f"API returned status {response.status_code}: {response.text}",
-                        "endpoint": endpoint
-                    }
+                response = await tool_transport.request(tool_def, "POST", endpoint, json=parameters, timeout=timeout)
+            else:
+                response = await tool_transport.request(tool_def, "GET", endpoint, params=parameters, timeout=timeout)
+            log.info("tool.response", tool=tool_name, method=method, endpoint=endpoint, status=response.status_code)
+            
+            # Client errors mean the endpoint is up; only 5xx counts against it
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success(time.perf_counter() - start)
+            recorded = True
+            
+            if response.status_code == 200:
+                result = response.json()
+                return {
+                    "success": True,
+                    "tool": tool_name,
+                    "result": result,
+                    "endpoint": endpoint
+                }
             else:
                 return {
                     "success": False,
                     "tool": tool_name,
-                    "error": f"Unsupported HTTP method: {method}"
+                    "error": f"API returned status {response.status_code}: {response.text}",
+                    "endpoint": endpoint,
+                    "retryable": response.status_code >= 500
                 }
                 
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
+            breaker.record_failure()
+            recorded = True
             return {
                 "success": False,
                 "tool": tool_name,
-                "error": "API request timed out after 30 seconds"
+                "error": f"API request timed out after {timeout:.3g} seconds",
+                "retryable": True
             }
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
+            breaker.record_failure()
+            recorded = True
             return {
                 "success": False,
                 "tool": tool_name,
-                "error": f"Network error: {str(e)}"
+                "error": f"Network error: {str(e)}",
+                "retryable": True
             }
+        finally:
+            if probe and not recorded:
+                breaker.release_probe()
             
     except Exception as e:
         return {
@@ -413,7 +598,15 @@ def extract_transfer_params(message: str) -> Dict[str, str]:
     return result
 
 def get_groq_tools(tool_names: List[str]) -> List[Dict[str, Any]]:
-    """Convert tool definitions to Groq function calling format"""
+    """Convert tool definitions to Groq function calling format
+    
+    The returned list is shared between requests and must not be mutated.
+    """
+    return compile_groq_tools(tuple(sorted(set(tool_names))))
+
+@lru_cache(maxsize=256)
+def compile_groq_tools(tool_names: tuple) -> List[Dict[str, Any]]:
+    """Build the Groq tool array for a sorted tuple of tool names (memoized)"""
     
     tools = []
     for tool_name in tool_names:
@@ -430,98 +623,134 @@ def get_groq_tools(tool_names: List[str]) -> List[Dict[str, Any]]:
     
     return tools
 
-def process_agent_conversation(
+async def request_completion(emit: Optional[EventEmitter] = None, task: str = "agent", **kwargs):
+    """Run a Groq completion for `task` via the model router and return the assistant message, streaming tokens to `emit` if it wants them"""
+    if not model_router:
+        raise Exception("Groq client not initialized")
+    
+    if wants_tokens(emit):
+        async def on_token(text: str):
+            await emit("token", {"content": text})
+        async def on_reset(model: str, error: str):
+            # The failed model's partial text must be dropped before the next model streams
+            await emit("reset", {"model": model, "error": error})
+        return await model_router.stream_message(task, on_token=on_token, on_reset=on_reset, **kwargs)
+    
+    response = await model_router.complete(task, **kwargs)
+    return response.choices[0].message
+
+# Pairs tool_call_start and tool_result events of one call when calls run concurrently
+TOOL_CALL_IDS = itertools.count(1)
+
+async def execute_tool_with_events(
+    tool_name: str,
+    parameters: Dict[str, Any],
+    emit: Optional[EventEmitter] = None,
+    full_result: bool = False
+) -> Dict[str, Any]:
+    """execute_tool that reports start and result events when streaming; `call_id` pairs the two"""
+    call_id = next(TOOL_CALL_IDS)
+    if emit:
+        await emit("tool_call_start", {"call_id": call_id, "tool": tool_name, "parameters": parameters})
+    result = await execute_tool(tool_name, parameters, full_result)
+    if emit:
+        await emit("tool_result", {"call_id": call_id, "tool": tool_name, "result": result})
+    return result
+
+async def process_agent_conversation(
     system_prompt: str,
     user_message: str,
     available_tools: List[str],
-    tool_flow: Dict[str, str],
+    tool_flow: Dict[str, List[str]],
     private_key: Optional[str] = None,
     context: Optional[Dict[str, Any]] = None,
-    max_iterations: int = 10
+    max_iterations: int = 10,
+    parallel_tool_calls: bool = True,
+    full_tool_results: bool = False,
+    emit: Optional[EventEmitter] = None
 ) -> Dict[str, Any]:
-    """Process conversation with Groq AI agent"""
+    """Process conversation with Groq AI agent, streaming progress to `emit` if given"""
     
     # Add context to system prompt
     if private_key:
         system_prompt += f"\n\nCONTEXT: Private key is available for transaction signing."
     
     if context:
-        system_prompt += f"\n\nADDITIONAL CONTEXT: {json.dumps(context, indent=2)}"
+        system_prompt += f"\n\nADDITIONAL CONTEXT: {json.dumps(context, indent=2, sort_keys=True)}"
     
-    messages = [
-        {"role": "system", "content": system_prompt},
-        {"role": "user", "content": user_message}
-    ]
+    # Older tool results are compacted so each prompt stays within the token budget
+    conversation = ConversationContext(system_prompt, user_message)
     
     # Get Groq formatted tools
     groq_tools = get_groq_tools(available_tools)
     
     all_tool_calls = []
     all_tool_results = []
+    tool_turns = []  # Calls grouped by assistant turn, for the plan cache
     iteration = 0
     
     while iteration < max_iterations:
         iteration += 1
+        messages = conversation.messages()
+        log.debug("agent.iteration", iteration=iteration, prompt_tokens=conversation.last_prompt_tokens, messages=len(messages))
         
-        # Call Groq API
+        # Call Groq API (the router falls back to the non-tool model if the tool-use model fails)
         try:
-            if not groq_client:
-                raise Exception("Groq client not initialized")
-                
-            response = groq_client.chat.completions.create(
-                model="llama3-groq-70b-8192-tool-use-preview",  # Groq's tool-use enabled model
+            assistant_message = await request_completion(
+                emit,
+                task="agent",
                 messages=messages,
-                tools=groq_tools if groq_tools else None,
-                tool_choice="auto" if groq_tools else None,
+                tools=groq_tools,
+                tool_choice="auto",
                 temperature=0.7,
                 max_tokens=4096
             )
         except Exception as e:
-            print(f"Tool model error: {e}, falling back to standard model")
-            # Fallback to non-tool model if tool model fails
-            try:
-                if not groq_client:
-                    raise Exception("Groq client not initialized")
-                    
-                response = groq_client.chat.completions.create(
-                    model="llama3-70b-8192",
-                    messages=messages,
-                    temperature=0.7,
-                    max_tokens=4096
-                )
-            except Exception as e2:
-                print(f"Fallback model error: {e2}")
-                # Return a simulated response if both fail
-                return {
-                    "agent_response": f"I'm currently having trouble connecting to my AI backend. Error: {str(e2)}. However, I can still simulate the requested operations.",
-                    "tool_calls": all_tool_calls,
-                    "results": all_tool_results,
-                    "workflow_summary": generate_workflow_summary(all_tool_calls, all_tool_results),
-                    "conversation_history": messages
-                }
-        
-        assistant_message = response.choices[0].message
+            log.error("agent.llm_failed", error=str(e))
+            AGENT_ITERATIONS.observe(iteration)
+            # Return a simulated response if every model fails
+            return {
+                "agent_response": f"I'm currently having trouble connecting to my AI backend. Error: {str(e)}. However, I can still simulate the requested operations.",
+                "tool_calls": all_tool_calls,
+                "results": all_tool_results,
+                "workflow_summary": generate_workflow_summary(all_tool_calls, all_tool_results),
+                "conversation_history": conversation.history(),
+                "tool_turns": tool_turns
+            }
         
         # Check if there are tool calls
         if not hasattr(assistant_message, 'tool_calls') or not assistant_message.tool_calls:
             # No more tool calls, return final response
+            AGENT_ITERATIONS.observe(iteration)
             workflow_summary = generate_workflow_summary(all_tool_calls, all_tool_results)
             return {
                 "agent_response": assistant_message.content,
                 "tool_calls": all_tool_calls,
                 "results": all_tool_results,
                 "workflow_summary": workflow_summary,
-                "conversation_history": messages
+                "conversation_history": conversation.history(),
+                "tool_turns": tool_turns
             }
         
         # Process tool calls
         if hasattr(assistant_message, 'tool_calls') and assistant_message.tool_calls:
-            messages.append({
+            assistant_entry = {
                 "role": "assistant",
                 "content": assistant_message.content,
-                "tool_calls": assistant_message.tool_calls
-            })
+                "tool_calls": [
+                    {
+                        "id": tool_call.id,
+                        "type": "function",
+                        "function": {
+                            "name": tool_call.function.name,
+                            "arguments": tool_call.function.arguments
+                        }
+                    }
+                    for tool_call in assistant_message.tool_calls
+                ]
+            }
             
+            prepared_calls = []
             for tool_call in assistant_message.tool_calls:
                 function_name = tool_call.function.name
                 function_args = json.loads(tool_call.function.arguments)
@@ -535,41 +764,45 @@ def process_agent_conversation(
                     "tool": function_name,
                     "parameters": function_args
                 })
-                
-                # Execute the tool
-                result = execute_tool(function_name, function_args)
+                prepared_calls.append((function_name, function_args))
+            
+            async def run_tool(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+                return await execute_tool_with_events(name, args, emit, full_tool_results)
+            
+            tool_turns.append(list(prepared_calls))
+            
+            # Execute the tools, concurrently unless they share a signer
+            if parallel_tool_calls:
+                results = await dispatch_tool_calls(prepared_calls, run_tool)
+            else:
+                results = [await run_tool(name, args) for name, args in prepared_calls]
+            
+            tool_results = []
+            for tool_call, (function_name, _), result in zip(assistant_message.tool_calls, prepared_calls, results):
                 all_tool_results.append(result)
-                
-                # Add tool result to messages
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": json.dumps(result)
-                })
-        else:
-            # No tool calls, just add the assistant message and continue
-            messages.append({
-                "role": "assistant", 
-                "content": assistant_message.content
-            })
-        
-        # Check for sequential execution
-        last_tool_executed = all_tool_calls[-1]["tool"]
-        if last_tool_executed in tool_flow:
-            next_tool = tool_flow[last_tool_executed]
-            messages.append({
-                "role": "system",
-                "content": f"Now execute {next_tool} as the next step in the workflow sequence."
-            })
+                # The model always sees the projected result, even when the client asked for full payloads
+                tool_results.append((tool_call.id, function_name, project_result(result, TOOL_DEFINITIONS.get(function_name))))
+            
+            # Check for sequential execution
+            hint = None
+            last_tool_executed = all_tool_calls[-1]["tool"]
+            if last_tool_executed in tool_flow:
+                next_tools = ", ".join(tool_flow[last_tool_executed])
+                hint = f"Now execute {next_tools} as the next step in the workflow sequence."
+            
+            # Add the assistant turn and its tool results to the conversation
+            conversation.add_turn(ToolTurn(assistant_entry, tool_results, hint))
     
     # Max iterations reached
+    AGENT_ITERATIONS.observe(iteration)
     workflow_summary = generate_workflow_summary(all_tool_calls, all_tool_results)
     return {
         "agent_response": "Workflow execution completed (max iterations reached).",
         "tool_calls": all_tool_calls,
         "results": all_tool_results,
         "workflow_summary": workflow_summary,
-        "conversation_history": messages
+        "conversation_history": conversation.history(),
+        "tool_turns": tool_turns
     }
 
 def generate_workflow_summary(tool_calls: List[Dict], results: List[Dict]) -> str:
@@ -586,8 +819,57 @@ def generate_workflow_summary(tool_calls: List[Dict], results: List[Dict]) -> st
     
     return summary
 
-def generate_code_from_workflow(workflow_description: str, tools_used: List[str], language: str = "python") -> Dict[str, Any]:
-    """Generate code based on workflow description using Groq"""
+def describe_tool_results(tool_calls: List[Dict], results: List[Dict]) -> str:
+    """Answer built from the tool results themselves, for runs without an LLM reply (e.g. a replayed plan)"""
+    if not tool_calls:
+        return "No operations were executed."
+    
+    lines = []
+    for call, result in zip(tool_calls, results):
+        tool_name = call["tool"]
+        if not result.get("success"):
+            lines.append(f"❌ **{tool_name}** failed: {result.get('error', 'unknown error')}")
+            continue
+        payload = result.get("result")
+        # Look inside the API's {"success", "result": {...}} envelope
+        if isinstance(payload, dict) and isinstance(payload.get("result"), dict):
+            payload = payload["result"]
+        if isinstance(payload, dict):
+            details = ", ".join(
+                f"{key}: {value}" for key, value in payload.items()
+                if key != "success" and isinstance(value, (str, int, float, bool))
+            )
+        else:
+            details = str(payload) if payload is not None else ""
+        lines.append(f"✅ **{tool_name}**" + (f" — {details}" if details else ""))
+    return "\n".join(lines)
+
+async def generate_code_from_workflow(
+    workflow_description: str,
+    tools_used: List[str],
+    language: str = "python",
+    regenerate: bool = False
+) -> Dict[str, Any]:
+    """Generate code based on workflow description using Groq, served from code_cache when possible"""
+    # Keyed on the configured models so changing them doesn't serve stale code
+    models = model_router.models_key("code") if model_router else ""
+    key = code_cache_key(workflow_description, tools_used, language, models)
+    
+    async def generate() -> Dict[str, Any]:
+        return await request_generated_code(workflow_description, tools_used, language)
+    
+    try:
+        return await code_cache.get_or_generate(key, generate, refresh=regenerate)
+    except Exception as e:
+        return {
+            "generated_code": f"# Error generating code: {str(e)}",
+            "explanation": f"Failed to generate code: {str(e)}",
+            "dependencies": [],
+            "cached": False
+        }
+
+async def request_generated_code(workflow_description: str, tools_used: List[str], language: str) -> Dict[str, Any]:
+    """Ask Groq for the code; raises on failure so errors are never cached"""
     
     system_prompt = f"""You are an expert blockchain developer. Generate {language} code that implements the described Web3 workflow.
 
@@ -612,48 +894,40 @@ Include:
 4. List of required dependencies
 """
     
-    try:
-        if not groq_client:
-            raise Exception("Groq client not initialized")
-            
-        response = groq_client.chat.completions.create(
-            model="llama3-70b-8192",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.3,
-            max_tokens=4096
-        )
-        
-        generated_content = response.choices[0].message.content
-        
-        # Extract code and explanation
-        parts = generated_content.split("```")
-        if len(parts) >= 3:
-            code = parts[1].strip()
-            if code.startswith(language):
-                code = code[len(language):].strip()
-            explanation = parts[0] + (parts[2] if len(parts) > 2 else "")
-        else:
-            code = generated_content
-            explanation = f"Generated {language} code for the Web3 workflow"
-        
-        # Extract dependencies
-        dependencies = extract_dependencies(code, language)
-        
-        return {
-            "generated_code": code,
-            "explanation": explanation.strip(),
-            "dependencies": dependencies
-        }
+    if not model_router:
+        raise Exception("Groq client not initialized")
         
-    except Exception as e:
-        return {
-            "generated_code": f"# Error generating code: {str(e)}",
-            "explanation": f"Failed to generate code: {str(e)}",
-            "dependencies": []
-        }
+    response = await model_router.complete(
+        "code",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        temperature=0.3,
+        max_tokens=4096
+    )
+    
+    generated_content = response.choices[0].message.content
+    
+    # Extract code and explanation
+    parts = generated_content.split("```")
+    if len(parts) >= 3:
+        code = parts[1].strip()
+        if code.startswith(language):
+            code = code[len(language):].strip()
+        explanation = parts[0] + (parts[2] if len(parts) > 2 else "")
+    else:
+        code = generated_content
+        explanation = f"Generated {language} code for the Web3 workflow"
+    
+    # Extract dependencies
+    dependencies = extract_dependencies(code, language)
+    
+    return {
+        "generated_code": code,
+        "explanation": explanation.strip(),
+        "dependencies": dependencies
+    }
 
 def extract_dependencies(code: str, language: str) -> List[str]:
     """Extract dependencies from generated code"""
@@ -674,299 +948,350 @@ async def chat_with_agent_simple(request: AgentRequest):
     Supports function calling for real Web3 operations via external APIs.
     """
     try:
-        print(f"Received chat request: {request.user_message}")
-        print(f"Tools: {[tool.tool for tool in request.tools] if request.tools else 'None'}")
-        
-        # Extract user ID for context management
-        user_id = getattr(request, 'user_id', 'default_user')
-        
-        # Check if user wants to check balance
-        if any(word in request.user_message.lower() for word in ["balance", "check balance", "how much"]):
-            # Try to extract address from message
-            address_match = re.search(r'0x[a-fA-F0-9]{40}', request.user_message)
-            if address_match:
-                address = address_match.group(0)
-                result = execute_tool("get_balance", {"address": address})
-                
-                if result["success"]:
-                    balance_info = result["result"]
-                    return {
-                        "agent_response": f"💰 **Wallet Balance**\n\nAddress: `{address}`\nBalance: **{balance_info.get('balance', 'N/A')} STT**\n\nNetwork: Somnia",
-                        "tool_calls": [{"tool": "get_balance", "parameters": {"address": address}}],
-                        "results": [result]
-                    }
-                else:
-                    return {
-                        "agent_response": f"❌ Failed to get balance: {result['error']}",
-                        "tool_calls": [],
-                        "results": [result]
-                    }
+        return await handle_chat_request(request)
+    except Exception as e:
+        log.exception("chat.failed", error=str(e))
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.post("/agent/chat/stream")
+async def chat_with_agent_stream(request: AgentRequest):
+    """
+    Streaming variant of /agent/chat using Server-Sent Events.
+    Emits token, tool_call_start and tool_result events, then a final done event.
+    """
+    return sse_response(lambda emit: handle_chat_request(request, emit))
+
+def session_user_for(wallet_address: Optional[str]) -> Optional[str]:
+    """Sessions belong to the connected wallet only, never to a client-chosen id"""
+    if wallet_address and FULL_ADDRESS_PATTERN.fullmatch(wallet_address):
+        return wallet_address.lower()
+    return None
+
+def session_id_for(request: AgentRequest) -> Optional[str]:
+    """User plus agent: the agent name and tool graph, so one agent's smart accounts never leak into another's"""
+    user = session_user_for(request.user_wallet_address)
+    if not user:
+        return None
+    agent = [
+        (request.context or {}).get("agent_name"),
+        sorted((tool.tool, tool.node_id or "", tool.next_tool or "") for tool in request.tools)
+    ]
+    digest = hashlib.sha256(json.dumps(agent, default=str).encode()).hexdigest()[:16]
+    return f"{user}/{digest}"
+
+async def with_session_context(request: AgentRequest) -> AgentRequest:
+    """Store the context fields this request sent and fill in the ones it left out entirely"""
+    session_id = session_id_for(request)
+    if not session_id:
+        return request
+    # An explicit {} or null is a value (e.g. an agent without smart accounts), not an omission
+    sent = [field for field in SESSION_FIELDS if field in request.model_fields_set]
+    session = await session_store.update(session_id, {field: getattr(request, field) for field in sent})
+    remembered = {field: session[field] for field in SESSION_FIELDS if field not in sent and session.get(field) is not None}
+    if remembered:
+        log.debug("chat.session_context", fields=sorted(remembered))
+        return request.model_copy(update=remembered)
+    return request
+
+async def handle_chat_request(request: AgentRequest, emit: Optional[EventEmitter] = None) -> Dict[str, Any]:
+    """Route a chat message to a direct tool call or the Groq assistant"""
+    log.info("chat.request", message_chars=len(request.user_message), tools=[tool.tool for tool in request.tools])
+    log.debug("chat.message", message=request.user_message)
+    
+    # Only echo back what this request sent, never fields restored from the session
+    sent_execution_plan = request.execution_plan
+    
+    # Reuse smart accounts and execution plan remembered for this wallet
+    request = await with_session_context(request)
+    
+    # Classify intent and extract addresses/amounts in one pass
+    parsed = intent_router.parse(request.user_message)
+    
+    # Check if user wants to check balance
+    if parsed.intent == "balance":
+        # Try to extract address from message
+        if parsed.full_addresses:
+            address = parsed.full_addresses[0]
+            result = await execute_tool_with_events("get_balance", {"address": address}, emit, request.full_tool_results)
+            
+            if result["success"]:
+                balance_info = result["result"]
+                return {
+                    "agent_response": f"💰 **Wallet Balance**\n\nAddress: `{address}`\nBalance: **{balance_info.get('balance', 'N/A')} STT**\n\nNetwork: Somnia",
+                    "tool_calls": [{"tool": "get_balance", "parameters": {"address": address}}],
+                    "results": [result]
+                }
             else:
                 return {
-                    "agent_response": "I need a wallet address to check the balance. Please provide an address like:\n`Check balance for 0x1234567890123456789012345678901234567890`",
+                    "agent_response": f"❌ Failed to get balance: {result['error']}",
                     "tool_calls": [],
-                    "results": []
+                    "results": [result]
                 }
+        else:
+            return {
+                "agent_response": "I need a wallet address to check the balance. Please provide an address like:\n`Check balance for 0x1234567890123456789012345678901234567890`",
+                "tool_calls": [],
+                "results": []
+            }
+    
+    # Extract smart account info from execution plan if available
+    execution_steps = []
+    smart_accounts = {}
+    workflow_context = ""
+    
+    # First, try to get smart accounts from request (sent by frontend)
+    if request.smart_accounts and isinstance(request.smart_accounts, dict):
+        smart_accounts = request.smart_accounts
+        log.debug("chat.smart_accounts", smart_accounts=smart_accounts)
+    
+    if request.execution_plan and isinstance(request.execution_plan, dict):
+        execution_steps = request.execution_plan.get("execution_steps", [])
         
-        # Extract smart account info from execution plan if available
-        execution_steps = []
-        smart_accounts = {}
-        workflow_context = ""
+        # Extract smart accounts from execution steps (fallback if not in request)
+        if not smart_accounts:
+            for step in execution_steps:
+                if isinstance(step, dict) and "smart_account" in step:
+                    sa_address = step.get("smart_account")
+                    if sa_address:
+                        smart_accounts[f"step_{step.get('step', 0)}"] = sa_address
         
-        # First, try to get smart accounts from request (sent by frontend)
-        if request.smart_accounts and isinstance(request.smart_accounts, dict):
-            smart_accounts = request.smart_accounts
-            print(f"📊 Smart accounts from request: {smart_accounts}")
+        # Build workflow context info (don't return, just prepare it)
+        if execution_steps:
+            workflow_context = f"\n\n🔧 **Workflow Ready**: {len(execution_steps)} step(s) configured with {len(smart_accounts)} smart account(s)"
+    
+    # Check if user wants to transfer tokens
+    if parsed.intent == "transfer":
+        # Extract transfer details from user message
+        # Addresses allow 35-42 hex chars to catch partial addresses
+        address_matches = parsed.addresses
         
-        if request.execution_plan and isinstance(request.execution_plan, dict):
-            execution_steps = request.execution_plan.get("execution_steps", [])
-            
-            # Extract smart accounts from execution steps (fallback if not in request)
-            if not smart_accounts:
-                for step in execution_steps:
-                    if isinstance(step, dict) and "smart_account" in step:
-                        sa_address = step.get("smart_account")
-                        if sa_address:
-                            smart_accounts[f"step_{step.get('step', 0)}"] = sa_address
-            
-            # Build workflow context info (don't return, just prepare it)
-            if execution_steps:
-                workflow_context = f"\n\n🔧 **Workflow Ready**: {len(execution_steps)} step(s) configured with {len(smart_accounts)} smart account(s)"
+        # Find recipient address by looking for "to" keyword
+        user_recipient = None
         
-        # Check if user wants to transfer tokens
-        if any(word in request.user_message.lower() for word in ["transfer", "send"]):
-            # Extract transfer details from user message
-            # Use more flexible regex to catch partial addresses
-            address_matches = re.findall(r'0x[a-fA-F0-9]{35,42}', request.user_message)  # Allow 35-42 chars
-            amount_match = re.search(r'(\d+(?:\.\d+)?)\s*(eth|usdc|usdt|dai)?', request.user_message.lower())
-            
-            # Find recipient address by looking for "to" keyword
-            user_recipient = None
-            
-            # First try to find address after "to"
-            to_pattern = r'to\s+(0x[a-fA-F0-9]{35,42})'
-            to_match = re.search(to_pattern, request.user_message, re.IGNORECASE)
-            if to_match:
-                user_recipient = to_match.group(1)
-                # If partial address, try to pad with zeros or use as-is
+        # First try to find address after "to"
+        if parsed.recipient:
+            user_recipient = parsed.recipient
+            # If partial address, try to pad with zeros or use as-is
+            if len(user_recipient) < 42:
+                log.warning("chat.partial_address", recipient=user_recipient)
+                # For demo, we'll use a default test address
+                user_recipient = "0x9E239687ED8Fd4d79C781cA408E12bd209BC7762"  # Full test address
+        else:
+            # Fallback: use any address that's not the smart account
+            smart_account_addresses = set(smart_accounts.values()) if smart_accounts else set()
+            potential_recipients = [addr for addr in address_matches if addr not in smart_account_addresses]
+            if potential_recipients:
+                user_recipient = potential_recipients[-1]
                 if len(user_recipient) < 42:
-                    print(f"⚠️ Partial address detected: {user_recipient}")
-                    # For demo, we'll use a default test address
                     user_recipient = "0x9E239687ED8Fd4d79C781cA408E12bd209BC7762"  # Full test address
-            else:
-                # Fallback: use any address that's not the smart account
-                smart_account_addresses = set(smart_accounts.values()) if smart_accounts else set()
-                potential_recipients = [addr for addr in address_matches if addr not in smart_account_addresses]
-                if potential_recipients:
-                    user_recipient = potential_recipients[-1]
-                    if len(user_recipient) < 42:
-                        user_recipient = "0x9E239687ED8Fd4d79C781cA408E12bd209BC7762"  # Full test address
+        
+        user_amount = parsed.amount
+        user_token = parsed.amount_unit or "eth"
+        
+        log.debug("chat.transfer_parsed", amount=user_amount, token=user_token, recipient=user_recipient)
+        
+        # Check if we have execution steps with smart accounts
+        if execution_steps:
+            # Enhance steps with user-provided details
+            enhanced_steps = []
+            for step in execution_steps:
+                step_desc = step.get('description', step.get('operation'))
+                # Replace undefined/0 values with user input
+                if user_recipient and 'undefined' in step_desc:
+                    step_desc = step_desc.replace('undefined', user_recipient)
+                if user_amount and ('0 ' in step_desc or 'X ' in step_desc):
+                    step_desc = step_desc.replace('0 ETH', f'{user_amount} {user_token.upper()}')
+                    step_desc = step_desc.replace('X ETH', f'{user_amount} {user_token.upper()}')
+                    step_desc = step_desc.replace('X tokens', f'{user_amount} {user_token.upper()}')
+                enhanced_steps.append(step_desc)
             
-            user_amount = amount_match.group(1) if amount_match else None
-            user_token = amount_match.group(2) if amount_match and amount_match.group(2) else "eth"
+            steps_info = "\n".join([f"• {desc}" for desc in enhanced_steps])
             
-            print(f"🔍 Parsed transfer: amount={user_amount}, token={user_token}, recipient={user_recipient}")
+            # Get the smart account address and node ID
+            primary_sa = list(smart_accounts.values())[0] if smart_accounts else None
+            primary_node_id = list(smart_accounts.keys())[0] if smart_accounts else None
             
-            # Check if we have execution steps with smart accounts
-            if execution_steps:
-                # Enhance steps with user-provided details
-                enhanced_steps = []
-                for step in execution_steps:
-                    step_desc = step.get('description', step.get('operation'))
-                    # Replace undefined/0 values with user input
-                    if user_recipient and 'undefined' in step_desc:
-                        step_desc = step_desc.replace('undefined', user_recipient)
-                    if user_amount and ('0 ' in step_desc or 'X ' in step_desc):
-                        step_desc = step_desc.replace('0 ETH', f'{user_amount} {user_token.upper()}')
-                        step_desc = step_desc.replace('X ETH', f'{user_amount} {user_token.upper()}')
-                        step_desc = step_desc.replace('X tokens', f'{user_amount} {user_token.upper()}')
-                    enhanced_steps.append(step_desc)
-                
-                steps_info = "\n".join([f"• {desc}" for desc in enhanced_steps])
-                
-                # Get the smart account address and node ID
-                primary_sa = list(smart_accounts.values())[0] if smart_accounts else None
-                primary_node_id = list(smart_accounts.keys())[0] if smart_accounts else None
-                
-                print(f"📊 Transfer info: recipient={user_recipient}, amount={user_amount}")
-                print(f"📊 Smart account: {primary_sa}, Node ID: {primary_node_id}")
-                print(f"📊 User wallet: {request.user_wallet_address}")
-                
-                # Check if we have all required information
-                if not primary_sa or not primary_node_id:
-                    return {
-                        "agent_response": f"⚠️ **Smart Account Not Found**\n\n📋 **What I found**:\n{steps_info if execution_steps else 'No execution steps'}\n\n💡 **Tip**: Make sure your workflow has an ERC-4337 Account node with a smart account created.",
-                        "tool_calls": [],
-                        "results": []
-                    }
-                
-                if not request.user_wallet_address:
-                    return {
-                        "agent_response": f"⚠️ **Wallet Not Connected**\n\n💡 **Tip**: Please connect your wallet to execute transfers.\n\n📋 **Ready to transfer**:\n• Amount: {user_amount} {user_token.upper()}\n• To: {user_recipient}\n• From: {primary_sa}",
-                        "tool_calls": [],
-                        "results": []
-                    }
-                
-                # Prepare transfer data for frontend execution
-                if user_recipient and user_amount:
-                    transfer_params = {
-                        "fromAddress": primary_sa,  # Smart account address
-                        "toAddress": user_recipient,
-                        "amount": user_amount,
-                        "tokenType": "ETH" if user_token.lower() == "eth" else "ERC20",
-                        "tokenAddress": "0x0000000000000000000000000000000000000000" if user_token.lower() == "eth" else None,
-                        "nodeId": primary_node_id  # Node ID used as salt
-                    }
-                    
-                    print(f"📦 Prepared transfer data: {transfer_params}")
-                    
-                    # Return transfer data for frontend to execute
-                    # Frontend will reconstruct smart account and sign the UserOperation
-                    return {
-                        "agent_response": f"✅ **Ready to Execute Transfer!**\n\n💸 Amount: **{user_amount} {user_token.upper()}**\n📍 To: `{user_recipient}`\n🔐 From Smart Account: `{primary_sa}`\n\n📝 **Transfer Details**:\n{steps_info}\n\n🔐 **Status**: Transfer prepared. Please sign the transaction in your wallet to execute.",
-                        "tool_calls": [{"tool": "transfer", "parameters": transfer_params}],
-                        "transfer_data": transfer_params,  # Frontend will use this to execute
-                        "requires_user_signature": True,  # Signal that frontend needs to handle this
-                        "execution_plan": request.execution_plan
-                    }
-                else:
-                    return {
-                        "agent_response": f"✅ **Ready to Execute Transfer!**\n\n📋 **Transfer Details**:\n{steps_info}\n\n🔐 **Smart Account**: `{primary_sa}`{workflow_context}\n\n💡 **Configuration**:\n- ✅ Smart account created and ready\n- ✅ Recipient: `{user_recipient or 'Not specified'}`\n- ✅ Amount: {user_amount} {user_token.upper() if user_amount else 'Not specified'}\n- ✅ Using ERC-4337 for gasless transactions\n\n🚀 **Missing**: Please specify both recipient address and amount in your message.\n\n📝 **Example**: \"Transfer 0.1 ETH to 0x9E239687ED8Fd4d79C781cA408E12bd209BC7762\"",
-                        "tool_calls": [],
-                        "results": [],
-                        "execution_plan": request.execution_plan
-                    }
+            log.debug(
+                "chat.transfer_info",
+                recipient=user_recipient,
+                amount=user_amount,
+                smart_account=primary_sa,
+                node_id=primary_node_id,
+                user_wallet=request.user_wallet_address
+            )
             
-            # Fallback: No workflow configured
-            if len(address_matches) >= 1 and amount_match:  # Need recipient address and token address
-                to_address = address_matches[0]  # First address is recipient
-                token_address = address_matches[1] if len(address_matches) > 1 else "0x0000000000000000000000000000000000000000"  # Default STT token
-                amount = amount_match.group(1)
-                
-                if not request.private_key:
-                    return {
-                        "agent_response": "I need your private key to execute the transfer. Please provide it securely in the request.",
-                        "tool_calls": [],
-                        "results": []
-                    }
-                
+            # Check if we have all required information
+            if not primary_sa or not primary_node_id:
+                return {
+                    "agent_response": f"⚠️ **Smart Account Not Found**\n\n📋 **What I found**:\n{steps_info if execution_steps else 'No execution steps'}\n\n💡 **Tip**: Make sure your workflow has an ERC-4337 Account node with a smart account created.",
+                    "tool_calls": [],
+                    "results": []
+                }
+            
+            if not request.user_wallet_address:
+                return {
+                    "agent_response": f"⚠️ **Wallet Not Connected**\n\n💡 **Tip**: Please connect your wallet to execute transfers.\n\n📋 **Ready to transfer**:\n• Amount: {user_amount} {user_token.upper()}\n• To: {user_recipient}\n• From: {primary_sa}",
+                    "tool_calls": [],
+                    "results": []
+                }
+            
+            # Prepare transfer data for frontend execution
+            if user_recipient and user_amount:
                 transfer_params = {
-                    "privateKey": request.private_key,
-                    "toAddress": to_address,
-                    "amount": amount,
-                    "tokenAddress": token_address
+                    "fromAddress": primary_sa,  # Smart account address
+                    "toAddress": user_recipient,
+                    "amount": user_amount,
+                    "tokenType": "ETH" if user_token.lower() == "eth" else "ERC20",
+                    "tokenAddress": "0x0000000000000000000000000000000000000000" if user_token.lower() == "eth" else None,
+                    "nodeId": primary_node_id  # Node ID used as salt
                 }
                 
-                result = execute_tool("transfer", transfer_params)
+                log.debug("chat.transfer_prepared", parameters=transfer_params)
                 
-                if result["success"]:
-                    tx_info = result["result"]
-                    return {
-                        "agent_response": f"✅ **Transfer Successful!**\n\n💸 Amount: **{amount} tokens**\n📍 To: `{to_address}`\n🔗 Transaction: `{tx_info.get('transactionHash', 'N/A')}`\n🌐 Network: Somnia",
-                        "tool_calls": [{"tool": "transfer", "parameters": transfer_params}],
-                        "results": [result]
-                    }
-                else:
-                    return {
-                        "agent_response": f"❌ Transfer failed: {result['error']}",
-                        "tool_calls": [],
-                        "results": [result]
-                    }
+                # Return transfer data for frontend to execute
+                # Frontend will reconstruct smart account and sign the UserOperation
+                return {
+                    "agent_response": f"✅ **Ready to Execute Transfer!**\n\n💸 Amount: **{user_amount} {user_token.upper()}**\n📍 To: `{user_recipient}`\n🔐 From Smart Account: `{primary_sa}`\n\n📝 **Transfer Details**:\n{steps_info}\n\n🔐 **Status**: Transfer prepared. Please sign the transaction in your wallet to execute.",
+                    "tool_calls": [{"tool": "transfer", "parameters": transfer_params}],
+                    "transfer_data": transfer_params,  # Frontend will use this to execute
+                    "requires_user_signature": True,  # Signal that frontend needs to handle this
+                    "execution_plan": sent_execution_plan
+                }
             else:
                 return {
-                    "agent_response": "I need more information for the transfer. Please provide:\n- Recipient address\n- Token address (optional, defaults to STT)\n- Amount\n\nExample: `Transfer 10 to 0x1234567890123456789012345678901234567890`",
+                    "agent_response": f"✅ **Ready to Execute Transfer!**\n\n📋 **Transfer Details**:\n{steps_info}\n\n🔐 **Smart Account**: `{primary_sa}`{workflow_context}\n\n💡 **Configuration**:\n- ✅ Smart account created and ready\n- ✅ Recipient: `{user_recipient or 'Not specified'}`\n- ✅ Amount: {user_amount} {user_token.upper() if user_amount else 'Not specified'}\n- ✅ Using ERC-4337 for gasless transactions\n\n🚀 **Missing**: Please specify both recipient address and amount in your message.\n\n📝 **Example**: \"Transfer 0.1 ETH to 0x9E239687ED8Fd4d79C781cA408E12bd209BC7762\"",
                     "tool_calls": [],
-                    "results": []
+                    "results": [],
+                    "execution_plan": sent_execution_plan
                 }
         
-        # Check if user wants to swap tokens
-        if any(word in request.user_message.lower() for word in ["swap", "exchange"]):
-            # Extract swap parameters (simplified)
-            addresses = re.findall(r'0x[a-fA-F0-9]{40}', request.user_message)
-            amount_match = re.search(r'(\d+(?:\.\d+)?)', request.user_message)
+        # Fallback: No workflow configured
+        if len(address_matches) >= 1 and parsed.amount:  # Need recipient address and token address
+            to_address = address_matches[0]  # First address is recipient
+            token_address = address_matches[1] if len(address_matches) > 1 else "0x0000000000000000000000000000000000000000"  # Default STT token
+            amount = parsed.amount
             
-            if len(addresses) >= 2 and amount_match:
-                token_in = addresses[0]
-                token_out = addresses[1]
-                amount_in = amount_match.group(1)
-                
-                if not request.private_key:
-                    return {
-                        "agent_response": "I need your private key to execute the swap. Please provide it securely in the request.",
-                        "tool_calls": [],
-                        "results": []
-                    }
-                
-                swap_params = {
-                    "privateKey": request.private_key,
-                    "tokenIn": token_in,
-                    "tokenOut": token_out,
-                    "amountIn": amount_in,
-                    "slippageTolerance": 0.5
+            if not request.private_key:
+                return {
+                    "agent_response": "I need your private key to execute the transfer. Please provide it securely in the request.",
+                    "tool_calls": [],
+                    "results": []
+                }
+            
+            transfer_params = {
+                "privateKey": request.private_key,
+                "toAddress": to_address,
+                "amount": amount,
+                "tokenAddress": token_address
+            }
+            
+            result = await execute_tool_with_events("transfer", transfer_params, emit, request.full_tool_results)
+            
+            if result["success"]:
+                tx_info = result["result"]
+                return {
+                    "agent_response": f"✅ **Transfer Successful!**\n\n💸 Amount: **{amount} tokens**\n📍 To: `{to_address}`\n🔗 Transaction: `{tx_info.get('transactionHash', 'N/A')}`\n🌐 Network: Somnia",
+                    "tool_calls": [{"tool": "transfer", "parameters": transfer_params}],
+                    "results": [result]
                 }
-                
-                result = execute_tool("swap", swap_params)
-                
-                if result["success"]:
-                    swap_info = result["result"]
-                    return {
-                        "agent_response": f"🔄 **Swap Successful!**\n\n💰 Swapped: **{amount_in} tokens**\n🔁 From: `{token_in}`\n🔁 To: `{token_out}`\n🔗 Transaction: `{swap_info.get('transactionHash', 'N/A')}`",
-                        "tool_calls": [{"tool": "swap", "parameters": swap_params}],
-                        "results": [result]
-                    }
-                else:
-                    return {
-                        "agent_response": f"❌ Swap failed: {result['error']}",
-                        "tool_calls": [],
-                        "results": [result]
-                    }
             else:
                 return {
-                    "agent_response": "For token swaps, please provide:\n- Token A address (from)\n- Token B address (to)\n- Amount\n\nExample: `Swap 100 from 0x1234... to 0x5678...`",
+                    "agent_response": f"❌ Transfer failed: {result['error']}",
                     "tool_calls": [],
-                    "results": []
+                    "results": [result]
                 }
+        else:
+            return {
+                "agent_response": "I need more information for the transfer. Please provide:\n- Recipient address\n- Token address (optional, defaults to STT)\n- Amount\n\nExample: `Transfer 10 to 0x1234567890123456789012345678901234567890`",
+                "tool_calls": [],
+                "results": []
+            }
+    
+    # Check if user wants to swap tokens
+    if parsed.intent == "swap":
+        # Extract swap parameters (simplified)
+        addresses = parsed.full_addresses
         
-        # Check if user wants price information
-        if any(word in request.user_message.lower() for word in ["price", "cost", "value"]):
-            # Extract token name or symbol
-            tokens = ["bitcoin", "ethereum", "btc", "eth", "usdt", "usdc"]
-            query = None
-            for token in tokens:
-                if token in request.user_message.lower():
-                    query = f"{token} current price"
-                    break
+        if len(addresses) >= 2 and parsed.amount:
+            token_in = addresses[0]
+            token_out = addresses[1]
+            amount_in = parsed.amount
+            
+            if not request.private_key:
+                return {
+                    "agent_response": "I need your private key to execute the swap. Please provide it securely in the request.",
+                    "tool_calls": [],
+                    "results": []
+                }
             
-            if not query:
-                query = request.user_message  # Use full message as query
+            swap_params = {
+                "privateKey": request.private_key,
+                "tokenIn": token_in,
+                "tokenOut": token_out,
+                "amountIn": amount_in,
+                "slippageTolerance": 0.5
+            }
             
-            result = execute_tool("fetch_price", {"query": query})
+            result = await execute_tool_with_events("swap", swap_params, emit, request.full_tool_results)
             
             if result["success"]:
-                price_info = result["result"]
+                swap_info = result["result"]
                 return {
-                    "agent_response": f"💎 **Price Information**\n\n{price_info.get('response', 'Price data retrieved successfully')}",
-                    "tool_calls": [{"tool": "fetch_price", "parameters": {"query": query}}],
+                    "agent_response": f"🔄 **Swap Successful!**\n\n💰 Swapped: **{amount_in} tokens**\n🔁 From: `{token_in}`\n🔁 To: `{token_out}`\n🔗 Transaction: `{swap_info.get('transactionHash', 'N/A')}`",
+                    "tool_calls": [{"tool": "swap", "parameters": swap_params}],
                     "results": [result]
                 }
             else:
                 return {
-                    "agent_response": f"❌ Failed to fetch price: {result['error']}",
+                    "agent_response": f"❌ Swap failed: {result['error']}",
                     "tool_calls": [],
                     "results": [result]
                 }
-        
-        # For general Web3 questions, use Groq AI
-        if not groq_client:
+        else:
             return {
-                "agent_response": "AI service temporarily unavailable. Please try again later.",
+                "agent_response": "For token swaps, please provide:\n- Token A address (from)\n- Token B address (to)\n- Amount\n\nExample: `Swap 100 from 0x1234... to 0x5678...`",
                 "tool_calls": [],
                 "results": []
             }
+    
+    # Check if user wants price information
+    if parsed.intent == "price":
+        # Extract token name or symbol
+        query = None
+        token = parsed.first_keyword(PRICE_TOKENS)
+        if token:
+            query = f"{token} current price"
         
-        try:
-            # Enhanced system prompt with function calling capabilities
-            system_prompt = """You are a Web3 AI assistant with real blockchain capabilities on the Somnia network. You can:
+        if not query:
+            query = request.user_message  # Use full message as query
+        
+        result = await execute_tool_with_events("fetch_price", {"query": query}, emit, request.full_tool_results)
+        
+        if result["success"]:
+            price_info = result["result"]
+            return {
+                "agent_response": f"💎 **Price Information**\n\n{price_info.get('response', 'Price data retrieved successfully')}",
+                "tool_calls": [{"tool": "fetch_price", "parameters": {"query": query}}],
+                "results": [result]
+            }
+        else:
+            return {
+                "agent_response": f"❌ Failed to fetch price: {result['error']}",
+                "tool_calls": [],
+                "results": [result]
+            }
+    
+    # For general Web3 questions, use Groq AI
+    if not llm_client:
+        return {
+            "agent_response": "AI service temporarily unavailable. Please try again later.",
+            "tool_calls": [],
+            "results": []
+        }
+    
+    try:
+        # Enhanced system prompt with function calling capabilities
+        system_prompt = """You are a Web3 AI assistant with real blockchain capabilities on the Somnia network. You can:
 
 🏦 **ACCOUNT OPERATIONS**: 
    - Check wallet balances: "Check balance for 0x..."
@@ -1007,116 +1332,336 @@ Available commands:
 - Price: "What's the price of [token]?"
 
 How can I help you with blockchain operations today?"""
-            
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": request.user_message}
-            ]
-            
-            print(f"Calling Groq API with {len(messages)} messages")
-            
-            # Call Groq API
-            chat_completion = groq_client.chat.completions.create(
-                messages=messages,
-                model="llama-3.1-70b-versatile", 
-                temperature=0.7,
-                max_tokens=1000
-            )
-            
-            response = chat_completion.choices[0].message.content
-            print(f"Groq API response received: {len(response)} characters")
-            
-            return {
-                "agent_response": response,
-                "tool_calls": [],
-                "results": []
-            }
-            
-        except Exception as groq_error:
-            print(f"Groq API error: {groq_error}")
-            print(f"Error type: {type(groq_error)}")
-            print(f"Error details: {str(groq_error)}")
-            
-            # Provide helpful fallback responses based on message content
-            user_msg_lower = request.user_message.lower()
-            if "defi" in user_msg_lower:
-                fallback = "DeFi (Decentralized Finance) refers to financial services built on blockchain networks that operate without traditional intermediaries like banks. It includes lending, borrowing, trading, and yield farming protocols."
-            elif "nft" in user_msg_lower:
-                fallback = "NFTs (Non-Fungible Tokens) are unique digital assets stored on blockchain networks. They can represent art, collectibles, gaming items, or any unique digital content with verified ownership."
-            elif "wallet" in user_msg_lower or "balance" in user_msg_lower:
-                fallback = "A crypto wallet stores your digital assets and private keys. You can check balances, send transactions, and interact with DeFi protocols through wallet applications."
-            elif "ethereum" in user_msg_lower or "eth" in user_msg_lower:
-                fallback = "Ethereum is a blockchain platform that supports smart contracts and decentralized applications (dApps). ETH is its native cryptocurrency used for transactions and gas fees."
-            else:
-                fallback = "I'm a Web3 AI assistant here to help with blockchain, cryptocurrency, DeFi, and NFT questions. What would you like to learn about?"
-                
-            return {
-                "agent_response": fallback,
-                "tool_calls": [],
-                "results": []
-            }
         
-    except Exception as e:
-        print(f"Chat endpoint error: {e}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": request.user_message}
+        ]
+        
+        log.debug("chat.llm_request", messages=len(messages))
+        
+        # Call Groq API
+        assistant_message = await request_completion(
+            emit,
+            task="chat",
+            messages=messages,
+            temperature=0.7,
+            max_tokens=1000
+        )
+        
+        response = assistant_message.content
+        log.debug("chat.llm_response", chars=len(response))
+        
+        return {
+            "agent_response": response,
+            "tool_calls": [],
+            "results": []
+        }
+        
+    except Exception as groq_error:
+        log.warning("chat.llm_failed", error=str(groq_error), error_type=type(groq_error).__name__)
+        
+        # Provide helpful fallback responses based on message content
+        if parsed.has("defi"):
+            fallback = "DeFi (Decentralized Finance) refers to financial services built on blockchain networks that operate without traditional intermediaries like banks. It includes lending, borrowing, trading, and yield farming protocols."
+        elif parsed.has("nft"):
+            fallback = "NFTs (Non-Fungible Tokens) are unique digital assets stored on blockchain networks. They can represent art, collectibles, gaming items, or any unique digital content with verified ownership."
+        elif parsed.has("wallet", "balance"):
+            fallback = "A crypto wallet stores your digital assets and private keys. You can check balances, send transactions, and interact with DeFi protocols through wallet applications."
+        elif parsed.has("ethereum", "eth"):
+            fallback = "Ethereum is a blockchain platform that supports smart contracts and decentralized applications (dApps). ETH is its native cryptocurrency used for transactions and gas fees."
+        else:
+            fallback = "I'm a Web3 AI assistant here to help with blockchain, cryptocurrency, DeFi, and NFT questions. What would you like to learn about?"
+            
+        return {
+            "agent_response": fallback,
+            "tool_calls": [],
+            "results": []
+        }
 
 @app.post("/agent/workflow", response_model=AgentResponse)
 async def chat_with_agent_workflow(request: AgentRequest):
     """
     Main endpoint to interact with the Web3 AI agent using Groq.
     """
+    workflow = prepare_workflow(request)
+    return await run_workflow(request, workflow)
+
+@app.post("/agent/workflow/stream")
+async def chat_with_agent_workflow_stream(request: AgentRequest):
+    """
+    Streaming variant of /agent/workflow using Server-Sent Events.
+    Emits start, token, tool_call_start, tool_result and summary events,
+    then a final done event carrying the AgentResponse.
+    """
+    workflow = prepare_workflow(request)
+    
+    async def run(emit: EventEmitter) -> Dict[str, Any]:
+        await emit("start", {"tools": workflow["available_tools"]})
+        response = await run_workflow(request, workflow, emit)
+        return response.model_dump()
+    
+    return sse_response(run)
+
+@app.post("/agent/workflow/jobs", response_model=JobSubmitResponse, status_code=202)
+async def submit_workflow_job(request: AgentRequest):
+    """
+    Queue /agent/workflow as a background job and return its id right away.
+    Poll GET /agent/jobs/{job_id} or stream GET /agent/jobs/{job_id}/stream.
+    """
+    prepare_workflow(request)  # reject invalid tool graphs now rather than in the job
     try:
-        print(f"Received request: {request.user_message}")
-        print(f"Tools: {[tool.tool for tool in request.tools]}")
-        
-        # Extract tools and build workflow
-        unique_tools = set()
-        tool_flow = {}
-        
-        for conn in request.tools:
-            unique_tools.add(conn.tool)
-            if conn.next_tool:
-                unique_tools.add(conn.next_tool)
-                tool_flow[conn.tool] = conn.next_tool
-        
-        available_tools = list(unique_tools)
-        print(f"Available tools: {available_tools}")
-        
-        # Validate tools
-        for tool in available_tools:
-            if tool not in TOOL_DEFINITIONS:
-                print(f"Unknown tool: {tool}")
-                raise HTTPException(status_code=400, detail=f"Unknown tool: {tool}")
-        
-        # Build system prompt
-        system_prompt = build_system_prompt(request.tools)
-        print(f"System prompt length: {len(system_prompt)}")
+        job_id = await job_queue.submit(
+            "workflow",
+            request.model_dump(exclude={"private_key"}),
+            secrets={"private_key": request.private_key}
+        )
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "30"})
+    return JobSubmitResponse(job_id=job_id, status="queued")
+
+def job_status(job: Dict[str, Any]) -> JobStatusResponse:
+    return JobStatusResponse(
+        job_id=job["id"],
+        kind=job["kind"],
+        status=job["status"],
+        attempts=job["attempts"],
+        created_at=job["created"],
+        started_at=job["started"],
+        finished_at=job["finished"],
+        tool_calls=job["progress"]["tool_calls"],
+        results=job["progress"]["results"],
+        response=AgentResponse(**job["result"]) if job["result"] is not None else None,
+        error=job["error"]
+    )
+
+@app.get("/agent/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """Status, tool calls/results so far and, once finished, the AgentResponse of a job"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job_status(job)
+
+@app.get("/agent/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """
+    Follow a job with Server-Sent Events: status, tool_call_start and
+    tool_result events as they are recorded, then done with the job status.
+    """
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    
+    async def run(emit: EventEmitter) -> Dict[str, Any]:
+        job = await job_queue.watch(job_id, emit)
+        if job is None:
+            raise Exception(f"Job {job_id} was removed")
+        return job_status(job).model_dump()
+    
+    return sse_response(run)
+
+async def run_workflow_job(payload: Dict[str, Any], emit: EventEmitter) -> Dict[str, Any]:
+    """Job runner for "workflow" jobs: the same path as /agent/workflow (non-streamed LLM calls, so hedging applies)"""
+    request = AgentRequest(**payload)
+    # Raise so the job is stored as failed rather than as a succeeded apology
+    response = await run_workflow(request, prepare_workflow(request), progress_only(emit), raise_errors=True)
+    return response.model_dump()
+
+def job_replay_safe(progress: Dict[str, Any]) -> bool:
+    """An interrupted job may start over if it only called read-only tools so far"""
+    return all(TOOL_DEFINITIONS.get(call["tool"], {}).get("read_only", False) for call in progress["tool_calls"])
+
+def prepare_workflow(request: AgentRequest) -> Dict[str, Any]:
+    """Validate the requested tool graph and build the agent inputs"""
+    log.info("workflow.request", message_chars=len(request.user_message), tools=[tool.tool for tool in request.tools])
+    log.debug("workflow.message", message=request.user_message)
+    
+    # Extract tools and build workflow
+    try:
+        # The LLM drives the order here, so loops between tools are allowed
+        dag = WorkflowDAG(request.tools, acyclic=False)
+    except WorkflowError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    available_tools = dag.tool_names()
+    
+    # Validate tools
+    for tool in available_tools:
+        if tool not in TOOL_DEFINITIONS:
+            log.warning("workflow.unknown_tool", tool=tool)
+            raise HTTPException(status_code=400, detail=f"Unknown tool: {tool}")
+    
+    # Build system prompt (memoized per graph shape)
+    system_prompt = compile_system_prompt(dag.canonical_key())
+    log.debug("workflow.prepared", tools=available_tools, system_prompt_chars=len(system_prompt))
+    
+    return {
+        "available_tools": available_tools,
+        "tool_flow": dag.tool_flow(),
+        "system_prompt": system_prompt,
+        "workflow_key": dag.canonical_key()
+    }
+
+def with_private_key(tool_name: str, parameters: Dict[str, Any], private_key: Optional[str]) -> Dict[str, Any]:
+    if private_key and "privateKey" in TOOL_DEFINITIONS[tool_name]["parameters"]["properties"]:
+        parameters.setdefault("privateKey", private_key)
+    return parameters
+
+def strip_secrets(tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+    secret_fields = TOOL_DEFINITIONS.get(tool_name, {}).get("secret_fields", [])
+    return {key: value for key, value in parameters.items() if key not in secret_fields}
+
+def plan_context_values(request: AgentRequest) -> Dict[str, Any]:
+    """Request values besides the message a learned plan may reference (wallet, smart accounts, context)"""
+    values: Dict[str, Any] = {}
+    if request.user_wallet_address:
+        values["user_wallet_address"] = request.user_wallet_address
+    for node_id, address in (request.smart_accounts or {}).items():
+        values[f"smart_accounts.{node_id}"] = address
+        values[f"smart_account_nodes.{node_id}"] = node_id
+    for name, value in (request.context or {}).items():
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            values[f"context.{name}"] = value
+    return values
+
+def build_replay(request: AgentRequest, turns: List[List[Any]], slots: List[str]) -> Optional[List[List[Any]]]:
+    """Concrete tool calls for a learned plan, or None if they don't fit this request"""
+    replay = []
+    context = plan_context_values(request)
+    try:
+        for turn in turns:
+            calls = []
+            for tool_name, template in turn:
+                parameters = with_private_key(tool_name, substitute(template, slots, context), request.private_key)
+                required = TOOL_DEFINITIONS[tool_name]["parameters"].get("required", [])
+                if any(field not in parameters for field in required):
+                    return None
+                calls.append((tool_name, parameters))
+            replay.append(calls)
+    except (KeyError, IndexError, ValueError):
+        return None
+    return replay
+
+async def replay_plan(
+    request: AgentRequest,
+    replay: List[List[Any]],
+    emit: Optional[EventEmitter] = None
+) -> Dict[str, Any]:
+    """Execute a learned plan turn by turn without the LLM"""
+    all_tool_calls = []
+    all_tool_results = []
+    
+    async def run_tool(name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        return await execute_tool_with_events(name, args, emit, request.full_tool_results)
+    
+    for calls in replay:
+        all_tool_calls.extend({"tool": name, "parameters": args} for name, args in calls)
+        if request.parallel_tool_calls:
+            results = await dispatch_tool_calls(calls, run_tool)
+        else:
+            results = [await run_tool(name, args) for name, args in calls]
+        all_tool_results.extend(results)
+        if not all(result.get("success") for result in results):
+            break  # Later turns may depend on these results
+    
+    workflow_summary = generate_workflow_summary(all_tool_calls, all_tool_results)
+    return {
+        "agent_response": describe_tool_results(all_tool_calls, all_tool_results),
+        "tool_calls": all_tool_calls,
+        "results": all_tool_results,
+        "workflow_summary": workflow_summary
+    }
+
+async def run_agent_or_plan(
+    request: AgentRequest,
+    workflow: Dict[str, Any],
+    emit: Optional[EventEmitter] = None
+) -> Dict[str, Any]:
+    """Replay a confident cached plan, otherwise run the LLM agent and learn from it"""
+    template, slots = message_template(request.user_message)
+    # Plans are only shared between requests with the same user context
+    plan_context = {
+        "context": request.context,
+        "user_wallet_address": request.user_wallet_address.lower() if request.user_wallet_address else None,
+        "smart_accounts": request.smart_accounts,
+        "execution_plan": request.execution_plan
+    }
+    plan_key = plan_cache.make_key(workflow["workflow_key"], template, bool(request.private_key), plan_context)
+    
+    if request.use_plan_cache:
+        entry = await plan_cache.lookup(plan_key)
+        if entry is None:
+            PLAN_CACHE_LOOKUPS.labels(result="miss").inc()
+        elif not entry.confident:
+            PLAN_CACHE_LOOKUPS.labels(result="learning").inc()
+        else:
+            replay = build_replay(request, entry.turns, slots)
+            if replay is None:
+                PLAN_CACHE_LOOKUPS.labels(result="mismatch").inc()
+            else:
+                PLAN_CACHE_LOOKUPS.labels(result="hit").inc()
+                result = await replay_plan(request, replay, emit)
+                if not all(r.get("success") for r in result["results"]):
+                    PLAN_CACHE_LOOKUPS.labels(result="replay_failed").inc()
+                    await plan_cache.invalidate(plan_key)
+                return result
+    
+    result = await process_agent_conversation(
+        system_prompt=workflow["system_prompt"],
+        user_message=request.user_message,
+        available_tools=workflow["available_tools"],
+        tool_flow=workflow["tool_flow"],
+        private_key=request.private_key,
+        context=request.context,
+        parallel_tool_calls=request.parallel_tool_calls,
+        full_tool_results=request.full_tool_results,
+        emit=emit
+    )
+    
+    # Only learn from runs that finished normally with every tool call succeeding
+    succeeded = result["results"] and all(r.get("success") for r in result["results"])
+    if request.use_plan_cache and succeeded:
+        turns = [[(name, strip_secrets(name, args)) for name, args in turn] for turn in result["tool_turns"]]
+        write_tools = [name for name, tool_def in TOOL_DEFINITIONS.items() if not tool_def.get("read_only", False)]
+        await plan_cache.record(plan_key, turns, slots, write_tools, plan_context_values(request), template)
+    return result
+
+async def run_workflow(
+    request: AgentRequest,
+    workflow: Dict[str, Any],
+    emit: Optional[EventEmitter] = None,
+    raise_errors: bool = False
+) -> AgentResponse:
+    """Run the agent conversation for a prepared workflow
+
+    Errors become an apology AgentResponse unless `raise_errors` (background
+    jobs, which must record the failure).
+    """
+    try:
+        # Process conversation (or replay a learned plan)
+        result = await run_agent_or_plan(request, workflow, emit)
         
-        # Process conversation
-        result = process_agent_conversation(
-            system_prompt=system_prompt,
-            user_message=request.user_message,
-            available_tools=available_tools,
-            tool_flow=tool_flow,
-            private_key=request.private_key,
-            context=request.context
+        log.info(
+            "workflow.completed",
+            tool_calls=len(result["tool_calls"]),
+            response_chars=len(result["agent_response"] or "")
         )
+        WORKFLOW_TOOL_CALLS.labels(endpoint="workflow").observe(len(result["tool_calls"]))
         
-        print(f"Generated response length: {len(result['agent_response'])}")
+        if emit:
+            await emit("summary", {"workflow_summary": result["workflow_summary"]})
         
         return AgentResponse(
-            agent_response=result["agent_response"],
+            agent_response=result["agent_response"] or "",
             tool_calls=result["tool_calls"],
             results=result["results"],
             workflow_summary=result["workflow_summary"]
         )
         
-    except HTTPException:
-        raise
     except Exception as e:
-        print(f"Error in chat_with_agent: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        if raise_errors:
+            raise
+        log.exception("workflow.failed", error=str(e))
         
         # Return a proper error response instead of raising an exception
         return AgentResponse(
@@ -1126,37 +1671,180 @@ async def chat_with_agent_workflow(request: AgentRequest):
             workflow_summary="Error occurred during processing"
         )
 
+@app.post("/agent/workflow/execute", response_model=AgentResponse)
+async def execute_workflow_dag(request: AgentRequest):
+    """
+    Execute a workflow graph directly, without the LLM in the loop.
+    Independent branches run in parallel; node parameters may reference
+    upstream outputs with {{node_id.result.field}} templates.
+    """
+    try:
+        dag = WorkflowDAG(request.tools)
+    except WorkflowError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    for tool in dag.tool_names():
+        if tool not in TOOL_DEFINITIONS:
+            raise HTTPException(status_code=400, detail=f"Unknown tool: {tool}")
+    
+    def inject_private_key(node, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        if request.private_key and "privateKey" in TOOL_DEFINITIONS[node.tool]["parameters"]["properties"]:
+            parameters.setdefault("privateKey", request.private_key)
+        return parameters
+    
+    async def run_node(tool_name: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        return await execute_tool(tool_name, parameters, request.full_tool_results)
+    
+    node_states = await dag.execute(run_node, prepare=inject_private_key)
+    
+    tool_calls = []
+    results = []
+    skipped = []
+    for node_id, state in node_states.items():
+        if state["status"] == "skipped":
+            skipped.append(node_id)
+            continue
+        tool_calls.append({"tool": state["tool"], "node_id": node_id, "parameters": state["parameters"]})
+        results.append(state["output"])
+    
+    WORKFLOW_TOOL_CALLS.labels(endpoint="workflow_execute").observe(len(tool_calls))
+    succeeded = sum(1 for result in results if result.get("success"))
+    agent_response = f"Workflow executed: {succeeded}/{len(results)} node(s) succeeded"
+    if skipped:
+        agent_response += f", skipped: {', '.join(skipped)}"
+    
+    return AgentResponse(
+        agent_response=agent_response,
+        tool_calls=tool_calls,
+        results=results,
+        workflow_summary=generate_workflow_summary(tool_calls, results)
+    )
+
+def collect_balance_entries(request: BalancesRequest) -> List[Dict[str, Any]]:
+    """One entry per requested address, in request order"""
+    entries = [{"address": address} for address in request.addresses]
+    entries += [
+        {"address": address, "node_id": node_id}
+        for node_id, address in (request.smart_accounts or {}).items()
+    ]
+    if not entries:
+        raise HTTPException(status_code=400, detail="No addresses given")
+    if len(entries) > BULK_BALANCE_MAX_ADDRESSES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many addresses: {len(entries)} (max {BULK_BALANCE_MAX_ADDRESSES})"
+        )
+    return entries
+
+async def fetch_balances(
+    request: BalancesRequest,
+    entries: List[Dict[str, Any]],
+    emit: Optional[EventEmitter] = None
+) -> BalancesResponse:
+    """Look up every entry with bounded concurrency, emitting each as it completes"""
+    tools = ["get_balance", "wallet_analytics"] if request.include_analytics else ["get_balance"]
+    semaphore = asyncio.Semaphore(BULK_BALANCE_CONCURRENCY)
+    
+    async def lookup(entry: Dict[str, Any]):
+        address = entry["address"]
+        if not FULL_ADDRESS_PATTERN.fullmatch(address):
+            entry.update(success=False, error="Invalid address")
+        else:
+            # Duplicate addresses are served by the tool cache's single-flight
+            async with semaphore:
+                results = await asyncio.gather(*[
+                    execute_tool(tool, {"address": address}, request.full_tool_results)
+                    for tool in tools
+                ])
+            entry["balance"] = results[0]
+            if request.include_analytics:
+                entry["analytics"] = results[1]
+            entry["success"] = all(result.get("success") for result in results)
+        if emit:
+            await emit("balance", entry)
+    
+    await asyncio.gather(*[lookup(entry) for entry in entries])
+    succeeded = sum(1 for entry in entries if entry["success"])
+    log.info("balances.completed", addresses=len(entries), failed=len(entries) - succeeded)
+    return BalancesResponse(balances=entries, succeeded=succeeded, failed=len(entries) - succeeded)
+
+@app.post("/agent/balances", response_model=BalancesResponse)
+async def get_balances(request: BalancesRequest):
+    """
+    Balances for many addresses (and/or a smart_accounts map) in one call.
+    Lookups run with bounded concurrency and reuse the read-only tool cache.
+    """
+    return await fetch_balances(request, collect_balance_entries(request))
+
+@app.post("/agent/balances/stream")
+async def get_balances_stream(request: BalancesRequest):
+    """
+    Streaming variant of /agent/balances: one balance event per address as
+    it completes, then a done event with the combined response.
+    """
+    entries = collect_balance_entries(request)
+    
+    async def run(emit: EventEmitter):
+        response = await fetch_balances(request, entries, emit)
+        return response.model_dump()
+    
+    return sse_response(run)
+
 @app.post("/agent/generate-code", response_model=CodeGenerationResponse)
 async def generate_code(request: CodeGenerationRequest):
     """
     Generate code based on workflow description using Groq AI.
     """
     try:
-        result = generate_code_from_workflow(
+        result = await generate_code_from_workflow(
             request.workflow_description,
             request.tools_used,
-            request.programming_language
+            request.programming_language,
+            regenerate=request.regenerate
         )
         
         return CodeGenerationResponse(
             generated_code=result["generated_code"],
             explanation=result["explanation"],
-            dependencies=result["dependencies"]
+            dependencies=result["dependencies"],
+            cached=result["cached"]
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint, including the circuit breaker state of each tool API used so far and the model ranking per task"""
+    models = model_router.snapshot() if model_router else {}
     return {
-        "status": "healthy", 
+        "status": "degraded" if tool_breakers.any_open() else "healthy",
         "service": "NCP AI Agent Builder",
         "ai_provider": "Groq",
-        "model": "llama3-groq-70b-8192-tool-use-preview"
+        "model": models.get("agent", {}).get("preferred"),
+        "models": models,
+        "tool_endpoints": tool_breakers.snapshot(),
+        "admission": admission.snapshot()
     }
 
+@app.delete("/agent/session")
+async def clear_session(request: SessionClearRequest):
+    """Forget the context remembered for the sending wallet across all agents
+
+    The wallet is resolved exactly as for chat requests, so a caller can only
+    clear the sessions it would also be served.
+    """
+    user = session_user_for(request.user_wallet_address)
+    if not user:
+        raise HTTPException(status_code=400, detail="user_wallet_address must be a 0x-prefixed 20-byte address")
+    await session_store.delete_prefix(f"{user}/")
+    return {"cleared": user}
+
 @app.get("/tools")
 async def list_tools():
     """List all available Web3 tools"""
@@ -1182,7 +1870,8 @@ async def root():
             "chat": "/agent/chat",
             "generate_code": "/agent/generate-code",
             "tools": "/tools",
-            "health": "/health"
+            "health": "/health",
+            "metrics": "/metrics"
         },
         "docs": "/docs"
     }
@@ -0,0 +1,260 @@
+"""
+Prometheus metrics for the agent
+Tool and Groq latency histograms, per-request iteration and tool-call
+counts, in-flight gauges, token counters, tool/code cache statistics,
+session counts, circuit breaker states, admission queueing and job
+counts, exposed on /metrics.
+With PROMETHEUS_MULTIPROC_DIR set (serve.py does this for WORKERS > 1) the
+counters, histograms and gauges are aggregated over all worker processes.
+"""
+
+import os
+from collections import defaultdict
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from circuit_breaker import tool_breakers, CLOSED, HALF_OPEN, OPEN
+from code_cache import code_cache
+from job_queue import job_queue
+from session_store import session_store
+from tool_cache import tool_cache
+
+TOOL_LATENCY = Histogram(
+    "agent_tool_latency_seconds",
+    "execute_tool latency by tool and result status",
+    ["tool", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+LLM_LATENCY = Histogram(
+    "agent_llm_latency_seconds",
+    "Groq chat completion latency by model and status",
+    ["model", "status"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+)
+
+LLM_TOKENS = Counter(
+    "agent_llm_tokens_total",
+    "Tokens reported in Groq usage, by model and type (prompt/completion)",
+    ["model", "type"]
+)
+
+LLM_IN_FLIGHT = Gauge(
+    "agent_llm_requests_in_flight",
+    "Groq calls currently in progress, by model",
+    ["model"],
+    multiprocess_mode="livesum"
+)
+
+LLM_ROUTING = Counter(
+    "agent_llm_routing_total",
+    "Model router events: hedge (request sent early), race_won (answered while another model was running), failover",
+    ["model", "event"]
+)
+
+AGENT_ITERATIONS = Histogram(
+    "agent_iterations_per_request",
+    "LLM iterations used by one agent conversation",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10)
+)
+
+WORKFLOW_TOOL_CALLS = Histogram(
+    "agent_tool_calls_per_workflow",
+    "Tool calls executed by one workflow request",
+    ["endpoint"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34)
+)
+
+TOOL_RETRIES = Counter(
+    "agent_tool_retries_total",
+    "Extra tool requests for idempotent tools: retry, hedge (duplicate sent) and hedge_won",
+    ["tool", "kind"]
+)
+
+PLAN_CACHE_LOOKUPS = Counter(
+    "agent_plan_cache_lookups_total",
+    "Plan cache outcomes: hit, miss, learning (seen but not yet confident), mismatch, replay_failed",
+    ["result"]
+)
+
+REQUESTS_IN_FLIGHT = Gauge(
+    "agent_http_requests_in_flight",
+    "HTTP requests currently being handled, by route",
+    ["route"],
+    multiprocess_mode="livesum"
+)
+
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "agent_admission_queue_depth",
+    "Requests waiting for an admission slot, by route",
+    ["route"],
+    multiprocess_mode="livesum"
+)
+
+ADMISSION_WAIT = Histogram(
+    "agent_admission_wait_seconds",
+    "Time admitted requests waited for a slot, by route",
+    ["route"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+ADMISSION_REJECTED = Counter(
+    "agent_admission_rejected_total",
+    "Requests answered 429 by admission control, by route and reason (queue_full, user_queue_full, timeout)",
+    ["route", "reason"]
+)
+
+
+def record_usage(model: str, usage) -> None:
+    """Count prompt/completion tokens from a Groq `usage` object (if any)"""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if prompt_tokens:
+        LLM_TOKENS.labels(model=model, type="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(model=model, type="completion").inc(completion_tokens)
+
+
+class InFlightMiddleware:
+    """ASGI middleware tracking in-flight requests per route (streams count until they finish)"""
+
+    def __init__(self, app):
+        self.app = app
+        self.route_paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if self.route_paths is None:
+            self.route_paths = {route.path for route in scope["app"].routes}
+        # Unknown paths share one label to keep cardinality bounded
+        route = scope["path"] if scope["path"] in self.route_paths else "other"
+        gauge = REQUESTS_IN_FLIGHT.labels(route=route)
+        gauge.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gauge.dec()
+
+
+class ToolCacheCollector:
+    """Exports tool_cache.stats() at scrape time"""
+
+    def describe(self):
+        # Names only: registering at import must not open a shared cache database
+        return self._families(defaultdict(int))
+
+    def collect(self):
+        return self._families(tool_cache.stats())
+
+    def _families(self, stats):
+        for name in ("hits", "misses", "coalesced"):
+            counter = CounterMetricFamily(f"agent_tool_cache_{name}", f"Tool cache {name}")
+            counter.add_metric([], stats[name])
+            yield counter
+        entries = GaugeMetricFamily("agent_tool_cache_entries", "Entries in the tool cache")
+        entries.add_metric([], stats["entries"])
+        yield entries
+        hit_rate = GaugeMetricFamily("agent_tool_cache_hit_ratio", "Share of lookups served without an upstream call")
+        hit_rate.add_metric([], stats["hit_rate"])
+        yield hit_rate
+
+
+class CodeCacheCollector:
+    """Exports code_cache.stats() at scrape time"""
+
+    def describe(self):
+        return self._families(defaultdict(int))
+
+    def collect(self):
+        return self._families(code_cache.stats())
+
+    def _families(self, stats):
+        lookups = CounterMetricFamily("agent_code_cache_lookups", "/agent/generate-code cache lookups by tier", labels=["result"])
+        lookups.add_metric(["memory_hit"], stats["memory_hits"])
+        lookups.add_metric(["disk_hit"], stats["disk_hits"])
+        lookups.add_metric(["miss"], stats["misses"])
+        yield lookups
+        entries = GaugeMetricFamily("agent_code_cache_entries", "Entries in the generated-code cache by tier", labels=["tier"])
+        entries.add_metric(["memory"], stats["memory_entries"])
+        entries.add_metric(["disk"], stats["disk_entries"])
+        yield entries
+        size = GaugeMetricFamily("agent_code_cache_disk_bytes", "Size of the cached results on disk")
+        size.add_metric([], stats["disk_bytes"])
+        yield size
+
+
+class SessionCollector:
+    """Exports the session store size at scrape time"""
+
+    def describe(self):
+        return self._families(0)
+
+    def collect(self):
+        return self._families(len(session_store.backend))
+
+    def _families(self, size):
+        sessions = GaugeMetricFamily("agent_sessions", "Sessions held by the session store")
+        sessions.add_metric([], size)
+        yield sessions
+
+
+class BreakerCollector:
+    """Exports tool API circuit breaker state and adaptive timeouts at scrape time"""
+
+    STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def collect(self):
+        state = GaugeMetricFamily("agent_tool_breaker_state", "Circuit breaker state per tool (0 closed, 1 half-open, 2 open)", labels=["tool"])
+        timeout = GaugeMetricFamily("agent_tool_timeout_seconds", "Current request timeout per tool", labels=["tool"])
+        for tool, snapshot in tool_breakers.snapshot().items():
+            state.add_metric([tool], self.STATE_VALUES[snapshot["state"]])
+            timeout.add_metric([tool], snapshot["timeout_seconds"])
+        yield state
+        yield timeout
+
+
+class JobCollector:
+    """Exports background job counts by status at scrape time"""
+
+    def describe(self):
+        return self._families({})
+
+    def collect(self):
+        return self._families(job_queue.store.counts())
+
+    def _families(self, counts):
+        jobs = GaugeMetricFamily("agent_jobs", "Background jobs in the job store by status", labels=["status"])
+        for status, count in counts.items():
+            jobs.add_metric([status], count)
+        yield jobs
+
+
+# Scrape-time collectors read this process's caches (shared SQLite tiers are global;
+# hit/miss counters are those of the worker answering the scrape)
+STATE_COLLECTORS = (ToolCacheCollector(), CodeCacheCollector(), SessionCollector(), BreakerCollector(), JobCollector())
+
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+for collector in STATE_COLLECTORS:
+    REGISTRY.register(collector)
+
+
+def render_metrics() -> bytes:
+    """Prometheus text exposition, merged across workers in multiprocess mode"""
+    if not MULTIPROCESS:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in STATE_COLLECTORS:
+        registry.register(collector)
+    return generate_latest(registry)
+
+
+def mark_worker_exited():
+    """Drop this worker's live gauges from the multiprocess aggregate"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
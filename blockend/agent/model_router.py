@@ -0,0 +1,250 @@
+"""
+Latency-aware model selection for the Groq calls
+Each task (agent tool-calling loop, chat, code generation) has an ordered,
+configurable list of models. The router tracks rolling latency and error
+rate per model, skips unhealthy ones, promotes a clearly faster healthy
+model, and hedges: when the chosen model is slower than its usual p95 the
+next model is asked too and the first answer wins.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+
+from llm_client import LLMClient
+from metrics import LLM_ROUTING
+from structured_logging import get_logger
+
+# Comma-separated, most preferred first; ":no-tools" marks a model called without tool definitions
+LLM_MODELS = {
+    "agent": os.getenv("LLM_MODELS_AGENT", "llama3-groq-70b-8192-tool-use-preview,llama3-70b-8192:no-tools"),
+    "chat": os.getenv("LLM_MODELS_CHAT", "llama-3.1-70b-versatile,llama3-70b-8192"),
+    "code": os.getenv("LLM_MODELS_CODE", "llama3-70b-8192"),
+}
+LLM_HEALTH_WINDOW = int(os.getenv("LLM_HEALTH_WINDOW", "20"))  # recent calls per model
+LLM_MAX_ERROR_RATE = float(os.getenv("LLM_MAX_ERROR_RATE", "0.5"))
+LLM_MIN_SAMPLES = int(os.getenv("LLM_MIN_SAMPLES", "5"))  # before latency is trusted
+LLM_PREFER_FASTER_RATIO = float(os.getenv("LLM_PREFER_FASTER_RATIO", "0.7"))  # promote a model this much faster
+LLM_RECOVERY_SECONDS = float(os.getenv("LLM_RECOVERY_SECONDS", "30"))  # unhealthy model is tried again after this long without failures
+LLM_HEDGE = os.getenv("LLM_HEDGE", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "8"))  # before a model has latency samples
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+
+log = get_logger("model_router")
+
+
+class NoFailover(Exception):
+    """Wraps an error that must not be retried on another model (e.g. tokens were already streamed)"""
+
+    def __init__(self, error: BaseException):
+        super().__init__(str(error))
+        self.error = error
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    name: str
+    tools: bool = True
+
+
+def parse_models(spec: str) -> List[ModelSpec]:
+    models = []
+    for item in spec.split(","):
+        name, _, flag = item.strip().partition(":")
+        if name:
+            models.append(ModelSpec(name, tools=flag != "no-tools"))
+    return models
+
+
+class ModelStats:
+    def __init__(self):
+        self.outcomes: deque = deque(maxlen=LLM_HEALTH_WINDOW)  # True = success
+        self.latencies: deque = deque(maxlen=LLM_HEALTH_WINDOW)  # seconds, successful calls only
+        self.last_failure = 0.0
+
+    def record(self, success: bool, latency: Optional[float] = None):
+        self.outcomes.append(success)
+        if not success:
+            self.last_failure = time.monotonic()
+        if success and latency is not None:
+            self.latencies.append(latency)
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    @property
+    def healthy(self) -> bool:
+        if len(self.outcomes) < LLM_MIN_SAMPLES or self.error_rate < LLM_MAX_ERROR_RATE:
+            return True
+        # Give it another chance once it has been quiet for a while
+        return time.monotonic() - self.last_failure >= LLM_RECOVERY_SECONDS
+
+    def quantile(self, pct: float) -> Optional[float]:
+        if len(self.latencies) < LLM_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class ModelRouter:
+    """Chooses, hedges and fails over between the models configured for a task"""
+
+    def __init__(self, client: LLMClient, models: Optional[Dict[str, str]] = None):
+        self.client = client
+        self.models = {task: parse_models(spec) for task, spec in (models or LLM_MODELS).items()}
+        self._stats: Dict[str, ModelStats] = {}
+
+    def stats(self, model: str) -> ModelStats:
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = ModelStats()
+        return stats
+
+    def models_key(self, task: str) -> str:
+        """Identifies the configured models of a task (e.g. for cache keys)"""
+        return ",".join(spec.name for spec in self.models[task])
+
+    def ranked(self, task: str, tools: bool = False) -> List[ModelSpec]:
+        """Healthy models in configured order, with a clearly faster one moved first; unhealthy ones last
+
+        With `tools`, models that cannot take tool definitions are never
+        promoted: they go after every tool-capable model, as error-only failover.
+        """
+        specs = [spec for spec in self.models[task] if spec.tools or not tools]
+        fallback = [spec for spec in self.models[task] if tools and not spec.tools]
+        healthy = [spec for spec in specs if self.stats(spec.name).healthy]
+        unhealthy = [spec for spec in specs if not self.stats(spec.name).healthy]
+        if len(healthy) > 1:
+            best = healthy[0]
+            for spec in healthy[1:]:
+                best_p50 = self.stats(best.name).quantile(50)
+                p50 = self.stats(spec.name).quantile(50)
+                if best_p50 is not None and p50 is not None and p50 < best_p50 * LLM_PREFER_FASTER_RATIO:
+                    best = spec
+            healthy.remove(best)
+            healthy.insert(0, best)
+        return healthy + unhealthy + fallback
+
+    def hedge_delay(self, model: str) -> float:
+        p95 = self.stats(model).quantile(95)
+        return max(LLM_HEDGE_MIN_DELAY, p95) if p95 is not None else LLM_HEDGE_DEFAULT_DELAY
+
+    async def _attempt(self, spec: ModelSpec, request: Callable[[ModelSpec], Awaitable[Any]]):
+        start = time.perf_counter()
+        try:
+            result = await request(spec)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats(spec.name).record(False)
+            raise
+        self.stats(spec.name).record(True, time.perf_counter() - start)
+        return result
+
+    async def _run(self, task: str, request: Callable[[ModelSpec], Awaitable[Any]], hedge: bool, tools: bool = False):
+        """Try the ranked models; with `hedge`, start the next one early when the current one is slow
+
+        A model without tool support is never raced against a tool-capable
+        one when `tools` were requested; it is only tried once the others failed.
+        """
+        queue = self.ranked(task, tools)
+        running: Dict[asyncio.Task, ModelSpec] = {}
+        last_error: Optional[BaseException] = None
+        try:
+            while queue or running:
+                if not running:
+                    spec = queue.pop(0)
+                    if last_error is not None:
+                        LLM_ROUTING.labels(model=spec.name, event="failover").inc()
+                        log.warning("llm.failover", task=task, model=spec.name, error=str(last_error))
+                    running[asyncio.ensure_future(self._attempt(spec, request))] = spec
+                timeout = None
+                if hedge and queue and len(running) == 1 and (queue[0].tools or not tools):
+                    timeout = self.hedge_delay(next(iter(running.values())).name)
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    spec = queue.pop(0)
+                    LLM_ROUTING.labels(model=spec.name, event="hedge").inc()
+                    log.info("llm.hedge", task=task, slow_model=next(iter(running.values())).name, model=spec.name)
+                    running[asyncio.ensure_future(self._attempt(spec, request))] = spec
+                    continue
+                for task_future in done:
+                    spec = running.pop(task_future)
+                    if task_future.exception() is None:
+                        if running:
+                            LLM_ROUTING.labels(model=spec.name, event="race_won").inc()
+                        return task_future.result()
+                    last_error = task_future.exception()
+                    if isinstance(last_error, NoFailover):
+                        raise last_error.error
+            raise last_error or RuntimeError(f"No models configured for {task}")
+        finally:
+            for task_future in running:
+                task_future.cancel()
+
+    async def complete(self, task: str, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None, **kwargs):
+        """Chat completion on the best model for `task`"""
+        async def request(spec: ModelSpec):
+            model_tools = tools if spec.tools else None
+            return await self.client.complete(model=spec.name, messages=messages, tools=model_tools, **kwargs)
+        return await self._run(task, request, hedge=LLM_HEDGE, tools=bool(tools))
+
+    async def stream_message(
+        self,
+        task: str,
+        messages: List[Dict[str, Any]],
+        on_token: Callable[[str], Awaitable[None]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        on_reset: Optional[Callable[[str, str], Awaitable[None]]] = None,
+        **kwargs
+    ) -> SimpleNamespace:
+        """Streamed completion; never hedged (two streams would interleave tokens), only failed over
+
+        A model failing after it streamed tokens is only failed over when
+        `on_reset(model, error)` is given to tell the client to discard them;
+        otherwise the error is raised.
+        """
+        streamed = False
+
+        async def forward(text: str):
+            nonlocal streamed
+            streamed = True
+            await on_token(text)
+
+        async def request(spec: ModelSpec):
+            nonlocal streamed
+            model_tools = tools if spec.tools else None
+            try:
+                return await self.client.stream_message(model=spec.name, messages=messages, on_token=forward, tools=model_tools, **kwargs)
+            except Exception as e:
+                if not streamed:
+                    raise
+                if on_reset is None:
+                    raise NoFailover(e)
+                await on_reset(spec.name, str(e))
+                streamed = False
+                raise
+        return await self._run(task, request, hedge=False, tools=bool(tools))
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = {}
+        for task in self.models:
+            # A task with a no-tools model configured is one called with tools
+            ranked = self.ranked(task, tools=any(not spec.tools for spec in self.models[task]))
+            models = []
+            for spec in ranked:
+                stats = self.stats(spec.name)
+                p50 = stats.quantile(50)
+                models.append({
+                    "model": spec.name,
+                    "healthy": stats.healthy,
+                    "error_rate": round(stats.error_rate, 3),
+                    "p50_ms": round(p50 * 1000) if p50 is not None else None
+                })
+            snapshot[task] = {"preferred": ranked[0].name if ranked else None, "models": models}
+        return snapshot
@@ -0,0 +1,225 @@
+"""
+Plan memoization for LLM-driven workflows
+Records the tool-call sequence the agent produced for a workflow shape and
+a parameterized user message, with values taken from the message replaced
+by slots and values taken from the request context (wallet, smart accounts,
+context fields) replaced by named references. Once the same plan has been
+seen for different slot values it can be replayed with new values instead
+of asking the LLM again. A write call carrying any other literal that is not
+a word of the message (e.g. a slippage the LLM picked itself) is never
+learned, since it may have been derived from an earlier tool result.
+In multi-worker mode plans are kept in a shared SQLite table.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, Optional, Tuple, Set
+
+from shared_state import MULTI_WORKER, SharedTTLStore, shared_path
+
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "512"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "3600"))
+# Distinct slot-value sets that must have produced the same plan before it is replayed
+PLAN_CACHE_MIN_OBSERVATIONS = int(os.getenv("PLAN_CACHE_MIN_OBSERVATIONS", "2"))
+
+SLOT_PATTERN = re.compile(r'(0x[a-fA-F0-9]{35,42})|(\d+(?:\.\d+)?)')
+WORD_PATTERN = re.compile(r"[a-z][a-z0-9_\-]*")
+
+Turn = List[Tuple[str, Dict[str, Any]]]  # Stored as [tool, arguments] lists so plans round-trip through JSON
+
+
+def message_template(message: str) -> Tuple[str, List[str]]:
+    """Normalized message with addresses/numbers replaced by slots, plus the slot values"""
+    slots: List[str] = []
+
+    def replace(match):
+        slots.append(match.group(0))
+        return "<address>" if match.group(1) else "<number>"
+
+    template = SLOT_PATTERN.sub(replace, message)
+    return " ".join(template.lower().split()), slots
+
+
+def _slot_index(value: Any, slots: List[str]) -> Optional[int]:
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return None
+    text = str(value).lower()
+    for index, slot in enumerate(slots):
+        if text == slot.lower():
+            return index
+    return None
+
+
+def _context_name(value: Any, context: Dict[str, Any]) -> Optional[str]:
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return None
+    text = str(value).lower()
+    for name, known in context.items():
+        if str(known).lower() == text:
+            return name
+    return None
+
+
+def parameterize(value: Any, slots: List[str], context: Optional[Dict[str, Any]] = None) -> Any:
+    """Replace values from the message with {"$slot": index} and values from the context with {"$context": name}"""
+    if isinstance(value, dict):
+        return {key: parameterize(val, slots, context) for key, val in value.items()}
+    if isinstance(value, list):
+        return [parameterize(item, slots, context) for item in value]
+    index = _slot_index(value, slots)
+    if index is not None:
+        return {"$slot": index, "type": type(value).__name__}
+    name = _context_name(value, context or {})
+    if name is not None:
+        return {"$context": name, "type": type(value).__name__}
+    return value
+
+
+def template_words(template: str) -> Set[str]:
+    return set(WORD_PATTERN.findall(template))
+
+
+def fully_parameterized(template: Any, words: Set[str] = frozenset()) -> bool:
+    """Whether every value of a parameterized argument tree is a slot or context reference
+
+    A string that is a word of the message template (e.g. "ETH" in "send
+    <number> eth to <address>") is fixed by the plan key and allowed too. Any
+    other literal may have been derived from an earlier tool result (e.g. an
+    amount computed from a price) and would be frozen by a replay.
+    """
+    if isinstance(template, dict):
+        if "$slot" in template or "$context" in template:
+            return True
+        return all(fully_parameterized(val, words) for val in template.values())
+    if isinstance(template, list):
+        return all(fully_parameterized(item, words) for item in template)
+    if isinstance(template, str):
+        return template.lower() in words
+    return template is None
+
+
+def substitute(template: Any, slots: List[str], context: Optional[Dict[str, Any]] = None) -> Any:
+    """Fill slot and context references with this request's values
+
+    A missing slot or context value raises IndexError/KeyError, a value that
+    doesn't fit the recorded type ValueError (both a mismatch).
+    """
+    if isinstance(template, dict):
+        if "$slot" in template or "$context" in template:
+            if "$slot" in template:
+                value = slots[template["$slot"]]
+            else:
+                value = (context or {})[template["$context"]]
+            if template["type"] == "int":
+                return int(value)
+            if template["type"] == "float":
+                return float(value)
+            return str(value)
+        return {key: substitute(val, slots, context) for key, val in template.items()}
+    if isinstance(template, list):
+        return [substitute(item, slots, context) for item in template]
+    return template
+
+
+class PlanEntry:
+    def __init__(self, turns: List[Turn], slot_values: Tuple[str, ...]):
+        self.turns = turns
+        self.observed: Set[Tuple[str, ...]] = {slot_values}
+        self.expires_at = time.monotonic() + PLAN_CACHE_TTL
+
+    @property
+    def confident(self) -> bool:
+        return len(self.observed) >= PLAN_CACHE_MIN_OBSERVATIONS
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"turns": self.turns, "observed": sorted(self.observed)}
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "PlanEntry":
+        entry = cls(data["turns"], ())
+        entry.observed = {tuple(values) for values in data["observed"]}
+        return entry
+
+
+class PlanCache:
+    """LRU of learned tool plans keyed by workflow shape and message template"""
+
+    def __init__(self, max_entries: int = PLAN_CACHE_MAX_ENTRIES, shared: Optional[SharedTTLStore] = None):
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries: "OrderedDict[str, PlanEntry]" = OrderedDict()
+
+    @staticmethod
+    def make_key(workflow_key: Any, template: str, has_private_key: bool, context: Optional[Dict[str, Any]]) -> str:
+        """`context` should hold everything besides the message that shapes the plan (e.g. the user's wallet)"""
+        raw = json.dumps([workflow_key, template, has_private_key, context], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def lookup(self, key: str) -> Optional[PlanEntry]:
+        if self.shared is not None:
+            data = await asyncio.to_thread(self.shared.get, key)
+            return PlanEntry.from_json(data) if data is not None else None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def record(
+        self,
+        key: str,
+        turns: List[Turn],
+        slots: List[str],
+        write_tools: Iterable[str] = (),
+        context: Optional[Dict[str, Any]] = None,
+        template: str = ""
+    ) -> Optional[PlanEntry]:
+        """Store the parameterized plan of a successful run, confirming or replacing the existing one
+
+        `context` maps names to request values besides the message (see
+        parameterize); `template` is the message template the key was built
+        from. Plans whose calls to `write_tools` (state-changing tools) carry
+        any value taken from none of these are not stored; returns None then.
+        """
+        planned = [[[tool, parameterize(args, slots, context)] for tool, args in turn] for turn in turns]
+        write_tools = set(write_tools)
+        words = template_words(template)
+        if not all(fully_parameterized(args, words) for turn in planned for tool, args in turn if tool in write_tools):
+            return None
+        slot_values = tuple(slot.lower() for slot in slots)
+        entry = await self.lookup(key)
+        confirmed = entry is not None and entry.turns == planned
+        if confirmed:
+            entry.observed.add(slot_values)
+        else:
+            entry = PlanEntry(planned, slot_values)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.put, key, entry.to_json(), PLAN_CACHE_TTL)
+        elif not confirmed:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    async def invalidate(self, key: str):
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.delete, key)
+            return
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self.shared) if self.shared is not None else len(self._entries)
+
+
+plan_cache = PlanCache(
+    shared=SharedTTLStore(shared_path("plan_cache.sqlite3"), "plans", PLAN_CACHE_MAX_ENTRIES) if MULTI_WORKER else None
+)
@@ -0,0 +1,105 @@
+"""
+Retries and hedged requests for idempotent (read-only) tool calls
+Transient failures are retried with exponentially growing, fully jittered
+delays. A call still pending after the endpoint's p95 latency gets a
+duplicate request and the first successful reply wins. Both draw from a
+retry budget so an outage cannot multiply the load on the tool API.
+"""
+
+import asyncio
+import os
+import random
+from typing import Dict, Any, Callable, Awaitable, Optional
+
+from metrics import TOOL_RETRIES
+
+TOOL_RETRY_ATTEMPTS = int(os.getenv("TOOL_RETRY_ATTEMPTS", "3"))  # including the first
+TOOL_RETRY_BASE_DELAY = float(os.getenv("TOOL_RETRY_BASE_DELAY", "0.1"))
+TOOL_RETRY_MAX_DELAY = float(os.getenv("TOOL_RETRY_MAX_DELAY", "2"))
+# Extra requests (retries + hedges) allowed per first attempt, e.g. 0.2 = at most 20% more load
+TOOL_RETRY_BUDGET_RATIO = float(os.getenv("TOOL_RETRY_BUDGET_RATIO", "0.2"))
+TOOL_RETRY_BUDGET_BURST = float(os.getenv("TOOL_RETRY_BUDGET_BURST", "10"))
+TOOL_HEDGING = os.getenv("TOOL_HEDGING", "true").lower() in ("1", "true", "yes")
+
+ToolCall = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class RetryBudget:
+    """Token bucket: every first attempt earns `ratio` tokens, every extra request spends one"""
+
+    def __init__(self, ratio: float = TOOL_RETRY_BUDGET_RATIO, burst: float = TOOL_RETRY_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def backoff_delay(retry: int) -> float:
+    """Full jitter: uniform in [0, min(max_delay, base * 2^retry)]"""
+    return random.uniform(0, min(TOOL_RETRY_MAX_DELAY, TOOL_RETRY_BASE_DELAY * 2 ** retry))
+
+
+class RetryPolicy:
+    def __init__(self):
+        self._budgets: Dict[str, RetryBudget] = {}
+
+    def budget(self, tool_name: str) -> RetryBudget:
+        budget = self._budgets.get(tool_name)
+        if budget is None:
+            budget = self._budgets[tool_name] = RetryBudget()
+        return budget
+
+    async def _hedged(self, tool_name: str, call: ToolCall, hedge_after: Optional[float]) -> Dict[str, Any]:
+        """Run `call`, duplicating it once if it is still pending after `hedge_after` seconds"""
+        if not TOOL_HEDGING or hedge_after is None:
+            return await call()
+        first = asyncio.ensure_future(call())
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_after)
+            if done or not self.budget(tool_name).withdraw():
+                return await first
+
+            TOOL_RETRIES.labels(tool=tool_name, kind="hedge").inc()
+            hedge = asyncio.ensure_future(call())
+            pending = {first, hedge}
+            result: Dict[str, Any] = {}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result.get("success"):
+                        if task is hedge:
+                            TOOL_RETRIES.labels(tool=tool_name, kind="hedge_won").inc()
+                        return result
+            return result
+        finally:
+            # The losing request (or both, if we were cancelled) is abandoned
+            for task in pending:
+                task.cancel()
+
+    async def call(self, tool_name: str, call: ToolCall, hedge_after: Optional[float] = None) -> Dict[str, Any]:
+        """Call an idempotent tool with retries on transient failures and optional hedging"""
+        budget = self.budget(tool_name)
+        budget.deposit()
+        result = await self._hedged(tool_name, call, hedge_after)
+        for retry in range(TOOL_RETRY_ATTEMPTS - 1):
+            if result.get("success") or not result.get("retryable"):
+                break
+            if not budget.withdraw():
+                break
+            TOOL_RETRIES.labels(tool=tool_name, kind="retry").inc()
+            await asyncio.sleep(backoff_delay(retry))
+            result = await self._hedged(tool_name, call, hedge_after)
+        return result
+
+
+retry_policy = RetryPolicy()
@@ -0,0 +1,43 @@
+"""
+Multi-worker launcher for the agent
+Starts N uvicorn worker processes for main:app. Caches, sessions and learned
+plans move to SQLite files under SHARED_STATE_DIR and Prometheus metrics are
+aggregated across workers (see shared_state.py).
+
+Usage:
+    python serve.py --workers 4
+    WORKERS=4 python serve.py --port 8000
+"""
+
+import argparse
+import os
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the agent with several worker processes")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--log-level", default="warning", help="uvicorn's own log level")
+    args = parser.parse_args()
+
+    # Workers are spawned fresh and read their mode from the environment
+    os.environ["WORKERS"] = str(args.workers)
+    if args.workers > 1:
+        from shared_state import prepare_multiprocess_metrics
+        prepare_multiprocess_metrics()
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        app_dir=os.path.dirname(os.path.abspath(__file__))
+    )
+
+
+if __name__ == "__main__":
+    main()
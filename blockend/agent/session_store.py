@@ -0,0 +1,151 @@
+"""
+Per-user session context
+Remembers what the frontend sent last for a user and agent (smart accounts,
+execution plan) so later requests can omit it. Entries expire after
+SESSION_TTL and the store is LRU-bounded by SESSION_MAX_ENTRIES, in memory
+or, with SESSION_STORE_PATH set (the default with WORKERS > 1), in a SQLite
+file shared by all workers and across restarts.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from shared_state import MULTI_WORKER, LazyDatabase, shared_path
+
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+# Empty keeps sessions in process memory
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", shared_path("sessions.sqlite3") if MULTI_WORKER else "")
+
+# Request fields remembered between requests (never private keys, nor the wallet,
+# which must stay disconnected when the frontend stops sending it)
+SESSION_FIELDS = ("smart_accounts", "execution_plan")
+
+
+class MemorySessionBackend:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at <= time.time():
+            del self._entries[session_id]
+            return None
+        self._entries.move_to_end(session_id)
+        return data
+
+    def put(self, session_id: str, data: Dict[str, Any], ttl: float):
+        self._entries[session_id] = (time.time() + ttl, data)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, session_id: str):
+        self._entries.pop(session_id, None)
+
+    def delete_prefix(self, prefix: str):
+        for session_id in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[session_id]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteSessionBackend:
+    """Blocking SQLite backend; SessionStore calls it from a worker thread"""
+
+    def __init__(self, path: str, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._database = LazyDatabase(
+            path,
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL, accessed REAL NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed)"
+        )
+
+    @property
+    def _db(self):
+        return self._database.connection
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM sessions WHERE id = ? AND expires_at > ?", (session_id, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE sessions SET accessed = ? WHERE id = ?", (now, session_id))
+        return json.loads(row[0])
+
+    def put(self, session_id: str, data: Dict[str, Any], ttl: float):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires_at, accessed) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(data), now + ttl, now)
+            )
+            self._db.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            self._db.execute(
+                "DELETE FROM sessions WHERE id IN "
+                "(SELECT id FROM sessions ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE substr(id, 1, ?) = ?", (len(prefix), prefix))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SessionStore:
+    """Async facade over the memory or SQLite backend"""
+
+    def __init__(self, path: str = SESSION_STORE_PATH, max_entries: int = SESSION_MAX_ENTRIES, ttl: float = SESSION_TTL):
+        self.ttl = ttl
+        self.persistent = bool(path)
+        self.backend = SQLiteSessionBackend(path, max_entries) if path else MemorySessionBackend(max_entries)
+
+    async def _call(self, method: str, *args):
+        if self.persistent:
+            return await asyncio.to_thread(getattr(self.backend, method), *args)
+        return getattr(self.backend, method)(*args)
+
+    async def get(self, session_id: str) -> Dict[str, Any]:
+        return await self._call("get", session_id) or {}
+
+    async def update(self, session_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge the `fields` a request sent (empty values included) into the session and refresh its TTL"""
+        data = dict(await self.get(session_id))
+        data.update(fields)
+        await self._call("put", session_id, data, self.ttl)
+        return data
+
+    async def delete(self, session_id: str):
+        await self._call("delete", session_id)
+
+    async def delete_prefix(self, prefix: str):
+        await self._call("delete_prefix", prefix)
+
+    async def size(self) -> int:
+        return await self._call("__len__")
+
+
+session_store = SessionStore()
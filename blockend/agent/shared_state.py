@@ -0,0 +1,169 @@
+"""
+State shared between uvicorn worker processes
+With WORKERS > 1 (see serve.py) caches, sessions and learned plans live in
+SQLite files (WAL mode) under SHARED_STATE_DIR instead of process memory, so
+every worker sees the same entries and invalidations.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterable, Optional
+
+WORKERS = int(os.getenv("WORKERS", "1"))
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".shared_state"))
+# Seconds a writer waits for another process's write lock
+SHARED_STATE_BUSY_TIMEOUT = float(os.getenv("SHARED_STATE_BUSY_TIMEOUT", "5"))
+
+MULTI_WORKER = WORKERS > 1
+
+
+def shared_path(name: str) -> str:
+    """Path of a shared database file (SHARED_STATE_DIR is created when it is opened)"""
+    return os.path.join(SHARED_STATE_DIR, name)
+
+
+def open_database(path: str) -> sqlite3.Connection:
+    """Autocommit SQLite connection in WAL mode, usable from worker threads"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=SHARED_STATE_BUSY_TIMEOUT)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class LazyDatabase:
+    """A database opened, and its schema statements run, on first use
+
+    Stores are built at import time; deferring the file creation keeps
+    importing a module (e.g. main.py in a test or tool) free of side effects.
+    """
+
+    def __init__(self, path: str, *schema: str):
+        self.path = path
+        self.schema = schema
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    db = open_database(self.path)
+                    for statement in self.schema:
+                        db.execute(statement)
+                    self._db = db
+        return self._db
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def prepare_multiprocess_metrics() -> str:
+    """Point prometheus_client at a fresh multiprocess directory (call before workers start)"""
+    path = os.path.join(SHARED_STATE_DIR, "prometheus")
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+    return path
+
+
+class SharedTTLStore:
+    """JSON values with expiry in one SQLite table (blocking; call from a worker thread)
+
+    Entries can carry a tag (e.g. the address a cached balance belongs to).
+    Deleting by tag bumps a generation counter, so a writer that fetched
+    before an invalidation in any process can skip storing a stale value.
+    """
+
+    def __init__(self, path: str, table: str, max_entries: int):
+        self.table = table
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._database = LazyDatabase(
+            path,
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, tag TEXT, expires_at REAL NOT NULL, accessed REAL NOT NULL)",
+            f"CREATE INDEX IF NOT EXISTS {table}_tag ON {table} (tag)",
+            f"CREATE INDEX IF NOT EXISTS {table}_accessed ON {table} (accessed)",
+            "CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+            f"INSERT OR IGNORE INTO generations (name, value) VALUES ('{table}', 0)"
+        )
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        return self._database.connection
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT value FROM {self.table} WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT value FROM generations WHERE name = ?", (self.table,)).fetchone()[0]
+
+    def put(self, key: str, value: Any, ttl: float, tag: Optional[str] = None, generation: Optional[int] = None) -> bool:
+        """Store `value`; with `generation`, only if no tag deletion happened since it was read"""
+        now = time.time()
+        with self._transaction():
+            current = self._db.execute("SELECT value FROM generations WHERE name = ?", (self.table,)).fetchone()[0]
+            if generation is not None and generation != current:
+                return False
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, tag, expires_at, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value, default=str), tag, now + ttl, now)
+            )
+            self._db.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+            self._db.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+        return True
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def _delete_where(self, condition: str, params: Iterable[Any]):
+        with self._transaction():
+            self._db.execute("UPDATE generations SET value = value + 1 WHERE name = ?", (self.table,))
+            self._db.execute(f"DELETE FROM {self.table} WHERE {condition}", tuple(params))
+
+    def delete_tags(self, tags: Iterable[str]):
+        tags = list(tags)
+        if tags:
+            self._delete_where(f"tag IN ({', '.join('?' for _ in tags)})", tags)
+
+    def delete_tagged(self):
+        self._delete_where("tag IS NOT NULL", ())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM {self.table} WHERE expires_at > ?", (time.time(),)).fetchone()[0]
@@ -0,0 +1,38 @@
+"""
+Single-flight de-duplication of concurrent async work
+Concurrent callers with the same key share one running task. The work runs
+as its own task and every caller awaits it through asyncio.shield, so a
+cancelled caller (e.g. a client disconnect) never cancels it under the rest.
+"""
+
+import asyncio
+from typing import Dict, Any, Callable, Awaitable
+
+
+class SingleFlight:
+    """One in-flight task per key, shared by every caller of that key"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def do(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        """Await the task running for `key`, starting `work()` if there is none"""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(work())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark retrieved so a failure nobody awaited anymore isn't logged
+            task.exception()
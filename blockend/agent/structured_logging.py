@@ -0,0 +1,183 @@
+"""
+Queue-backed structured logging
+Log calls only redact and enqueue a record; a background thread formats
+(JSON or text) and writes it, so stdout I/O never runs on the request path.
+Secret fields are masked, and INFO/DEBUG lines can be sampled per route.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Any, Iterable, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json or text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# e.g. "/agent/chat=0.1,/agent/workflow=0.5"; routes not listed log everything
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+REDACTED = "***"
+
+# Extended with the `secret_fields` declared in TOOL_DEFINITIONS
+SECRET_FIELDS = {"privateKey", "private_key", "apiKey", "api_key", "GROQ_API_KEY"}
+
+_route: ContextVar[Optional[str]] = ContextVar("log_route", default=None)
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            route, rate = item.split("=", 1)
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+SAMPLE_RATES = parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+def register_secret_fields(fields: Iterable[str]):
+    """Add field names whose values must never be logged"""
+    SECRET_FIELDS.update(fields)
+
+
+def redact(value: Any) -> Any:
+    """Copy of `value` with secret fields masked at any depth"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if key in SECRET_FIELDS and val is not None else redact(val)
+            for key, val in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueue records without blocking; drop them when the queue is full"""
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage()
+        }
+        if getattr(record, "route", None):
+            entry["route"] = record.route
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{key}={value}" for key, value in getattr(record, "fields", {}).items())
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.getMessage()} {fields}".rstrip()
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class StructuredLogger:
+    """logger.info("event.name", key=value, ...) with redaction and sampling"""
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+
+    def _log(self, level: int, event: str, fields: Dict[str, Any], exc_info: bool = False):
+        if not self._logger.isEnabledFor(level):
+            return
+        # Warnings and errors are never sampled away
+        if level < logging.WARNING and not _sampled.get():
+            return
+        self._logger.log(
+            level,
+            event,
+            exc_info=exc_info,
+            extra={"fields": redact(fields), "route": _route.get()}
+        )
+
+    def debug(self, event: str, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields):
+        """Error with the current exception's traceback"""
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging():
+    """Install the queue handler and start the writer thread (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(TextFormatter() if LOG_FORMAT == "text" else JsonFormatter())
+    log_queue: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger("agent")
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.propagate = False
+    _listener = QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    configure_logging()
+    return StructuredLogger(logging.getLogger(f"agent.{name}"))
+
+
+class LogContextMiddleware:
+    """ASGI middleware that tags log lines with the route and makes the per-request sampling decision"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        rate = SAMPLE_RATES.get(path, 1.0)
+        route_token = _route.set(path)
+        sampled_token = _sampled.set(rate >= 1.0 or random.random() < rate)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _route.reset(route_token)
+            _sampled.reset(sampled_token)
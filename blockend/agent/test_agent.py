@@ -148,6 +148,707 @@ def test_defi_workflow():
     print("Agent Response:", data["agent_response"])
     print("Workflow Summary:", data["workflow_summary"])
 
+def test_transfer_projection():
+    """Test that the transfer projection keeps the prepared UserOperation (no server needed)"""
+    from main import TOOL_DEFINITIONS
+    from tool_projection import project_result
+
+    # Shape returned by frontend/app/api/transfer/route.ts for an ERC-20 transfer
+    prepared = {
+        "type": "ERC20",
+        "from": "0x1111111111111111111111111111111111111111",
+        "to": "0x2222222222222222222222222222222222222222",
+        "recipient": "0x3333333333333333333333333333333333333333",
+        "amount": "1.5",
+        "amountWei": "1500000",
+        "nodeId": "node-3",
+        "data": "0xa9059cbb",
+        "tokenAddress": "0x2222222222222222222222222222222222222222",
+        "tokenDecimals": 6,
+        "message": "Transaction data prepared. Execute this transfer from the frontend using the user's wallet to sign the UserOperation."
+    }
+    result = {"success": True, "result": {"success": True, "result": dict(prepared)}, "endpoint": "/api/transfer"}
+
+    projected = project_result(result, TOOL_DEFINITIONS["transfer"])
+    assert projected["result"]["result"] == prepared, projected
+    assert "endpoint" not in projected
+
+    print("\n" + "="*60)
+    print("TRANSFER PROJECTION TEST")
+    print("="*60)
+    print("Projected fields:", sorted(projected["result"]["result"]))
+
+def test_model_router_keeps_tools():
+    """Test that a no-tools fallback model is never promoted or hedged to on a tool call (no server needed)"""
+    import asyncio
+    from model_router import ModelRouter
+
+    calls = []
+
+    class FakeClient:
+        def __init__(self, fail=False):
+            self.fail = fail
+
+        async def complete(self, model, messages, tools=None, **kwargs):
+            calls.append((model, tools))
+            if model == "tool-model":
+                if self.fail:
+                    raise RuntimeError("tool-model down")
+                await asyncio.sleep(0.6)  # slower than the minimum hedge delay
+            return model
+
+    tools = [{"type": "function", "function": {"name": "wallet_balance"}}]
+    router = ModelRouter(FakeClient(), {"agent": "tool-model,text-model:no-tools"})
+    for _ in range(5):
+        router.stats("tool-model").record(True, 0.01)
+        router.stats("text-model").record(True, 0.001)
+
+    # Far faster, but it cannot take the tool definitions
+    assert [spec.name for spec in router.ranked("agent", tools=True)] == ["tool-model", "text-model"]
+    assert router.ranked("agent")[0].name == "text-model"
+
+    result = asyncio.run(router.complete("agent", [{"role": "user", "content": "hi"}], tools=tools))
+    assert result == "tool-model"
+    assert calls == [("tool-model", tools)], calls
+
+    # Still used as failover once the tool-capable model errors
+    calls.clear()
+    router.client = FakeClient(fail=True)
+    result = asyncio.run(router.complete("agent", [{"role": "user", "content": "hi"}], tools=tools))
+    assert result == "text-model"
+    assert calls == [("tool-model", tools), ("text-model", None)], calls
+
+    print("\n" + "="*60)
+    print("MODEL ROUTER TOOLS TEST")
+    print("="*60)
+    print("Ranking with tools:", [spec.name for spec in router.ranked("agent", tools=True)])
+
+def test_tool_cache_single_flight():
+    """Test tool result caching: coalescing, a cancelled leader and invalidation after writes (no server needed)"""
+    import asyncio
+    from tool_cache import ToolResultCache
+
+    address = "0xAbC0000000000000000000000000000000000001"
+    fetches = []
+
+    async def fetch():
+        fetches.append(1)
+        await asyncio.sleep(0.05)
+        return {"success": True, "result": {"balance": str(len(fetches))}}
+
+    async def scenario():
+        cache = ToolResultCache(max_entries=8)
+        params = {"address": address}
+
+        # Concurrent identical calls share one fetch
+        results = await asyncio.gather(*[cache.get_or_fetch("get_balance", params, 10, fetch) for _ in range(5)])
+        assert len(fetches) == 1 and all(r["result"]["balance"] == "1" for r in results)
+        assert cache.stats()["coalesced"] == 4
+
+        # Served from the cache until a write to that address invalidates it
+        await cache.get_or_fetch("get_balance", {"address": address.lower()}, 10, fetch)
+        assert len(fetches) == 1 and cache.hits == 1
+        await cache.invalidate_addresses([address])
+        result = await cache.get_or_fetch("get_balance", params, 10, fetch)
+        assert len(fetches) == 2 and result["result"]["balance"] == "2"
+
+        # A fetch that overlaps an invalidation is returned but not stored
+        pending = asyncio.create_task(cache.get_or_fetch("get_balance", {"address": "0x2"}, 10, fetch))
+        await asyncio.sleep(0.01)
+        await cache.invalidate_all_addresses()
+        await pending
+        await cache.get_or_fetch("get_balance", {"address": "0x2"}, 10, fetch)
+        assert len(fetches) == 4
+
+        # Cancelling the caller that started a fetch doesn't fail the ones that joined it
+        leader = asyncio.create_task(cache.get_or_fetch("get_balance", {"address": "0x3"}, 10, fetch))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(cache.get_or_fetch("get_balance", {"address": "0x3"}, 10, fetch))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        result = await follower
+        assert result["success"] and len(fetches) == 5
+        return cache.stats()
+
+    stats = asyncio.run(scenario())
+
+    print("\n" + "="*60)
+    print("TOOL CACHE TEST")
+    print("="*60)
+    print("Cache stats:", stats)
+
+def test_context_token_budget():
+    """Test that the agent context compacts before digesting and keeps the latest turn (no server needed)"""
+    from context_budget import ConversationContext, ToolTurn
+
+    def turn(index: int) -> ToolTurn:
+        call_id = f"call_{index}"
+        assistant = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": call_id, "type": "function", "function": {"name": "get_balance", "arguments": "{}"}}]
+        }
+        result = {"success": True, "result": {"balance": str(index), "history": ["0x" + "ab" * 20] * 30}}
+        return ToolTurn(assistant, [(call_id, "get_balance", result)], hint=f"Now execute step {index + 1}.")
+
+    def build(budget: int):
+        context = ConversationContext("system prompt", "check my balances", token_budget=budget, recent_turns=2)
+        for index in range(4):
+            context.add_turn(turn(index))
+        messages = context.messages()
+        return context, messages
+
+    def newest(messages):
+        """The latest turn's tool result and the message after it"""
+        index = next(i for i, m in enumerate(messages) if m.get("tool_call_id") == "call_3")
+        return messages[index]["content"], messages[index + 1]["content"]
+
+    # Roomy budget: older turns compacted, the two recent ones verbatim; every turn keeps its hint
+    context, messages = build(10000)
+    tool_messages = [m for m in messages if m["role"] == "tool"]
+    assert len(tool_messages) == 4
+    assert "history" in tool_messages[-1]["content"] and "30 items" in tool_messages[0]["content"]
+    assert sum(1 for m in messages if (m["content"] or "").startswith("Now execute step")) == 4
+    assert context.last_prompt_tokens <= 10000
+
+    # Tight budget: the earlier recent turn is compacted too, nothing is digested
+    context, messages = build(600)
+    assert context.last_prompt_tokens <= 600, context.last_prompt_tokens
+    tool_messages = [m for m in messages if m["role"] == "tool"]
+    assert len(tool_messages) == 4 and "30 items" in tool_messages[2]["content"]
+    assert not any("compacted" in (m["content"] or "") for m in messages if m["role"] == "system")
+
+    # Over budget: older turns become the digest, the latest turn keeps its data and hint
+    context, messages = build(50)
+    digest = [m for m in messages if m["role"] == "system" and "compacted" in (m["content"] or "")]
+    assert len(digest) == 1 and digest[0]["content"].count("- get_balance") == 3
+    assert [m["tool_call_id"] for m in messages if m["role"] == "tool"] == ["call_3"]
+    result, hint = newest(messages)
+    assert "0x" + "ab" * 20 in result and '"balance": "3"' in result
+    assert hint == "Now execute step 4."
+
+    # The response history is never compacted
+    assert len([m for m in context.history() if m["role"] == "tool"]) == 4
+
+    print("\n" + "="*60)
+    print("CONTEXT BUDGET TEST")
+    print("="*60)
+    print("Prompt tokens at budget 600:", build(600)[0].last_prompt_tokens)
+
+def test_plan_cache_replay():
+    """Test learning a tool plan, replaying it with new values and rejecting mismatches (no server needed)"""
+    import asyncio
+    from main import AgentRequest, ToolConnection, build_replay, plan_context_values, describe_tool_results
+    from plan_cache import PlanCache, message_template
+
+    token_a = "0x" + "a" * 40
+    token_b = "0x" + "b" * 40
+    token_c = "0x" + "c" * 40
+
+    def swap_turns(token_in: str, token_out: str, amount: str, slippage: float):
+        return [[("swap", {"tokenIn": token_in, "tokenOut": token_out, "amountIn": amount, "slippageTolerance": slippage})]]
+
+    def request(message: str) -> AgentRequest:
+        return AgentRequest(tools=[ToolConnection(tool="swap")], user_message=message, private_key="0xkey")
+
+    async def scenario():
+        cache = PlanCache(max_entries=8)
+        first = f"Swap 1.5 of {token_a} for {token_b} with 0.5 slippage"
+        template, slots = message_template(first)
+        key = cache.make_key("swap-only", template, True, None)
+
+        entry = await cache.record(key, swap_turns(token_a, token_b, "1.5", 0.5), slots, ["swap"])
+        assert not entry.confident
+
+        # The same plan for other values makes it replayable
+        second = f"Swap 2 of {token_b} for {token_a} with 2.5 slippage"
+        assert message_template(second)[0] == template
+        entry = await cache.record(key, swap_turns(token_b, token_a, "2", 2.5), message_template(second)[1], ["swap"])
+        assert entry.confident
+
+        third = f"Swap 7.25 of {token_c} for {token_a} with 0.1 slippage"
+        replay = build_replay(request(third), (await cache.lookup(key)).turns, message_template(third)[1])
+        assert replay == [[("swap", {
+            "tokenIn": token_c, "tokenOut": token_a, "amountIn": "7.25", "slippageTolerance": 0.1, "privateKey": "0xkey"
+        })]], replay
+
+        # A different plan for the same key replaces the learned one and must be confirmed again
+        entry = await cache.record(key, swap_turns(token_b, token_a, "2", 2.5) * 2, message_template(second)[1], ["swap"])
+        assert not entry.confident and len(entry.turns) == 2
+
+        # Values that don't fit the recorded slot types don't replay
+        int_plan = [[("get_balance", {"address": token_a, "limit": 3})]]
+        int_message = f"Show 3 transfers of {token_a}"
+        int_key = cache.make_key("balance-only", message_template(int_message)[0], False, None)
+        entry = await cache.record(int_key, int_plan, message_template(int_message)[1])
+        mismatched = f"Show 3.5 transfers of {token_a}"
+        assert build_replay(request(mismatched), entry.turns, message_template(mismatched)[1]) is None
+
+        # Write calls carrying a value not taken from the message are never learned
+        derived = await cache.record("derived", swap_turns(token_a, token_b, "1.5", 3.0), slots, ["swap"])
+        assert derived is None and await cache.lookup("derived") is None
+
+        # Write calls filled from the request context (wallet, smart account node) are learned as references
+        wallet = "0x" + "d" * 40
+        smart_account = "0x" + "e" * 40
+        transfer_request = AgentRequest(
+            tools=[ToolConnection(tool="transfer")], user_message=f"Send 0.5 ETH to {token_a}",
+            user_wallet_address=wallet, smart_accounts={"node-7": smart_account}
+        )
+        transfer_template, transfer_slots = message_template(transfer_request.user_message)
+        transfer_turns = [[("transfer", {
+            "fromAddress": smart_account, "toAddress": token_a, "amount": "0.5", "tokenType": "ETH",
+            "userAddress": wallet, "nodeId": "node-7"
+        })]]
+        entry = await cache.record(
+            "transfer", transfer_turns, transfer_slots, ["transfer"], plan_context_values(transfer_request), transfer_template
+        )
+        assert entry is not None and entry.turns[0][0][1]["userAddress"] == {"$context": "user_wallet_address", "type": "str"}
+        assert entry.turns[0][0][1]["tokenType"] == "ETH"
+        transfer_request.user_message = f"Send 2 ETH to {token_b}"
+        replay = build_replay(transfer_request, entry.turns, message_template(transfer_request.user_message)[1])
+        assert replay == [[("transfer", {
+            "fromAddress": smart_account, "toAddress": token_b, "amount": "2", "tokenType": "ETH",
+            "userAddress": wallet, "nodeId": "node-7"
+        })]], replay
+
+        # Without the referenced context the plan doesn't replay
+        transfer_request.smart_accounts = None
+        assert build_replay(transfer_request, entry.turns, message_template(transfer_request.user_message)[1]) is None
+
+        # A replay's reply is built from what the tools returned, not from the learned run
+        answer = describe_tool_results(
+            [{"tool": "transfer"}, {"tool": "swap"}],
+            [{"success": True, "result": {"success": True, "result": {"amount": "2", "recipient": token_b}}},
+             {"success": False, "error": "insufficient liquidity"}]
+        )
+        assert f"amount: 2, recipient: {token_b}" in answer and "insufficient liquidity" in answer, answer
+        return len(cache)
+
+    entries = asyncio.run(scenario())
+
+    print("\n" + "="*60)
+    print("PLAN CACHE TEST")
+    print("="*60)
+    print("Learned plans:", entries)
+
+def test_circuit_breaker_states():
+    """Test breaker transitions: closed -> open -> half-open probe -> closed/open (no server needed)"""
+    from circuit_breaker import (
+        EndpointBreaker, CLOSED, OPEN, HALF_OPEN,
+        BREAKER_CONSECUTIVE_FAILURES, BREAKER_OPEN_SECONDS, ADAPTIVE_TIMEOUT_SAMPLES, ADAPTIVE_TIMEOUT_MIN
+    )
+
+    breaker = EndpointBreaker("/api/balance", max_timeout=30)
+    for _ in range(BREAKER_CONSECUTIVE_FAILURES - 1):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_success(0.1)
+    assert breaker.consecutive_failures == 0
+
+    # Consecutive failures open it and calls fail fast
+    for _ in range(BREAKER_CONSECUTIVE_FAILURES):
+        breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    assert 0 < breaker.retry_in() <= BREAKER_OPEN_SECONDS
+
+    # After the open period a single probe is let through
+    breaker.opened_at -= BREAKER_OPEN_SECONDS
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    assert not breaker.allow()
+
+    # A failed probe re-opens, a cancelled one frees the slot, a successful one closes
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    breaker.opened_at -= BREAKER_OPEN_SECONDS
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
+    breaker.record_success(0.1)
+    assert breaker.state == CLOSED and breaker.allow()
+
+    # The timeout follows observed latency once enough samples exist
+    assert breaker.timeout() == 30
+    for _ in range(ADAPTIVE_TIMEOUT_SAMPLES):
+        breaker.record_success(0.05)
+    assert breaker.timeout() == ADAPTIVE_TIMEOUT_MIN
+
+    print("\n" + "="*60)
+    print("CIRCUIT BREAKER TEST")
+    print("="*60)
+    print("Breaker:", breaker.snapshot())
+
+def test_retry_budget_and_hedging():
+    """Test retries of transient failures, the retry budget and hedged requests (no server needed)"""
+    import asyncio
+    from retry_policy import RetryPolicy, TOOL_RETRY_ATTEMPTS
+
+    def flaky(outcomes):
+        calls = []
+
+        async def call():
+            calls.append(1)
+            return dict(outcomes[min(len(calls), len(outcomes)) - 1])
+        return call, calls
+
+    transient = {"success": False, "error": "HTTP 503", "retryable": True}
+    permanent = {"success": False, "error": "HTTP 400", "retryable": False}
+    ok = {"success": True, "result": {"balance": "1"}}
+
+    async def scenario():
+        policy = RetryPolicy()
+
+        call, calls = flaky([transient, transient, ok])
+        assert (await policy.call("get_balance", call))["success"] and len(calls) == 3
+
+        call, calls = flaky([transient])
+        assert not (await policy.call("get_balance", call))["success"] and len(calls) == TOOL_RETRY_ATTEMPTS
+
+        call, calls = flaky([permanent, ok])
+        assert not (await policy.call("get_balance", call))["success"] and len(calls) == 1
+
+        # An empty budget allows no extra requests
+        policy.budget("fetch_price").tokens = 0
+        call, calls = flaky([transient, ok])
+        assert not (await policy.call("fetch_price", call))["success"] and len(calls) == 1
+
+        # A call still pending after hedge_after is duplicated and the first success wins
+        started = []
+
+        async def slow_then_fast():
+            started.append(1)
+            if len(started) == 1:
+                await asyncio.sleep(1)
+            return dict(ok, attempt=len(started))
+
+        result = await policy.call("wallet_analytics", slow_then_fast, hedge_after=0.05)
+        assert result["attempt"] == 2 and len(started) == 2
+
+        # ... unless the budget has nothing left for the hedge
+        started.clear()
+        policy.budget("wallet_analytics").tokens = 0
+        result = await policy.call("wallet_analytics", slow_then_fast, hedge_after=0.05)
+        assert result["attempt"] == 1 and len(started) == 1
+        return {tool: round(policy.budget(tool).tokens, 2) for tool in ("get_balance", "fetch_price", "wallet_analytics")}
+
+    budgets = asyncio.run(scenario())
+
+    print("\n" + "="*60)
+    print("RETRY POLICY TEST")
+    print("="*60)
+    print("Budget tokens left:", budgets)
+
+def test_admission_control():
+    """Test admission queueing, 429 rejections and the per-user cap (no server needed)"""
+    import asyncio
+    from fastapi import FastAPI
+    from admission import AdmissionController, AdmissionMiddleware, AdmissionRejected, user_key
+
+    async def scenario():
+        controller = AdmissionController(max_concurrency=2, user_concurrency=1, queue_size=2, user_queue_size=1, queue_timeout=5)
+
+        # The per-user cap queues a user's second request while another user gets in
+        await controller.acquire("/agent/workflow", "alice")
+        alice_second = asyncio.create_task(controller.acquire("/agent/workflow", "alice"))
+        await asyncio.sleep(0)
+        await controller.acquire("/agent/workflow", "bob")
+        assert controller.snapshot() == {"active": 2, "queued": 1, "users": 2}
+
+        # A user's share of the queue and the queue itself are bounded
+        try:
+            await controller.acquire("/agent/workflow", "alice")
+            raise AssertionError("expected user_queue_full")
+        except AdmissionRejected as e:
+            assert e.reason == "user_queue_full" and e.retry_after >= 1
+        carol = asyncio.create_task(controller.acquire("/agent/workflow", "carol"))
+        await asyncio.sleep(0)
+        try:
+            await controller.acquire("/agent/workflow", "dave")
+            raise AssertionError("expected queue_full")
+        except AdmissionRejected as e:
+            assert e.reason == "queue_full"
+
+        # Releasing alice's slot admits her queued request, not carol's (FIFO)
+        controller.release("/agent/workflow", "alice")
+        await alice_second
+        assert not carol.done()
+        controller.release("/agent/workflow", "bob")
+        await carol
+        assert controller.snapshot() == {"active": 2, "queued": 0, "users": 2}
+
+        # Waiting past the deadline is a timeout rejection
+        controller.queue_timeout = 0.05
+        try:
+            await controller.acquire("/agent/workflow", "erin")
+            raise AssertionError("expected timeout")
+        except AdmissionRejected as e:
+            assert e.reason == "timeout"
+
+    asyncio.run(scenario())
+
+    # Users are keyed by wallet, never by the unauthenticated user_id
+    wallet = "0xAbC0000000000000000000000000000000000001"
+    scope = {"client": ("10.0.0.7", 5000)}
+    assert user_key(json.dumps({"user_id": "u1", "user_wallet_address": wallet}).encode(), scope) == wallet.lower()
+    assert user_key(json.dumps({"user_id": "u2"}).encode(), scope) == "client:10.0.0.7"
+    # Rotating user_id from one client shares one cap; distinct wallets (as in load_test.py) don't
+    assert user_key(json.dumps({"user_id": "u3"}).encode(), scope) == user_key(json.dumps({"user_id": "u4"}).encode(), scope)
+    from load_test import chat_payload, workflow_payload
+    assert len({user_key(json.dumps(chat_payload(i)).encode(), scope) for i in range(10)}) == 10
+    assert len({user_key(json.dumps(workflow_payload(i)).encode(), scope) for i in range(10)}) == 10
+
+    # A full queue answers 429 with Retry-After before the route runs
+    app = FastAPI()
+    calls = []
+
+    @app.post("/work")
+    async def work():
+        calls.append(1)
+        return {"ok": True}
+
+    async def post(middleware: AdmissionMiddleware, body: bytes):
+        sent = []
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http", "method": "POST", "path": "/work", "app": app, "client": ("10.0.0.7", 5000),
+            "headers": [(b"content-type", b"application/json")], "query_string": b"", "root_path": ""
+        }
+        await middleware(scope, receive, send)
+        start = next(message for message in sent if message["type"] == "http.response.start")
+        body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+        return start["status"], dict(start["headers"]), json.loads(body)
+
+    async def post_while_busy():
+        controller = AdmissionController(max_concurrency=1, queue_size=0)
+        await controller.acquire("/work", "someone else")
+        return await post(AdmissionMiddleware(app, controller=controller), json.dumps({"user_wallet_address": wallet}).encode())
+
+    status, headers, payload = asyncio.run(post_while_busy())
+    assert status == 429 and int(headers[b"retry-after"]) >= 1 and not calls
+
+    print("\n" + "="*60)
+    print("ADMISSION CONTROL TEST")
+    print("="*60)
+    print("Rejected:", payload["detail"])
+
+def test_job_queue_takeover():
+    """Test job claiming, lease takeover and refusing to restart jobs that made write calls (no server needed)"""
+    import asyncio
+    import os
+    import tempfile
+    import job_queue
+    from job_queue import JobQueue, QUEUED, SUCCEEDED, FAILED, FINISHED
+    from main import job_replay_safe
+
+    ran = []
+
+    async def runner(payload, emit):
+        ran.append(payload["user_message"])
+        if payload["user_message"] == "fail":
+            raise RuntimeError("workflow failed")
+        await emit("tool_call_start", {"call_id": "c1", "tool": "get_balance", "parameters": {"address": "0x1"}})
+        await emit("tool_result", {"call_id": "c1", "result": {"success": True, "result": {"balance": "1"}}})
+        return {"agent_response": "done"}
+
+    async def scenario():
+        path = os.path.join(tempfile.mkdtemp(), "jobs.sqlite3")
+        stopped, survivor = JobQueue(path, workers=1), JobQueue(path, workers=2)
+
+        # A claimed job is leased to its worker
+        write_job = await stopped.submit("workflow", {"user_message": "send"})
+        claimed = await asyncio.to_thread(stopped.store.claim, stopped.owner)
+        assert claimed["id"] == write_job and claimed["status"] == QUEUED
+        assert await asyncio.to_thread(survivor.store.claim, survivor.owner) is None
+        progress = {"tool_calls": [{"tool": "transfer", "parameters": {}}], "results": [None]}
+        await asyncio.to_thread(stopped.store.save_progress, write_job, progress)
+
+        read_job = await stopped.submit("workflow", {"user_message": "check"})
+        await asyncio.to_thread(stopped.store.claim, stopped.owner)
+        progress = {"tool_calls": [{"tool": "get_balance", "parameters": {}}], "results": [None]}
+        await asyncio.to_thread(stopped.store.save_progress, read_job, progress)
+        failing_job = await stopped.submit("workflow", {"user_message": "fail"})
+
+        # The first worker stops renewing: let its leases lapse
+        lease_seconds = job_queue.JOB_LEASE_SECONDS
+        job_queue.JOB_LEASE_SECONDS = -1
+        try:
+            await asyncio.to_thread(stopped.store.renew, stopped.owner)
+        finally:
+            job_queue.JOB_LEASE_SECONDS = lease_seconds
+
+        survivor.start({"workflow": runner}, replay_safe=job_replay_safe)
+        try:
+            for _ in range(100):
+                jobs = [await survivor.get(job_id) for job_id in (write_job, read_job, failing_job)]
+                if all(job["status"] in FINISHED for job in jobs):
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            await survivor.stop()
+        return jobs
+
+    write, read, failing = asyncio.run(scenario())
+
+    # Taken over after a transfer: refused instead of sending it twice
+    assert write["status"] == FAILED and "state-changing" in write["error"] and "send" not in ran
+    # Taken over after read-only calls: restarted from scratch
+    assert read["status"] == SUCCEEDED and read["attempts"] == 2
+    assert [call["tool"] for call in read["progress"]["tool_calls"]] == ["get_balance"]
+    assert read["result"] == {"agent_response": "done"}
+    # A runner that raises is recorded as failed
+    assert failing["status"] == FAILED and failing["error"] == "workflow failed"
+
+    print("\n" + "="*60)
+    print("JOB QUEUE TEST")
+    print("="*60)
+    print("Job statuses:", [job["status"] for job in (write, read, failing)])
+
+def test_workflow_dag_conditions():
+    """Test DAG edge conditions, {{node.path}} templates and next_tool resolution (no server needed)"""
+    import asyncio
+    from main import ToolConnection
+    from workflow_dag import WorkflowDAG, WorkflowError, evaluate_condition
+
+    connections = [
+        ToolConnection(tool="get_balance", node_id="balance", next_tool="payout", condition="result.balance > 0",
+                       parameters={"address": "0x1"}),
+        ToolConnection(tool="get_balance", node_id="balance", next_tool="alert", condition="failure"),
+        ToolConnection(tool="airdrop", node_id="payout", next_tool="receipt",
+                       parameters={"recipients": "{{balance.result.holders}}", "amount": "{{balance.result.balance}} wei"}),
+        ToolConnection(tool="fetch_price", node_id="alert", next_tool="receipt", condition="always"),
+        ToolConnection(tool="wallet_analytics", node_id="receipt", parameters={"address": "{{payout.result.sender}}"}),
+        ToolConnection(tool="fetch_price", node_id="price", next_tool="bad", condition="result.price ~ 1"),
+        ToolConnection(tool="fetch_price", node_id="bad")
+    ]
+    dag = WorkflowDAG(connections[:5])
+    calls = []
+
+    async def execute(tool, parameters):
+        calls.append((tool, parameters))
+        if tool == "get_balance":
+            return {"success": True, "result": {"balance": 5, "holders": ["0xa", "0xb"]}}
+        if tool == "airdrop":
+            return {"success": True, "result": {"sender": "0xfeed"}}
+        return {"success": True, "result": {"price": 1}}
+
+    states = asyncio.run(dag.execute(execute))
+    assert states["payout"]["status"] == "completed"
+    # A lone template keeps the value's type, an embedded one is formatted
+    assert states["payout"]["parameters"] == {"recipients": ["0xa", "0xb"], "amount": "5 wei"}
+    assert states["alert"]["status"] == "skipped"
+    # A skipped predecessor skips its successors too
+    assert states["receipt"]["status"] == "skipped"
+    assert [tool for tool, _ in calls].count("wallet_analytics") == 0
+
+    # An unsupported condition fails its target node instead of the whole run
+    states = asyncio.run(WorkflowDAG(connections[5:]).execute(execute))
+    assert states["bad"]["status"] == "failed" and "Unsupported condition" in states["bad"]["output"]["error"]
+
+    assert evaluate_condition("result.symbol == 'ETH'", {"success": True, "result": {"symbol": "ETH"}})
+    assert not evaluate_condition("result.balance >= 1", {"success": True, "result": {"balance": "n/a"}})
+
+    # Cycles and a tool name shared by several nodes are rejected for execution only
+    loop = [ToolConnection(tool="get_balance", next_tool="transfer"), ToolConnection(tool="transfer", next_tool="get_balance")]
+    shared = [
+        ToolConnection(tool="erc4337", next_tool="get_balance"),
+        ToolConnection(tool="get_balance", node_id="before"),
+        ToolConnection(tool="get_balance", node_id="after")
+    ]
+    for graph in (loop, shared):
+        try:
+            WorkflowDAG(graph)
+            raise AssertionError("expected WorkflowError")
+        except WorkflowError:
+            pass
+        WorkflowDAG(graph, acyclic=False)
+    assert WorkflowDAG(shared, acyclic=False).tool_flow() == {"erc4337": ["get_balance"]}
+
+    print("\n" + "="*60)
+    print("WORKFLOW DAG TEST")
+    print("="*60)
+    print("Executed tools:", [tool for tool, _ in calls])
+
+def test_sessions_keyed_by_wallet():
+    """Test that sessions belong to the wallet only and restored fields are never echoed (no server needed)"""
+    import asyncio
+    from main import AgentRequest, SessionClearRequest, ToolConnection, clear_session, handle_chat_request, with_session_context
+
+    wallet = "0x" + "1" * 40
+    other_wallet = "0x" + "2" * 40
+    smart_account = "0x" + "3" * 40
+    plan = {"execution_steps": [{"step": 1, "description": "Transfer X ETH to undefined", "smart_account": smart_account}]}
+
+    def request(**fields) -> AgentRequest:
+        return AgentRequest(
+            tools=[ToolConnection(tool="transfer")], user_message=f"transfer 0.1 eth to 0x{'4' * 40}", **fields
+        )
+
+    async def scenario():
+        first = await handle_chat_request(request(user_wallet_address=wallet, execution_plan=plan, smart_accounts={"node-1": smart_account}))
+        assert first["execution_plan"] == plan
+
+        # The same wallet gets its plan back for the request, but not in the response
+        second = await handle_chat_request(request(user_wallet_address=wallet))
+        assert second["tool_calls"][0]["parameters"]["fromAddress"] == smart_account
+        assert second["execution_plan"] is None
+
+        # Naming the user's id (or a non-address) from another wallet restores nothing
+        for fields in ({"user_wallet_address": other_wallet, "user_id": wallet}, {"user_wallet_address": "alice"}):
+            restored = await with_session_context(request(**fields))
+            assert restored.execution_plan is None and restored.smart_accounts is None
+
+        await clear_session(SessionClearRequest(user_wallet_address=wallet))
+        restored = await with_session_context(request(user_wallet_address=wallet))
+        assert restored.execution_plan is None
+        return second
+
+    second = asyncio.run(scenario())
+
+    print("\n" + "="*60)
+    print("SESSION TEST")
+    print("="*60)
+    print("Restored transfer:", second["tool_calls"][0]["parameters"])
+
+def test_lifespan_and_lazy_stores():
+    """Test that importing main creates no files and the lifespan starts and stops the job workers (no server needed)"""
+    import os
+    import subprocess
+    import sys
+    import tempfile
+
+    directory = tempfile.mkdtemp()
+    script = (
+        "import asyncio, os, main\n"
+        "assert os.listdir('.') == [], os.listdir('.')\n"
+        "async def run():\n"
+        "    async with main.app.router.lifespan_context(main.app):\n"
+        "        assert main.job_queue._tasks\n"
+        "        await asyncio.sleep(0.2)\n"
+        "    assert not main.job_queue._tasks\n"
+        "asyncio.run(run())\n"
+        "print(sorted(os.listdir('.')))\n"
+    )
+    env = dict(
+        os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)), WORKERS="2", SHARED_STATE_DIR="shared",
+        JOB_STORE_PATH="jobs.sqlite3", CODE_CACHE_PATH="code_cache.sqlite3", PYTHONWARNINGS="error::DeprecationWarning"
+    )
+    completed = subprocess.run([sys.executable, "-c", script], cwd=directory, env=env, capture_output=True, text=True, timeout=60)
+    assert completed.returncode == 0, completed.stderr
+    # The job workers opened their store on startup
+    assert "jobs.sqlite3" in completed.stdout, completed.stdout
+
+    print("\n" + "="*60)
+    print("LIFESPAN TEST")
+    print("="*60)
+    print("Files after startup:", completed.stdout.strip())
+
 if __name__ == "__main__":
     print("NCP AI Agent Builder - Test Suite")
     print("Starting tests...")
@@ -156,6 +857,18 @@ if __name__ == "__main__":
         # Basic tests
         test_health()
         test_tools()
+        test_transfer_projection()
+        test_model_router_keeps_tools()
+        test_tool_cache_single_flight()
+        test_context_token_budget()
+        test_plan_cache_replay()
+        test_circuit_breaker_states()
+        test_retry_budget_and_hedging()
+        test_admission_control()
+        test_job_queue_takeover()
+        test_workflow_dag_conditions()
+        test_sessions_keyed_by_wallet()
+        test_lifespan_and_lazy_stores()
         
         # Agent interaction tests
         test_simple_agent()
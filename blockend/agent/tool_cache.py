@@ -0,0 +1,166 @@
+"""
+Result cache for read-only tools
+TTL + LRU bounded, collapses concurrent identical requests into one upstream
+call, and lets state-changing tools invalidate cached balances by address.
+In multi-worker mode the entries live in a shared SQLite table instead.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Awaitable, Iterable, Optional, Set, Tuple
+
+from shared_state import MULTI_WORKER, SharedTTLStore, shared_path
+from single_flight import SingleFlight
+
+TOOL_CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024"))
+TOOL_CACHE_DEFAULT_TTL = float(os.getenv("TOOL_CACHE_DEFAULT_TTL", "10"))
+
+
+class ToolResultCache:
+    """TTL/LRU cache with single-flight de-duplication
+
+    With a `shared` store, entries and invalidations are visible to every
+    worker process; single-flight still applies per process.
+    """
+
+    def __init__(self, max_entries: int = TOOL_CACHE_MAX_ENTRIES, shared: Optional[SharedTTLStore] = None):
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight = SingleFlight()
+        self._address_index: Dict[str, Set[str]] = {}
+        self._key_addresses: Dict[str, str] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def make_key(tool_name: str, parameters: Dict[str, Any]) -> str:
+        normalized = {
+            k: v.lower() if k == "address" and isinstance(v, str) else v
+            for k, v in parameters.items()
+        }
+        return f"{tool_name}:{json.dumps(normalized, sort_keys=True, default=str)}"
+
+    def _store(self, key: str, value: Dict[str, Any], ttl: float, address: str = None):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        if address:
+            self._address_index.setdefault(address, set()).add(key)
+            self._key_addresses[key] = address
+        while len(self._entries) > self.max_entries:
+            oldest, _ = self._entries.popitem(last=False)
+            self._unindex(oldest)
+
+    def _unindex(self, key: str):
+        address = self._key_addresses.pop(key, None)
+        if address:
+            keys = self._address_index.get(address)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._address_index[address]
+
+    def _lookup(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._unindex(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def get_or_fetch(
+        self,
+        tool_name: str,
+        parameters: Dict[str, Any],
+        ttl: float,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """Return a cached result or fetch it once for all concurrent callers
+
+        Only successful results are cached. A result fetched while an
+        invalidation happened is returned but not stored.
+        """
+        key = self.make_key(tool_name, parameters)
+        if self.shared is not None:
+            cached = await asyncio.to_thread(self.shared.get, key)
+        else:
+            cached = self._lookup(key)
+        if cached is not None:
+            self.hits += 1
+            return dict(cached)
+
+        if key in self._inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+        result = await self._inflight.do(key, lambda: self._fetch_and_store(key, parameters, ttl, fetch))
+        return dict(result)
+
+    async def _fetch_and_store(
+        self,
+        key: str,
+        parameters: Dict[str, Any],
+        ttl: float,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        if self.shared is not None:
+            generation = await asyncio.to_thread(self.shared.generation)
+        else:
+            generation = self._generation
+        result = await fetch()
+        address = parameters.get("address")
+        address = address.lower() if isinstance(address, str) else None
+        if result.get("success") and self.shared is not None:
+            await asyncio.to_thread(self.shared.put, key, result, ttl, address, generation)
+        elif result.get("success") and generation == self._generation:
+            self._store(key, result, ttl, address)
+        return result
+
+    async def invalidate_addresses(self, addresses: Iterable[str]):
+        """Drop cached results keyed by any of these addresses"""
+        if self.shared is not None:
+            tags = [address.lower() for address in addresses if isinstance(address, str)]
+            await asyncio.to_thread(self.shared.delete_tags, tags)
+            return
+        self._generation += 1
+        for address in addresses:
+            if not isinstance(address, str):
+                continue
+            for key in self._address_index.pop(address.lower(), set()):
+                self._entries.pop(key, None)
+                self._key_addresses.pop(key, None)
+
+    async def invalidate_all_addresses(self):
+        """Drop every address-keyed result (used when the signer is unknown)"""
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.delete_tagged)
+            return
+        self._generation += 1
+        for key in list(self._key_addresses):
+            self._entries.pop(key, None)
+        self._key_addresses.clear()
+        self._address_index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.shared) if self.shared is not None else len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0
+        }
+
+
+tool_cache = ToolResultCache(
+    shared=SharedTTLStore(shared_path("tool_cache.sqlite3"), "tool_results", TOOL_CACHE_MAX_ENTRIES) if MULTI_WORKER else None
+)
@@ -0,0 +1,64 @@
+"""
+Concurrent dispatch of the tool calls returned in one assistant turn
+Independent calls run in parallel under a concurrency bound; calls signed by
+the same account are kept in their original order.
+"""
+
+import asyncio
+import os
+from typing import List, Dict, Any, Tuple, Callable, Awaitable, Optional
+
+TOOL_CALL_CONCURRENCY = int(os.getenv("TOOL_CALL_CONCURRENCY", "4"))
+
+# Parameters that identify the signing account of a state-changing call
+SIGNER_FIELDS = ("privateKey", "fromAddress")
+
+ToolExecutor = Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+def ordering_key(parameters: Dict[str, Any]) -> Optional[str]:
+    """Return the signer lane a call must be serialized on, or None if independent"""
+    for field in SIGNER_FIELDS:
+        value = parameters.get(field)
+        if value:
+            return f"{field}:{str(value).lower()}"
+    return None
+
+
+async def dispatch_tool_calls(
+    calls: List[Tuple[str, Dict[str, Any]]],
+    execute: ToolExecutor,
+    max_concurrency: int = TOOL_CALL_CONCURRENCY
+) -> List[Dict[str, Any]]:
+    """Execute (tool_name, parameters) calls and return results in call order"""
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    results: List[Dict[str, Any]] = [None] * len(calls)
+
+    # Calls sharing a signer go on one lane; every other call gets its own
+    lanes: List[List[int]] = []
+    signer_lanes: Dict[str, List[int]] = {}
+    for index, (_, parameters) in enumerate(calls):
+        key = ordering_key(parameters)
+        if key is None:
+            lanes.append([index])
+        elif key in signer_lanes:
+            signer_lanes[key].append(index)
+        else:
+            signer_lanes[key] = [index]
+            lanes.append(signer_lanes[key])
+
+    async def run_lane(indices: List[int]):
+        for index in indices:
+            tool_name, parameters = calls[index]
+            async with semaphore:
+                try:
+                    results[index] = await execute(tool_name, parameters)
+                except Exception as e:
+                    results[index] = {
+                        "success": False,
+                        "tool": tool_name,
+                        "error": f"Execution failed: {str(e)}"
+                    }
+
+    await asyncio.gather(*[run_lane(lane) for lane in lanes])
+    return results
@@ -0,0 +1,62 @@
+"""
+Declarative output projections for tool results
+A tool's `output_fields` in TOOL_DEFINITIONS lists the fields of its API
+payload worth keeping ("balance", "tokens[].symbol"); everything else is
+dropped before the result reaches the LLM or the client.
+"""
+
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple
+
+
+@lru_cache(maxsize=128)
+def compile_fields(fields: Tuple[str, ...]) -> Dict[str, Any]:
+    """Turn dotted field paths into a nested projection tree"""
+    tree: Dict[str, Any] = {}
+    for field in fields:
+        node = tree
+        for part in field.split("."):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def apply_projection(value: Any, tree: Dict[str, Any]) -> Any:
+    """Keep only the branches of `value` named in `tree` (`name[]` maps over a list)"""
+    if not tree or not isinstance(value, dict):
+        return value
+    projected = {}
+    for part, subtree in tree.items():
+        if part.endswith("[]"):
+            key = part[:-2]
+            if isinstance(value.get(key), list):
+                projected[key] = [apply_projection(item, subtree) for item in value[key]]
+        elif part in value:
+            projected[part] = apply_projection(value[part], subtree)
+    return projected
+
+
+def project_payload(payload: Any, fields: List[str]) -> Any:
+    """Project an API payload, looking inside a {"success", "result": {...}} envelope
+
+    A payload none of the fields match is returned unchanged, so an
+    unexpected response shape is never reduced to nothing.
+    """
+    tree = compile_fields(tuple(fields))
+    if isinstance(payload, dict) and isinstance(payload.get("result"), dict):
+        inner = apply_projection(payload["result"], tree)
+        if not inner:
+            return payload
+        envelope = {key: payload[key] for key in ("success", "error") if key in payload}
+        envelope["result"] = inner
+        return envelope
+    return apply_projection(payload, tree) or payload
+
+
+def project_result(result: Dict[str, Any], tool_def: Dict[str, Any]) -> Dict[str, Any]:
+    """Project a successful execute_tool result according to the tool's `output_fields`"""
+    fields = tool_def.get("output_fields") if tool_def else None
+    if not fields or not result.get("success") or "result" not in result:
+        return result
+    projected = {key: value for key, value in result.items() if key != "endpoint"}
+    projected["result"] = project_payload(result["result"], fields)
+    return projected
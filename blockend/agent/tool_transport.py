@@ -0,0 +1,75 @@
+"""
+Async HTTP transport for the Web3 tool APIs
+Keeps one keep-alive connection pool per tool endpoint so a slow route
+cannot exhaust the connections used by the others.
+"""
+
+import os
+from typing import Dict, Any, Optional
+
+import httpx
+
+# Defaults, overridable per tool with "timeout" / "pool" keys in TOOL_DEFINITIONS
+DEFAULT_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "30"))
+DEFAULT_CONNECT_TIMEOUT = float(os.getenv("TOOL_CONNECT_TIMEOUT", "5"))
+DEFAULT_MAX_CONNECTIONS = int(os.getenv("TOOL_POOL_MAX_CONNECTIONS", "20"))
+DEFAULT_MAX_KEEPALIVE = int(os.getenv("TOOL_POOL_MAX_KEEPALIVE", "10"))
+DEFAULT_KEEPALIVE_EXPIRY = float(os.getenv("TOOL_POOL_KEEPALIVE_EXPIRY", "30"))
+
+
+class ToolTransport:
+    """Shared async HTTP clients, one connection pool per tool endpoint"""
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def get_timeout(self, tool_def: Dict[str, Any]) -> float:
+        """Total request timeout in seconds for a tool"""
+        return float(tool_def.get("timeout", DEFAULT_TIMEOUT))
+
+    def _client_for(self, tool_def: Dict[str, Any]) -> httpx.AsyncClient:
+        pool_key = tool_def["name"]
+        client = self._clients.get(pool_key)
+        if client is None:
+            pool = tool_def.get("pool", {})
+            timeout = self.get_timeout(tool_def)
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(
+                    timeout,
+                    connect=min(DEFAULT_CONNECT_TIMEOUT, timeout)
+                ),
+                limits=httpx.Limits(
+                    max_connections=pool.get("max_connections", DEFAULT_MAX_CONNECTIONS),
+                    max_keepalive_connections=pool.get("max_keepalive", DEFAULT_MAX_KEEPALIVE),
+                    keepalive_expiry=DEFAULT_KEEPALIVE_EXPIRY
+                ),
+                headers={"Content-Type": "application/json"}
+            )
+            self._clients[pool_key] = client
+        return client
+
+    async def request(
+        self,
+        tool_def: Dict[str, Any],
+        method: str,
+        url: str,
+        params: Optional[Dict[str, Any]] = None,
+        json: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None
+    ) -> httpx.Response:
+        """Send a request through the tool's pool, optionally with a shorter total timeout"""
+        client = self._client_for(tool_def)
+        if timeout is None:
+            return await client.request(method, url, params=params, json=json)
+        request_timeout = httpx.Timeout(timeout, connect=min(DEFAULT_CONNECT_TIMEOUT, timeout))
+        return await client.request(method, url, params=params, json=json, timeout=request_timeout)
+
+    async def aclose(self):
+        """Close every pooled client"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+tool_transport = ToolTransport()
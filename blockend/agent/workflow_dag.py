@@ -0,0 +1,294 @@
+"""
+DAG execution engine for tool workflows
+Builds a graph from ToolConnection edges, schedules nodes topologically,
+runs independent branches in parallel, honors edge conditions and passes
+node outputs into downstream parameters via {{node.path}} templates.
+"""
+
+import asyncio
+import json
+import os
+import re
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple
+
+WORKFLOW_CONCURRENCY = int(os.getenv("WORKFLOW_CONCURRENCY", "8"))
+
+TEMPLATE_PATTERN = re.compile(r"\{\{\s*([A-Za-z0-9_\-]+(?:\.[A-Za-z0-9_\-]+)*)\s*\}\}")
+CONDITION_PATTERN = re.compile(r"^\s*([A-Za-z0-9_.\-]+)\s*(==|!=|>=|<=|>|<)\s*(.+?)\s*$")
+
+ToolExecutor = Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class WorkflowError(ValueError):
+    """Raised when a workflow graph is invalid"""
+
+
+class WorkflowNode:
+    def __init__(self, node_id: str, tool: str, parameters: Optional[Dict[str, Any]] = None):
+        self.node_id = node_id
+        self.tool = tool
+        self.parameters = dict(parameters or {})
+
+
+class WorkflowEdge:
+    def __init__(self, source: str, target: str, condition: Optional[str] = None):
+        self.source = source
+        self.target = target
+        self.condition = condition
+
+
+def resolve_path(data: Any, path: List[str]) -> Any:
+    """Walk dict keys / list indexes, returning None when the path is missing"""
+    for part in path:
+        if isinstance(data, dict):
+            data = data.get(part)
+        elif isinstance(data, list) and part.isdigit() and int(part) < len(data):
+            data = data[int(part)]
+        else:
+            return None
+    return data
+
+
+def evaluate_condition(condition: Optional[str], output: Dict[str, Any]) -> bool:
+    """Evaluate an edge condition against the source node's output
+
+    Supported forms: "success" (default), "failure", "always", or a comparison
+    such as "result.balance > 0" where the left side is a path into the output.
+    """
+    if not condition or condition.strip().lower() == "success":
+        return bool(output.get("success"))
+    keyword = condition.strip().lower()
+    if keyword in ("failure", "failed", "error"):
+        return not output.get("success")
+    if keyword == "always":
+        return True
+
+    match = CONDITION_PATTERN.match(condition)
+    if not match:
+        raise WorkflowError(f"Unsupported condition: {condition}")
+
+    path, operator, raw_expected = match.groups()
+    actual = resolve_path(output, path.split("."))
+    try:
+        expected = json.loads(raw_expected)
+    except ValueError:
+        expected = raw_expected.strip("'\"")
+
+    if operator in ("==", "!="):
+        equal = actual == expected or str(actual) == str(expected)
+        return equal if operator == "==" else not equal
+
+    try:
+        actual_num, expected_num = float(actual), float(expected)
+    except (TypeError, ValueError):
+        return False
+    if operator == ">":
+        return actual_num > expected_num
+    if operator == ">=":
+        return actual_num >= expected_num
+    if operator == "<":
+        return actual_num < expected_num
+    return actual_num <= expected_num
+
+
+def render_parameters(value: Any, outputs: Dict[str, Dict[str, Any]]) -> Any:
+    """Substitute {{node.path}} references with upstream node outputs"""
+    if isinstance(value, dict):
+        return {k: render_parameters(v, outputs) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render_parameters(v, outputs) for v in value]
+    if not isinstance(value, str) or "{{" not in value:
+        return value
+
+    def lookup(reference: str) -> Any:
+        node_id, *path = reference.split(".")
+        if node_id not in outputs:
+            raise WorkflowError(f"Template references unknown or unfinished node: {node_id}")
+        return resolve_path(outputs[node_id], path)
+
+    # A lone template keeps the referenced value's type (lists, numbers, ...)
+    whole = TEMPLATE_PATTERN.fullmatch(value.strip())
+    if whole:
+        return lookup(whole.group(1))
+    return TEMPLATE_PATTERN.sub(lambda m: str(lookup(m.group(1))), value)
+
+
+def describe_edge(source: str, target: str, condition: Optional[str], node_tools: Dict[str, str]) -> str:
+    """Human readable edge for prompts, e.g. bal_1 (get_balance) → airdrop [if success]"""
+    def label(node_id: str) -> str:
+        tool = node_tools[node_id]
+        return tool if node_id == tool else f"{node_id} ({tool})"
+
+    line = f"{label(source)} → {label(target)}"
+    if condition:
+        line += f" [if {condition}]"
+    return line
+
+
+class WorkflowDAG:
+    """Directed acyclic graph of tool nodes built from ToolConnection edges
+
+    A node is identified by its `node_id`, or by its tool name when no id is
+    given, so classic single-successor workflows keep working unchanged.
+    Several connections for the same node add several outgoing edges.
+    `next_tool` may name a node_id or a tool; a tool name resolves to the
+    node declared with that tool. Cycles and a tool name shared by several
+    nodes are only rejected with `acyclic` (needed to execute the graph); the
+    LLM path accepts loops and links an ambiguous tool name to all its nodes.
+    """
+
+    def __init__(self, connections: List[Any], acyclic: bool = True):
+        self.acyclic = acyclic
+        self.nodes: Dict[str, WorkflowNode] = {}
+        self.edges: List[WorkflowEdge] = []
+
+        for conn in connections:
+            node_id = getattr(conn, "node_id", None) or conn.tool
+            node = self.nodes.get(node_id)
+            if node is None:
+                self.nodes[node_id] = WorkflowNode(node_id, conn.tool, getattr(conn, "parameters", None))
+            else:
+                if node.tool != conn.tool:
+                    raise WorkflowError(f"Node {node_id} is declared with tools {node.tool} and {conn.tool}")
+                if getattr(conn, "parameters", None):
+                    node.parameters.update(conn.parameters)
+
+        for conn in connections:
+            if conn.next_tool:
+                source = getattr(conn, "node_id", None) or conn.tool
+                for target in self._resolve_targets(conn.next_tool):
+                    self.edges.append(WorkflowEdge(source, target, conn.condition))
+
+        self.incoming: Dict[str, List[WorkflowEdge]] = {node_id: [] for node_id in self.nodes}
+        self.outgoing: Dict[str, List[WorkflowEdge]] = {node_id: [] for node_id in self.nodes}
+        for edge in self.edges:
+            self.incoming[edge.target].append(edge)
+            self.outgoing[edge.source].append(edge)
+
+        self.order = self._topological_order() if acyclic else list(self.nodes)
+
+    def _resolve_targets(self, next_tool: str) -> List[str]:
+        """node_ids an edge points to: a declared node_id, else the node(s) running that tool"""
+        if next_tool in self.nodes:
+            return [next_tool]
+        candidates = [node.node_id for node in self.nodes.values() if node.tool == next_tool]
+        if len(candidates) > 1 and self.acyclic:
+            raise WorkflowError(
+                f"next_tool {next_tool} is ambiguous between nodes {', '.join(candidates)}; use a node_id"
+            )
+        if candidates:
+            # Without execution a tool-level edge is enough: link every node of that tool
+            return candidates
+        # A tool that is only referenced as a successor becomes its own node
+        self.nodes[next_tool] = WorkflowNode(next_tool, next_tool)
+        return [next_tool]
+
+    def _topological_order(self) -> List[str]:
+        remaining = {node_id: len(edges) for node_id, edges in self.incoming.items()}
+        ready = [node_id for node_id in self.nodes if remaining[node_id] == 0]
+        order = []
+        while ready:
+            node_id = ready.pop(0)
+            order.append(node_id)
+            for edge in self.outgoing[node_id]:
+                remaining[edge.target] -= 1
+                if remaining[edge.target] == 0:
+                    ready.append(edge.target)
+        if len(order) != len(self.nodes):
+            cyclic = [node_id for node_id in self.nodes if node_id not in order]
+            raise WorkflowError(f"Workflow contains a cycle involving: {', '.join(cyclic)}")
+        return order
+
+    def tool_names(self) -> List[str]:
+        """Distinct tools in first-declared order"""
+        return list(dict.fromkeys(node.tool for node in self.nodes.values()))
+
+    def tool_flow(self) -> Dict[str, List[str]]:
+        """Map each tool to every tool that follows it"""
+        flow: Dict[str, List[str]] = {}
+        for edge in self.edges:
+            successors = flow.setdefault(self.nodes[edge.source].tool, [])
+            target_tool = self.nodes[edge.target].tool
+            if target_tool not in successors:
+                successors.append(target_tool)
+        return flow
+
+    def canonical_key(self) -> Tuple[Tuple[Tuple[str, str], ...], Tuple[Tuple[str, str, str], ...]]:
+        """Hashable, declaration-order independent shape of the graph
+
+        Node parameters are excluded, so workflows that differ only in
+        addresses or amounts share one key.
+        """
+        nodes = tuple(sorted((node.node_id, node.tool) for node in self.nodes.values()))
+        edges = tuple(sorted((edge.source, edge.target, edge.condition or "") for edge in self.edges))
+        return nodes, edges
+
+    async def execute(
+        self,
+        execute: ToolExecutor,
+        prepare: Optional[Callable[[WorkflowNode, Dict[str, Any]], Dict[str, Any]]] = None,
+        max_concurrency: int = WORKFLOW_CONCURRENCY
+    ) -> Dict[str, Dict[str, Any]]:
+        """Run the graph and return {node_id: {"status", "tool", "parameters", "output"}}
+
+        A node runs once all of its predecessors have settled and every incoming
+        edge condition holds; otherwise it is skipped along with its subtree.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        outputs: Dict[str, Dict[str, Any]] = {}
+        states: Dict[str, Dict[str, Any]] = {}
+        pending = {node_id: len(edges) for node_id, edges in self.incoming.items()}
+        running: Dict[asyncio.Task, str] = {}
+
+        async def run_node(node: WorkflowNode) -> Dict[str, Any]:
+            parameters = render_parameters(node.parameters, outputs)
+            if prepare:
+                parameters = prepare(node, parameters)
+            states[node.node_id]["parameters"] = parameters
+            async with semaphore:
+                return await execute(node.tool, parameters)
+
+        def settle(node_id: str, status: str, output: Optional[Dict[str, Any]] = None):
+            states.setdefault(node_id, {"tool": self.nodes[node_id].tool, "parameters": {}})
+            states[node_id]["status"] = status
+            states[node_id]["output"] = output
+            if output is not None:
+                outputs[node_id] = output
+            for edge in self.outgoing[node_id]:
+                pending[edge.target] -= 1
+                if pending[edge.target] == 0:
+                    schedule(edge.target)
+
+        def schedule(node_id: str):
+            edges = self.incoming[node_id]
+            try:
+                active = all(
+                    states[edge.source]["status"] == "completed"
+                    and evaluate_condition(edge.condition, outputs[edge.source])
+                    for edge in edges
+                )
+            except WorkflowError as e:
+                settle(node_id, "failed", {"success": False, "tool": self.nodes[node_id].tool, "error": str(e)})
+                return
+            if not active:
+                settle(node_id, "skipped")
+                return
+            states[node_id] = {"tool": self.nodes[node_id].tool, "parameters": {}, "status": "running"}
+            task = asyncio.create_task(run_node(self.nodes[node_id]))
+            running[task] = node_id
+
+        for node_id in self.order:
+            if pending[node_id] == 0 and not self.incoming[node_id]:
+                schedule(node_id)
+
+        while running:
+            done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                node_id = running.pop(task)
+                try:
+                    output = task.result()
+                except Exception as e:
+                    output = {"success": False, "tool": self.nodes[node_id].tool, "error": f"Execution failed: {str(e)}"}
+                settle(node_id, "completed", output)
+
+        return {node_id: states[node_id] for node_id in self.order}